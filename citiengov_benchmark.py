@@ -0,0 +1,399 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import py_compile
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import citiengov_export_gml as ceg
+
+
+# namespaces of the Geoserver export
+CEG_NS = 'http://maps.dedagroup.it/energy/geoserver/CitiEnGov_01_1'
+GML_NS = 'http://www.opengis.net/gml'
+
+# values the translators have codelists for
+USES = ['ausiliario', 'negozio', 'residenziale', 'magazzino', 'laboratorio']
+PREDOMINANT_USES = ['residenziale', 'school', 'commercio', 'ausiliario']
+PERF_CLASSES = ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+
+# loading the CitiEnGov parses the gml and groups its features by UUID, iterating on it creates the buildings
+STAGES = ['parse', 'group', 'build', 'translate', 'write']
+# stages of the Profiler of the CitiEnGov -> stages of the benchmark
+PROFILER_STAGES = {'load': 'parse', 'group': 'group'}
+
+# modules the export script imports only when they are used
+DEFERRED_MODULES = ['numpy', 'zstandard', 'urllib.request', 'http.client', 'sqlite3', 'concurrent.futures',
+                    'tempfile', 'hashlib', 'lxml']
+# commands of the startup benchmark, the interpreter alone is the baseline of the others
+STARTUP_COMMANDS = {
+    'interpreter': ['-c', 'pass'],
+    'import': ['-c', 'import citiengov_export_gml'],
+    'version': ['-m', 'citiengov_export_gml', '--version'],
+    'help': ['-m', 'citiengov_export_gml', '--help']
+}
+
+
+def generate_citiengov(target_path, buildings=1000, rows=4, vertices=8, seed=0):
+    """
+    write a synthetic CitiEnGov gml (GML_BUILDINGS_CEG feature collection) like the ones exported from Geoserver
+
+    Every building has rows features which only differ in the yearly energy values: electricity for every row,
+    thermal for the first half of them. The features are sorted by UUID.
+
+    :param target_path: path of the gml to write
+    :param buildings: number of buildings (UUIDs)
+    :param rows: number of features per building
+    :param vertices: number of vertices of the footprint polygons
+    :param seed: seed of the random values
+    """
+    rnd = random.Random(seed)
+    with open(target_path, 'w', encoding='utf-8') as gml:
+        gml.write('<?xml version="1.0" encoding="UTF-8"?>'
+                  '<wfs:FeatureCollection xmlns="http://www.opengis.net/wfs" xmlns:wfs="http://www.opengis.net/wfs" '
+                  'xmlns:CitiEnGov_01_1="{ceg}" xmlns:gml="{gml}">'.format(ceg=CEG_NS, gml=GML_NS))
+        fid = 0
+        for number in range(buildings):
+            uuid = '{{{n:08x}-{a:04x}-4{b:03x}-8{c:03x}-{d:012x}}}'.format(
+                n=number, a=rnd.getrandbits(16), b=rnd.getrandbits(12), c=rnd.getrandbits(12), d=rnd.getrandbits(48))
+            attributes = _building_attributes(rnd, number, vertices)
+            first_year = rnd.randint(2005, 2012)
+            for row in range(rows):
+                energy = [
+                    ('ENERGYAMOUNT_E_SOURCE_E', 'Electricity'),
+                    ('ENERGYAMOUNT_E_YEAR_ONLY_E', str(first_year + row)),
+                    ('CONSUMONORM_UOM_E', 'kWh/m3'),
+                    ('CONSUMONORM_VALORE_E', '{v:.1f}'.format(v=rnd.uniform(0.1, 5)))
+                ]
+                if row < (rows + 1) // 2:
+                    energy += [
+                        ('ENERGYAMOUNT_E_SOURCE_T', 'Thermal'),
+                        ('ENERGYAMOUNT_E_YEAR_ONLY_T', str(first_year + row)),
+                        ('CONSUMONORM_UOM_T', 'kWh/m3'),
+                        ('CONSUMONORM_VALORE_T', '{v:.1f}'.format(v=rnd.uniform(0.1, 5)))
+                    ]
+                gml.write('<gml:featureMember><CitiEnGov_01_1:GML_BUILDINGS_CEG fid="GML_BUILDINGS_CEG.{f}">'
+                          '<CitiEnGov_01_1:UUID>{u}</CitiEnGov_01_1:UUID>'.format(f=fid, u=uuid))
+                gml.write(''.join('<CitiEnGov_01_1:{a}>{v}</CitiEnGov_01_1:{a}>'.format(a=attribute, v=value)
+                                  for attribute, value in attributes + energy))
+                gml.write('</CitiEnGov_01_1:GML_BUILDINGS_CEG></gml:featureMember>')
+                fid += 1
+        gml.write('</wfs:FeatureCollection>')
+
+
+def _building_attributes(rnd, number, vertices):
+    # footprint: a star shaped ring around a random center
+    x, y = rnd.uniform(1700000, 1712000), rnd.uniform(4960000, 4972000)
+    angles = sorted(rnd.uniform(0, 2 * math.pi) for i in range(vertices))
+    ring = ['{x:.3f},{y:.8f}'.format(x=x + r * math.cos(a), y=y + r * math.sin(a))
+            for a, r in ((a, rnd.uniform(5, 30)) for a in angles)]
+    ring.append(ring[0])
+    geometry = ('<gml:Polygon srsName="http://www.opengis.net/gml/srs/epsg.xml#3003"><gml:outerBoundaryIs>'
+                '<gml:LinearRing><gml:coordinates decimal="." cs="," ts=" ">{c}</gml:coordinates>'
+                '</gml:LinearRing></gml:outerBoundaryIs></gml:Polygon>').format(c=' '.join(ring))
+
+    uses = rnd.sample(USES, rnd.randint(1, 3))
+    cuts = sorted(rnd.sample(range(1, 100), len(uses) - 1))
+    percentages = [b - a for a, b in zip([0] + cuts, cuts + [100])]
+    floors = rnd.randint(1, 8)
+    height = floors * 3.0
+    attributes = [
+        ('NAME', 'EDIFICIO {n}'.format(n=number)),
+        ('LIFESPAN_BEGINNING', '2016'),
+        ('CONDITION', 'Functional'),
+        ('DATE_C_BEGINNING', str(rnd.randint(1850, 2015))),
+        ('EXT_REF_IDENTIFIER', 'http://www.agenziaentrate.gov.it'),
+        ('EXT_REF_INF_SYS_NAME', 'CATASTO ITALIANO - AGENZIA DEL TERRITORIO'),
+        ('EXT_REF_REFERENCE', 'D548- -{a:04d}-{b:05d}'.format(a=rnd.randint(1, 9999), b=number % 100000)),
+        ('HEIGHT_HEIGHT_VAL', '{h:.1f}'.format(h=height)),
+        ('HEIGHT_HEIGHT_REF', 'generalRoof'),
+        ('HEIGHT_HEIGHT_STAT', 'stimata'),
+        ('IDENTIFIER_ID_LOC', str(100000 + number)),
+        ('IDENTIFIER_ID_NAME', 'www.comune.fe.it/aci'),
+        ('USE_M', ','.join('{u}({p}%)'.format(u=u, p=p) for u, p in zip(uses, percentages))),
+        ('USE_S', rnd.choice(PREDOMINANT_USES)),
+        ('UNITS', str(rnd.randint(1, 20))),
+        ('FLOORS', str(floors)),
+        ('H_FLOOR', '3.0'),
+        ('ENERGYPERFORMANCE_PERF_CLASS', rnd.choice(PERF_CLASSES)),
+        ('ENERGYPERFORMANCE_PERF_METHOD', 'from SACE database'),
+        ('VOLUME_VALUE', '{v:.4f}'.format(v=rnd.uniform(200, 20000))),
+        ('ENERGYPERF_VOLUME_VALUE', '{v:.1f}'.format(v=rnd.uniform(200, 20000))),
+        ('SURFACE_VALUE', '{v:.1f}'.format(v=rnd.uniform(50, 5000))),
+        ('GEOMETRY2D', geometry)
+    ]
+    if rnd.random() < 0.25:
+        renovation = rnd.randint(1990, 2015)
+        attributes += [('DATE_R_BEGINNING', str(renovation)), ('DATE_R_END', str(renovation + 1))]
+    return attributes
+
+
+@contextlib.contextmanager
+def _stage(results, name, trace):
+    """
+    measure the wall time and (if traced) the peak memory of a stage, on python < 3.9 the peak cannot be reset and is
+    the one since the start of the run
+    """
+    if trace and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    yield
+    results[name] = {'seconds': time.perf_counter() - start}
+    if trace:
+        results[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+
+
+class _StageProfiler(ceg.Profiler):
+    def __init__(self, results, trace):
+        """
+        profiler measuring the stages of loading the CitiEnGov (parsing, grouping) like the stages of run_stages
+
+        :param results: dictionary of stage name -> measurements to add the stages to
+        :param trace: measure the peak memory of the stages with tracemalloc
+        """
+        super().__init__()
+        self.results = results
+        self.trace = trace
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        with _stage(self.results, PROFILER_STAGES.get(name, name), self.trace):
+            yield
+
+
+def run_stages(input_path, standard, trace=False, backend=None, output_path=None):
+    """
+    export the input to a standard stage by stage
+
+    :param input_path: path of the CitiEnGov gml
+    :param standard: name of the standard from STANDARDS
+    :param trace: measure the peak memory of the stages with tracemalloc (slows down the run)
+    :param backend: name of the xml backend parsing the input (default: lxml if it is installed)
+    :param output_path: where to keep the output (default: a temporary file)
+    :return: dictionary of stage name -> measurements
+    """
+    results = {}
+    if trace:
+        tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            citi_en_gov = ceg.CitiEnGov(input_path, backend=ceg.XMLBackend(backend or 'auto'),
+                                        profiler=_StageProfiler(results, trace))
+            # creating the buildings is measured as a whole, not building by building as a part of the grouping
+            citi_en_gov.profiler = None
+            with _stage(results, 'build', trace):
+                buildings = list(citi_en_gov)
+            translator = ceg.STANDARDS[standard]()
+            with _stage(results, 'translate', trace):
+                for bu in buildings:
+                    translator.root.append(translator.translate_building(bu))
+            with _stage(results, 'write', trace):
+                translator.write_to_file(output_path or os.path.join(directory, 'output.gml'))
+    finally:
+        if trace:
+            tracemalloc.stop()
+    results['buildings'] = len(buildings)
+    return results
+
+
+def benchmark(input_path, standards=('INSPIRE', 'CityGML'), memory=True):
+    """
+    measure the stages of the export of an input to each standard
+
+    The times come from an untraced run, the peak memory from a second run with tracemalloc.
+
+    :param input_path: path of the CitiEnGov gml
+    :param standards: names of the standards to export to
+    :param memory: measure the peak memory too
+    :return: dictionary of standard -> stage name -> measurements
+    """
+    report = {}
+    for standard in standards:
+        report[standard] = run_stages(input_path, standard)
+        if memory:
+            traced = run_stages(input_path, standard, trace=True)
+            for stage in STAGES:
+                report[standard][stage]['peak_bytes'] = traced[stage]['peak_bytes']
+    return report
+
+
+def print_report(report):
+    print('{std:<10} {stage:<12} {s:>10} {rate:>14} {mem:>12}'.format(
+        std='standard', stage='stage', s='seconds', rate='buildings/s', mem='peak MiB'))
+    for standard, results in report.items():
+        for stage in STAGES:
+            seconds = results[stage]['seconds']
+            peak = results[stage].get('peak_bytes')
+            print('{std:<10} {stage:<12} {s:>10.3f} {rate:>14.0f} {mem:>12}'.format(
+                std=standard, stage=stage, s=seconds, rate=results['buildings'] / seconds if seconds else 0,
+                mem='{m:.1f}'.format(m=peak / 2 ** 20) if peak is not None else '-'))
+
+
+def compare_backends(input_path, standards=('INSPIRE', 'CityGML')):
+    """
+    measure the stages of the export of an input with each xml backend that is installed and check that the
+    backends write the same outputs byte for byte (but the time stamp of the document)
+
+    :param input_path: path of the CitiEnGov gml
+    :param standards: names of the standards to export to
+    :return: dictionary of backend -> standard -> stage name -> measurements, and 'identical' -> standard -> bool
+    """
+    backends = ['etree'] + (['lxml'] if ceg.optional_import('lxml.etree') is not None else [])
+    report = {backend: {} for backend in backends}
+    report['identical'] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for standard in standards:
+            outputs = []
+            for backend in backends:
+                output_path = os.path.join(directory, '{b}_{s}.gml'.format(b=backend, s=standard))
+                report[backend][standard] = run_stages(input_path, standard, backend=backend, output_path=output_path)
+                with open(output_path, 'rb') as output_file:
+                    outputs.append(re.sub(rb'timeStamp="[^"]*"', b'', output_file.read()))
+            report['identical'][standard] = all(output == outputs[0] for output in outputs)
+    return report
+
+
+def print_backend_report(report):
+    """
+    :param report: measurements from compare_backends
+    :return: True if the backends wrote the same outputs
+    """
+    backends = [backend for backend in report if backend != 'identical']
+    print('{std:<10} {stage:<12}'.format(std='standard', stage='stage') +
+          ''.join(' {b:>10}'.format(b=backend + ' s') for backend in backends))
+    for standard, identical in report['identical'].items():
+        for stage in STAGES:
+            print('{std:<10} {stage:<12}'.format(std=standard, stage=stage) + ''.join(
+                ' {s:>10.3f}'.format(s=report[backend][standard][stage]['seconds']) for backend in backends))
+        print('{std:<10} {stage:<12}'.format(std=standard, stage='total') + ''.join(' {s:>10.3f}'.format(
+            s=sum(report[backend][standard][stage]['seconds'] for stage in STAGES)) for backend in backends))
+        print('{std:<10} output {same}'.format(std=standard, same='identical' if identical else 'DIFFERENT'))
+    if len(backends) < 2:
+        print('lxml is not installed, only the etree backend was measured')
+    return all(report['identical'].values())
+
+
+def startup(repeat=10):
+    """
+    measure the startup of the export script in new processes: importing it and the --version and --help fast paths,
+    and check that the deferred modules are not imported at startup
+
+    The script is compiled first, so that the bytecode is cached like after the first run of an installed script.
+
+    :param repeat: number of runs of each command
+    :return: dictionary of command -> best and median seconds, and the deferred modules imported at startup
+    """
+    py_compile.compile(ceg.__file__)
+    directory = os.path.dirname(os.path.abspath(ceg.__file__))
+    report = {}
+    for command, arguments in STARTUP_COMMANDS.items():
+        times = []
+        for run in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + arguments, cwd=directory, stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        report[command] = {'best_seconds': min(times), 'median_seconds': statistics.median(times)}
+    imported = subprocess.run([sys.executable, '-c', 'import sys, json, citiengov_export_gml; '
+                               'print(json.dumps(sorted(sys.modules)))'], cwd=directory, stdout=subprocess.PIPE,
+                              check=True).stdout
+    report['deferred_imported'] = [module for module in DEFERRED_MODULES if module in json.loads(imported)]
+    return report
+
+
+def print_startup_report(report, budget):
+    """
+    :param report: measurements from startup
+    :param budget: seconds the commands may take on top of the interpreter
+    :return: True if the startup is within the budget and no deferred module is imported
+    """
+    baseline = report['interpreter']['best_seconds']
+    within = not report['deferred_imported']
+    print('{command:<12} {best:>10} {median:>10} {over:>10}'.format(
+        command='command', best='best s', median='median s', over='overhead'))
+    for command in STARTUP_COMMANDS:
+        overhead = report[command]['best_seconds'] - baseline
+        exceeded = command != 'interpreter' and overhead > budget
+        within = within and not exceeded
+        print('{command:<12} {best:>10.3f} {median:>10.3f} {over:>10.3f}{flag}'.format(
+            command=command, best=report[command]['best_seconds'], median=report[command]['median_seconds'],
+            over=overhead, flag=' over the budget of {b:.3f} s'.format(b=budget) if exceeded else ''))
+    if report['deferred_imported']:
+        print('imported at startup: {m}'.format(m=', '.join(report['deferred_imported'])))
+    return within
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Generate synthetic CitiEnGov gml and benchmark the export')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help='write a synthetic CitiEnGov gml')
+    generate_parser.add_argument('output', help='path of the gml to write', type=str)
+
+    run_parser = commands.add_parser('run', help='measure the stages of the export')
+    run_parser.add_argument('-i', '--input', help='CitiEnGov gml to export instead of a generated one', type=str)
+    run_parser.add_argument('--standard', help='standard to export to (default: all)', action='append',
+                            choices=list(ceg.STANDARDS))
+    run_parser.add_argument('--no-memory', help='skip the traced run measuring the peak memory', action='store_true')
+    run_parser.add_argument('--json', help='write the measurements to a json file', type=str)
+
+    backends_parser = commands.add_parser('backends', help='compare the xml backends on the same input, exit status 1 '
+                                                           'if their outputs differ')
+    backends_parser.add_argument('-i', '--input', help='CitiEnGov gml to export instead of a generated one', type=str)
+    backends_parser.add_argument('--standard', help='standard to export to (default: all)', action='append',
+                                 choices=list(ceg.STANDARDS))
+    backends_parser.add_argument('--json', help='write the measurements to a json file', type=str)
+
+    startup_parser = commands.add_parser('startup', help='measure the startup of the export script against a budget')
+    startup_parser.add_argument('--repeat', help='number of runs of each command', type=int, default=10)
+    startup_parser.add_argument('--budget', help='seconds the startup may take on top of the interpreter '
+                                                 '(default: 0.05)', type=float, default=0.05)
+    startup_parser.add_argument('--json', help='write the measurements to a json file', type=str)
+
+    for command_parser in (generate_parser, run_parser, backends_parser):
+        command_parser.add_argument('-b', '--buildings', help='number of buildings', type=int, default=1000)
+        command_parser.add_argument('-r', '--rows', help='number of features per building', type=int, default=4)
+        command_parser.add_argument('-v', '--vertices', help='number of footprint vertices', type=int, default=8)
+        command_parser.add_argument('--seed', help='seed of the random values', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'startup':
+        startup_report = startup(repeat=args.repeat)
+        within_budget = print_startup_report(startup_report, args.budget)
+        if args.json:
+            with open(args.json, 'w') as report_file:
+                json.dump(startup_report, report_file, indent=2)
+        sys.exit(0 if within_budget else 1)
+    elif args.command == 'generate':
+        generate_citiengov(args.output, buildings=args.buildings, rows=args.rows, vertices=args.vertices,
+                           seed=args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = args.input
+            if input_path is None:
+                input_path = os.path.join(tmp, 'citiengov.gml')
+                generate_citiengov(input_path, buildings=args.buildings, rows=args.rows, vertices=args.vertices,
+                                   seed=args.seed)
+            if args.command == 'backends':
+                bench_report = compare_backends(input_path, standards=args.standard or list(ceg.STANDARDS))
+            else:
+                bench_report = benchmark(input_path, standards=args.standard or list(ceg.STANDARDS),
+                                         memory=not args.no_memory)
+        if args.command == 'backends':
+            identical_outputs = print_backend_report(bench_report)
+        else:
+            print_report(bench_report)
+        if args.json:
+            with open(args.json, 'w') as report_file:
+                json.dump(bench_report, report_file, indent=2)
+        if args.command == 'backends' and not identical_outputs:
+            sys.exit(1)
@@ -1,110 +1,2830 @@
+import re
+import io
+import os
+import sys
+import math
+import gzip
+import json
+import array
+import struct
+import marshal
+import time
+import threading
+import importlib
+import linecache
 import xml.etree.ElementTree as eT
 from datetime import datetime
+from abc import ABC, abstractmethod
 import argparse
-from urllib import request
+from collections import deque
+from contextlib import contextmanager, nullcontext, redirect_stdout
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+# the url stack (urllib, http.client), sqlite3, concurrent.futures, tempfile, hashlib, mmap and the optional
+# dependencies (numpy, zstandard, lxml) are imported where they are used, so that small runs and --version/--help
+# start fast
+
+__version__ = '1.0.0'
+
+# xml declaration written by ElementTree for utf-8 output
+XML_DECLARATION = "<?xml version='1.0' encoding='utf-8'?>\n"
+# namespace declarations in a start tag
+NAMESPACE_DECLARATION = re.compile(r' xmlns(:[^=]+)?="[^"]*"')
+# optional dependencies imported so far: name -> module or None if it is not installed
+_optional_modules = {}
+
+
+def optional_import(name):
+    """
+    import an optional dependency the first time it is needed
+
+    :param name: name of the module (e.g. 'numpy')
+    :return: the module, None if it is not installed
+    """
+    try:
+        return _optional_modules[name]
+    except KeyError:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            module = None
+        _optional_modules[name] = module
+        return module
+
+
+class CachedProperty:
+    def __init__(self, function):
+        """
+        attribute computed by a method the first time it is looked up on an instance, then kept on the instance
+        (functools.cached_property of python 3.8)
+
+        :param function: method computing the value
+        """
+        self.function = function
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.function(instance)
+        return value
+
+
+class NameSpaceSolver:
+    def __init__(self, namespace_dict):
+        """
+        initialize the solver instance
+
+        :param namespace_dict: dictionary that contains the prefixes and full uris as key-value pairs
+        """
+        self.dict = namespace_dict
+        # cache of the resolved tags: prefix:tag -> {full_uri}tag
+        self.tags = {}
+
+    def solve(self, full_tag):
+        """
+        convert element tags from prefix:tag to {full_uri}tag which is necessary for ElementTree
+
+        :param full_tag: tag to be resolved presented as prefix:tag
+        :return: resolved tag as {full_uri}tag
+        """
+        try:
+            return self.tags[full_tag]
+        except KeyError:
+            prefix, sep, tag = full_tag.rpartition(':')
+            resolved = self.tags[full_tag] = '{{{uri}}}{tag}'.format(uri=self.dict[prefix], tag=tag)
+            return resolved
+
+    def prepare(self, full_tags):
+        """
+        resolve a set of tags in advance
+
+        :param full_tags: iterable of tags presented as prefix:tag
+        """
+        for full_tag in full_tags:
+            self.solve(full_tag)
+
+
+class Profiler:
+    def __init__(self):
+        """
+        collect the wall time, cpu time and peak memory of the stages of an export
+        and the time spent in each attribute mapping of the standards
+        """
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.mappings = {}
+        self.counters = {}
+        # report of the Pipeline of the export, if any
+        self.pipeline = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        measure a block of code as (a part of) a stage
+
+        :param name: name of the stage, repeated measurements of the same stage are summed up
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_stage(self, name, wall, cpu):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}
+        stage['calls'] += 1
+        stage['wall_seconds'] += wall
+        stage['cpu_seconds'] += cpu
+        # peak memory of the process until the end of the stage
+        stage['peak_memory_bytes'] = peak_memory()
+
+    def add_mapping(self, standard, name, wall):
+        mapping = self.mappings.setdefault(standard, {}).get(name)
+        if mapping is None:
+            mapping = self.mappings[standard][name] = {'calls': 0, 'wall_seconds': 0.0}
+        mapping['calls'] += 1
+        mapping['wall_seconds'] += wall
+
+    def count(self, name, number=1):
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def report(self):
+        """
+        :return: the measurements as a json serializable dictionary, the mappings sorted by the time spent in them
+        """
+        wall = time.perf_counter() - self.started
+        buildings = self.counters.get('buildings', 0)
+        report = {
+            'wall_seconds': wall,
+            'cpu_seconds': time.process_time(),
+            'peak_memory_bytes': peak_memory(),
+            'buildings': buildings,
+            'buildings_per_second': buildings / wall if wall else None,
+            'counters': self.counters,
+            'stages': self.stages,
+            'mappings': {standard: dict(sorted(mappings.items(), key=lambda item: -item[1]['wall_seconds']))
+                         for standard, mappings in self.mappings.items()}
+        }
+        if self.pipeline is not None:
+            report['pipeline'] = self.pipeline
+        return report
+
+    def write(self, target_path):
+        print('Writing profile report to: {path}'.format(path=target_path))
+        with open(target_path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+def profile_stage(profiler, name):
+    """
+    :param profiler: Profiler instance or None
+    :param name: name of the stage
+    :return: context measuring the stage with the profiler if there is any
+    """
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+
+def peak_memory():
+    """
+    :return: peak resident memory of the process in bytes, None where it is not available
+    """
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _StageError:
+    # exception of a pipeline stage, passed on to the next stage in place of an item
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class _StageOutput:
+    def __init__(self, pipeline, name, items_queue):
+        """
+        iterator over the items a pipeline stage puts into its queue
+
+        :param pipeline: Pipeline instance
+        :param name: name of the stage
+        :param items_queue: bounded queue of the items of the stage
+        """
+        self.pipeline = pipeline
+        self.name = name
+        self.queue = items_queue
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.pipeline.stages[self.name]['consumer_waiting_seconds'] += time.perf_counter() - start
+        if item is self.pipeline.end:
+            # let the other consumers (none) and further calls see the end too
+            self.queue.put(item)
+            raise StopIteration
+        if isinstance(item, _StageError):
+            raise item.exception
+        return item
+
+
+class _BlockReader(io.RawIOBase):
+    def __init__(self, blocks):
+        """
+        binary file object reading from an iterator of blocks of bytes (the output of a reading stage)
+
+        :param blocks: iterator of bytes objects
+        """
+        super().__init__()
+        self.blocks = blocks
+        self.block = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.block:
+            try:
+                self.block = memoryview(next(self.blocks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+
+def read_blocks(source, block_size=1 << 18):
+    """
+    :param source: binary file object (or context of one), closed at the end
+    :param block_size: size of the blocks in bytes
+    :return: generator of the blocks of bytes of the source
+    """
+    with source as stream:
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+class Pipeline:
+    def __init__(self, queue_size=64):
+        """
+        stages of an export running at the same time, each in a thread of its own, linked by bounded queues: a stage
+        waits when the queue to the next stage is full, so that at most queue_size items are held between two stages
+
+        For every stage the items, the time spent waiting for the previous stage (starved) and for the next one
+        (blocked) and the depth of its output queue are counted, the bottleneck is the stage that is neither starved
+        nor blocked.
+
+        :param queue_size: number of items (blocks, buildings, translated buildings) a queue holds
+        """
+        import queue
+        self.queue_class = queue.Queue
+        self.full = queue.Full
+        self.queue_size = queue_size
+        self.stages = {}
+        # inputs of the stages: name -> name of the stage it reads from
+        self.inputs = {}
+        self.end = object()
+        self.stopped = threading.Event()
+
+    def add_stage(self, name, items):
+        statistics = self.stages[name] = {'items': 0, 'started': time.perf_counter(), 'wall_seconds': 0.0,
+                                          'blocked_seconds': 0.0, 'consumer_waiting_seconds': 0.0,
+                                          'queue_depth_sum': 0, 'queue_depth_max': 0}
+        if isinstance(items, _StageOutput):
+            self.inputs[name] = items.name
+        elif isinstance(items, _BlockReader) and isinstance(items.blocks, _StageOutput):
+            self.inputs[name] = items.blocks.name
+        return statistics
+
+    def stage(self, name, items):
+        """
+        iterate on the items in a new thread of the pipeline
+
+        :param name: name of the stage
+        :param items: iterable computing the items of the stage (e.g. a generator reading the output of another stage)
+        :return: iterator over the items in their order
+        """
+        items_queue = self.queue_class(self.queue_size)
+        statistics = self.add_stage(name, items)
+        thread = threading.Thread(target=self.run, args=(items, items_queue, statistics), name=name, daemon=True)
+        thread.start()
+        return _StageOutput(self, name, items_queue)
+
+    def run(self, items, items_queue, statistics):
+        try:
+            for item in items:
+                depth = items_queue.qsize()
+                statistics['queue_depth_sum'] += depth
+                statistics['queue_depth_max'] = max(statistics['queue_depth_max'], depth)
+                start = time.perf_counter()
+                if not self.put(items_queue, item):
+                    return
+                statistics['blocked_seconds'] += time.perf_counter() - start
+                statistics['items'] += 1
+            self.put(items_queue, self.end)
+        except Exception as exception:
+            self.put(items_queue, _StageError(exception))
+        finally:
+            statistics['wall_seconds'] = time.perf_counter() - statistics['started']
+            if hasattr(items, 'close'):
+                items.close()
+
+    def put(self, items_queue, item):
+        # wait for room in the queue unless the pipeline is stopped
+        while True:
+            try:
+                items_queue.put(item, timeout=0.1)
+                return True
+            except self.full:
+                if self.stopped.is_set():
+                    return False
+
+    def drain(self, name, items):
+        """
+        iterate on the items of the last stage in the calling thread, counted as a stage of the pipeline
+
+        :param name: name of the stage
+        :param items: output of the previous stage
+        :return: generator of the items
+        """
+        statistics = self.add_stage(name, items)
+        try:
+            for item in items:
+                yield item
+                statistics['items'] += 1
+        finally:
+            statistics['wall_seconds'] = time.perf_counter() - statistics['started']
+            self.stopped.set()
+
+    def reader(self, name, source, block_size=1 << 18):
+        """
+        read a source in a stage of the pipeline
+
+        :param name: name of the stage
+        :param source: binary file object (or context of one)
+        :param block_size: size of the blocks read at once in bytes
+        :return: binary file object reading the output of the stage
+        """
+        return _BlockReader(self.stage(name, read_blocks(source, block_size)))
+
+    def report(self):
+        """
+        :return: dictionary of stage name -> items, throughput, busy, starved and blocked seconds and the depth of the
+            output queue of the stage, in the order of the stages
+        """
+        report = {}
+        for name, statistics in self.stages.items():
+            wall = statistics['wall_seconds'] or time.perf_counter() - statistics['started']
+            starved = self.stages[self.inputs[name]]['consumer_waiting_seconds'] if name in self.inputs else 0.0
+            report[name] = {
+                'items': statistics['items'],
+                'items_per_second': statistics['items'] / wall if wall else None,
+                'wall_seconds': wall,
+                'busy_seconds': max(wall - starved - statistics['blocked_seconds'], 0.0),
+                'starved_seconds': starved,
+                'blocked_seconds': statistics['blocked_seconds'],
+                'queue_depth_mean': statistics['queue_depth_sum'] / statistics['items'] if statistics['items'] else 0,
+                'queue_depth_max': statistics['queue_depth_max']
+            }
+        return report
+
+    def print_report(self):
+        print('Pipeline stages (queues of {n} items):'.format(n=self.queue_size))
+        for name, stage in self.report().items():
+            print('  {name:<10} {items:>8} items {rate:>10.0f}/s  busy {busy:6.2f} s  starved {starved:6.2f} s  '
+                  'blocked {blocked:6.2f} s  queue {mean:5.1f} (max {max})'.format(
+                      name=name, items=stage['items'], rate=stage['items_per_second'] or 0, busy=stage['busy_seconds'],
+                      starved=stage['starved_seconds'], blocked=stage['blocked_seconds'],
+                      mean=stage['queue_depth_mean'], max=stage['queue_depth_max']))
+
+
+class WFSPager:
+    def __init__(self, url, page_size):
+        """
+        fetch the pages of a WFS layer with startIndex/count, each thread keeps its own http connection alive
+
+        :param url: url of the GetFeature request (paging parameters in it are replaced)
+        :param page_size: number of features per page
+        """
+        from urllib import parse
+        parts = parse.urlsplit(url)
+        self.url = url
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.path = parts.path or '/'
+        self.query = [(key, value) for key, value in parse.parse_qsl(parts.query, keep_blank_values=True)
+                      if key.lower() not in ('startindex', 'count', 'maxfeatures')]
+        self.page_size = page_size
+        self.local = threading.local()
+        self.connections = []
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            import http.client
+            if self.https:
+                connection = http.client.HTTPSConnection(self.host)
+            else:
+                connection = http.client.HTTPConnection(self.host)
+            self.local.connection = connection
+            self.connections.append(connection)
+        return connection
+
+    def fetch(self, start_index):
+        """
+        :param start_index: index of the first feature of the page
+        :return: the (decompressed) body of the page
+        """
+        import http.client
+        from urllib import parse, error
+        target = '{path}?{query}'.format(path=self.path, query=parse.urlencode(
+            self.query + [('startIndex', start_index), ('count', self.page_size)]))
+        try:
+            response = self.request(target)
+        except (http.client.HTTPException, ConnectionError):
+            # the server dropped the kept alive connection, try again on a new one
+            self.local.connection.close()
+            response = self.request(target)
+        body = response.read()
+        if response.status != 200:
+            raise error.HTTPError(self.url, response.status, response.reason, response.headers, None)
+        if response.getheader('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return body
+
+    def request(self, target):
+        connection = self.connection()
+        connection.request('GET', target, headers={'Accept-Encoding': 'gzip'})
+        return connection.getresponse()
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+@contextmanager
+def open_url(url):
+    """
+    open a url for reading, asking for gzip transfer encoding
+
+    :param url: url of the gml
+    :return: context of the (decompressed) binary stream of the response body
+    """
+    from urllib import request
+    with request.urlopen(request.Request(url, headers={'Accept-Encoding': 'gzip'})) as response:
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            with gzip.GzipFile(fileobj=response) as body:
+                yield body
+        else:
+            yield response
+
+
+class XMLBackend:
+    names = ('auto', 'lxml', 'etree')
+
+    def __init__(self, name='auto'):
+        """
+        parser of the CitiEnGov gml: lxml (faster C parser, compiled XPath) when it is installed, ElementTree otherwise
+
+        Both give elements of the ElementTree api. The translated documents are built and serialized with ElementTree
+        whatever the backend, so that the output is the same byte for byte.
+
+        :param name: 'lxml', 'etree' or 'auto' (lxml if it is installed)
+        """
+        if name not in self.names:
+            raise ValueError('XML backend can be either \'auto\', \'lxml\' or \'etree\'!')
+        self.lxml = optional_import('lxml.etree') if name != 'etree' else None
+        if name == 'lxml' and self.lxml is None:
+            raise ValueError('The lxml backend needs the lxml package.')
+        self.name = 'lxml' if self.lxml is not None else 'etree'
+        # errors of a malformed gml
+        self.errors = (eT.ParseError,) if self.lxml is None else (eT.ParseError, self.lxml.XMLSyntaxError)
+
+    def parse(self, source):
+        """
+        :param source: path or binary file object of the gml
+        :return: root element of the gml
+        """
+        if self.lxml is None:
+            return eT.parse(source).getroot()
+        # parsers cannot be shared by threads, comments are left out as the ElementTree parser does
+        parser = self.lxml.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+        return self.lxml.parse(source, parser).getroot()
+
+    def iterparse(self, source, tag):
+        """
+        parse a gml incrementally and yield the elements with a tag as soon as they are complete, they are taken off
+        the tree so that they are freed once the caller is done with them
+
+        :param source: binary file object of the gml
+        :param tag: tag of the elements (with the namespace uri)
+        :return: generator of the elements
+        """
+        if self.lxml is None:
+            context = eT.iterparse(source, events=('start', 'end'))
+            event, root = next(context)
+            for event, element in context:
+                if event == 'end' and element.tag == tag:
+                    root.remove(element)
+                    yield element
+        else:
+            # lxml reports only the elements with the tag, the others are not turned into python objects
+            for event, element in self.lxml.iterparse(source, events=('end',), tag=tag, remove_comments=True,
+                                                       remove_pis=True, huge_tree=True):
+                element.getparent().remove(element)
+                yield element
+
+    def element(self, tag):
+        """
+        :return: new element of the backend, to hold parsed elements
+        """
+        return eT.Element(tag) if self.lxml is None else self.lxml.Element(tag)
+
+    def finder(self, path, namespaces):
+        """
+        :param path: path of an element relative to the elements it is looked up in
+        :param namespaces: prefix -> uri of the prefixes in the path
+        :return: function of an element returning the first element at the path or None, a compiled XPath with lxml
+        """
+        if self.lxml is None:
+            return lambda element: element.find(path, namespaces=namespaces)
+        xpath = self.lxml.XPath(path, namespaces=namespaces)
+        return lambda element: next(iter(xpath(element)), None)
+
+
+class CitiEnGov:
+    def __init__(self, gml_path, input_mode='file', stream=False, profiler=None, page_size=None, page_workers=4,
+                 building_filter=None, pipeline=None, snapshot_path=None, backend=None):
+        """
+        load a CitiEnGov gml exported from Geoserver
+
+        :param gml_path: path or url of the CitiEnGov gml
+        :param input_mode: 'file' or 'url'
+        :param stream: if True the gml is parsed incrementally during iteration instead of loading the whole tree,
+            the features of a building have to be consecutive in the gml (export sorted by UUID)
+        :param profiler: Profiler instance to measure the loading and grouping of the features
+        :param page_size: in url mode fetch the WFS layer in pages of this many features
+        :param page_workers: number of pages fetched at the same time
+        :param building_filter: BuildingFilter selecting the buildings to iterate on, the loaded gml is indexed
+            (see build_index) and only the selected buildings are created, in stream mode they are checked one by one
+        :param pipeline: Pipeline to run the reading and the parsing (stream mode) or the grouping of the features in,
+            at the same time as the translation
+        :param snapshot_path: path of a Snapshot of the features of the buildings (file mode only), loaded instead of
+            parsing the gml if it belongs to the current file, otherwise written from the parsed gml
+        :param backend: XMLBackend parsing the gml (default: lxml if it is installed)
+        """
+        self.buildings = None
+        self.backend = backend or XMLBackend()
+        self.profiler = profiler
+        self.index = None
+        if input_mode not in ('file', 'url'):
+            raise ValueError('Mode should be either \'file\' or \'url\'.')
+
+        # Prepare namespace to translate for ElementTree
+        self.namespaces = {
+            'CitiEnGov_01_1': 'http://maps.dedagroup.it/energy/geoserver/CitiEnGov_01_1',
+            'gml': 'http://www.opengis.net/gml'
+        }
+
+        snapshot = None
+        loaded = False
+        if snapshot_path is not None:
+            if input_mode != 'file':
+                raise ValueError('Snapshots can be made of file inputs only.')
+            with profile_stage(self.profiler, 'load'):
+                snapshot = Snapshot(snapshot_path, gml_path)
+                loaded = snapshot.load()
+            if loaded:
+                print('Loading snapshot of {f_p}: {path}'.format(f_p=gml_path, path=snapshot_path))
+            else:
+                print('Snapshot missing or out of date, writing it: {path}'.format(path=snapshot_path))
+
+        self.stream = stream
+        if stream:
+            # buildings are read one by one from the source while iterating
+            self.root = None
+            self.feature_members = None
+            self.building_features = None
+            self.building_UUIDs = None
+            self.UUID_index = 0
+            self.UUID = None
+            self.building = None
+            if loaded:
+                self.buildings = (Building(uuid=uuid, feature_list=snapshot[uuid], namespaces=self.namespaces)
+                                  for uuid in snapshot)
+            else:
+                if input_mode == 'url' and page_size:
+                    print('Streaming URL in pages of {n}: {u}'.format(n=page_size, u=gml_path))
+                    # the pages are fetched in threads of their own already
+                    feature_members = self.page_feature_members(gml_path, page_size, page_workers)
+                else:
+                    if input_mode == 'file':
+                        print('Streaming file: {f_p}'.format(f_p=gml_path))
+                        source = open(gml_path, 'rb')
+                    else:
+                        print('Streaming URL: {u}'.format(u=gml_path))
+                        source = open_url(gml_path)
+                    if pipeline is not None:
+                        source = pipeline.reader('read', source)
+                    feature_members = self.parse_feature_members(source)
+                self.buildings = self.stream_buildings(feature_members)
+                if snapshot is not None:
+                    # the snapshot keeps all the buildings, so it is recorded before the filter
+                    self.buildings = snapshot.record(self.buildings)
+            if building_filter is not None:
+                self.buildings = (bu for bu in self.buildings if building_filter.matches(bu))
+            if pipeline is not None:
+                self.buildings = pipeline.stage('parse', self.buildings)
+            return
+
+        if loaded:
+            # the snapshot stands in for the grouped features, they are rebuilt building by building
+            self.root = None
+            self.feature_members = None
+            self.building_features = snapshot
+            self.building_UUIDs = list(snapshot)
+        else:
+            # Parse base xml with all data
+            with profile_stage(self.profiler, 'load'):
+                if input_mode == 'file':
+                    print('Opening file: {f_p}'.format(f_p=gml_path))
+                    self.root = self.backend.parse(gml_path)
+                elif page_size:
+                    print('Opening URL in pages of {n}: {u}'.format(n=page_size, u=gml_path))
+                    self.root = self.backend.element('{http://www.opengis.net/wfs}FeatureCollection')
+                    self.root.extend(self.page_feature_members(gml_path, page_size, page_workers))
+                else:
+                    with open_url(gml_path) as url_gml:
+                        print('Opening URL: {u}'.format(u=gml_path))
+                        self.root = self.backend.parse(url_gml)
+
+            with profile_stage(self.profiler, 'group'):
+                # Get all feature members
+                self.feature_members = self.root.findall('./gml:featureMember', namespaces=self.namespaces)
+
+                # group the feature members by UUID in one pass, keeping the order of first appearance
+                find_uuid = self.backend.finder('./CitiEnGov_01_1:GML_BUILDINGS_CEG/CitiEnGov_01_1:UUID',
+                                                self.namespaces)
+                self.building_features = {}
+                for feature in self.feature_members:
+                    uuid = find_uuid(feature).text
+                    self.building_features.setdefault(uuid, []).append(feature)
+                self.building_UUIDs = list(self.building_features)  # unique UUIDs
+
+            if snapshot is not None:
+                with profile_stage(self.profiler, 'snapshot'):
+                    for bu in snapshot.record(self.get_building(uuid) for uuid in self.building_UUIDs):
+                        pass
+
+        if building_filter is not None:
+            with profile_stage(self.profiler, 'index'):
+                self.index = self.build_index(sorted(set(BuildingIndex.fields) | set(building_filter.where)))
+                self.building_UUIDs = [self.index.uuids[position] for position in self.index.query(building_filter)]
+            print('Selected {n} of {total} buildings'.format(n=len(self.building_UUIDs), total=len(self.index.uuids)))
+
+        # initiate first building object
+        self.UUID_index = 0
+        self.UUID = self.building_UUIDs[self.UUID_index] if self.building_UUIDs else None
+        self.building = self.get_building(self.UUID) if self.building_UUIDs else None
+        if pipeline is not None:
+            self.buildings = pipeline.stage('group', (self.get_building(uuid) for uuid in self.building_UUIDs))
+
+    def build_index(self, fields=None):
+        """
+        index the buildings of the loaded gml by the bounding box of their footprint and the values of some attributes
+        (of their first feature that has them), reading the features without creating the buildings
+
+        :param fields: attributes to index (default: BuildingIndex.fields)
+        :return: BuildingIndex of the buildings
+        """
+        record_path = './CitiEnGov_01_1:GML_BUILDINGS_CEG/CitiEnGov_01_1:'
+        fields = fields or BuildingIndex.fields
+
+        def first(features, path):
+            for feature in features:
+                element = feature.find(record_path + path, namespaces=self.namespaces)
+                if element is not None:
+                    return element
+            return None
+
+        bboxes = []
+        values = {field: [] for field in fields}
+        for uuid in self.building_UUIDs:
+            features = self.building_features[uuid]
+            bboxes.append(footprint_bbox(first(features, GeometryStage.coordinates_path)))
+            for field in fields:
+                element = first(features, field)
+                values[field].append(element.text if element is not None else None)
+        return BuildingIndex(self.building_UUIDs, bboxes, values)
+
+    def parse_feature_members(self, source):
+        """
+        parse a gml incrementally and yield its feature members one by one
+
+        Feature members are detached from the root as soon as they are parsed, so they are freed once
+        the caller is done with them.
+
+        :param source: binary file object (or context of one) of the gml, closed when the parsing is finished
+        :return: generator of gml:featureMember elements
+        """
+        feature_member_tag = '{{{uri}}}featureMember'.format(uri=self.namespaces['gml'])
+        with source as gml:
+            yield from self.backend.iterparse(gml, feature_member_tag)
+
+    def page_feature_members(self, url, page_size, page_workers=4):
+        """
+        fetch a WFS layer page by page and yield its feature members in order
+
+        The next pages are fetched concurrently while a page is parsed, the paging stops at the first page
+        that has less than page_size features.
+
+        :param url: url of the GetFeature request
+        :param page_size: number of features per page
+        :param page_workers: number of pages fetched at the same time
+        :return: generator of gml:featureMember elements
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        pager = WFSPager(url, page_size)
+        try:
+            with ThreadPoolExecutor(max_workers=page_workers) as executor:
+                pages = deque(executor.submit(pager.fetch, page * page_size) for page in range(page_workers))
+                next_page = page_workers
+                while pages:
+                    features = 0
+                    for element in self.parse_feature_members(io.BytesIO(pages.popleft().result())):
+                        features += 1
+                        yield element
+                    if features < page_size:
+                        # last page, the pages after it are empty
+                        for page in pages:
+                            page.cancel()
+                        break
+                    pages.append(executor.submit(pager.fetch, next_page * page_size))
+                    next_page += 1
+        finally:
+            pager.close()
+
+    def stream_buildings(self, feature_members):
+        """
+        group the feature members into buildings as they come
+
+        :param feature_members: iterable of the gml:featureMember elements, the features of a building have to be
+            consecutive
+        :return: generator of Building instances in the order of the gml
+        """
+        find_uuid = self.backend.finder('./CitiEnGov_01_1:GML_BUILDINGS_CEG/CitiEnGov_01_1:UUID', self.namespaces)
+
+        uuid = None
+        feature_list = []
+        finished_UUIDs = set()
+        for element in feature_members:
+            feature_uuid = find_uuid(element).text
+            if feature_uuid != uuid:
+                if feature_list:
+                    finished_UUIDs.add(uuid)
+                    yield Building(uuid=uuid, feature_list=feature_list, namespaces=self.namespaces)
+                if feature_uuid in finished_UUIDs:
+                    raise ValueError('Features of building {u} are not consecutive, '
+                                     'stream mode needs the input sorted by UUID.'.format(u=feature_uuid))
+                uuid = feature_uuid
+                feature_list = []
+            feature_list.append(element)
+
+        if feature_list:
+            yield Building(uuid=uuid, feature_list=feature_list, namespaces=self.namespaces)
+
+    def get_building(self, uuid):
+        feature_list = self.building_features.get(uuid, [])
+        return Building(uuid=uuid, feature_list=feature_list, namespaces=self.namespaces)
+
+    # make the class iterable so that it yields tha actual Building instance
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.buildings is not None:
+            # parsing and grouping go together (or the buildings are grouped in a pipeline stage)
+            with profile_stage(self.profiler, 'load' if self.stream else 'group'):
+                self.building = next(self.buildings)
+            self.UUID = self.building.UUID
+            self.UUID_index += 1
+            return self.building
+        try:
+            self.UUID = self.building_UUIDs[self.UUID_index]
+            with profile_stage(self.profiler, 'group'):
+                self.building = self.get_building(self.UUID)
+            return self.building
+        except IndexError:
+            raise StopIteration
+        finally:
+            self.UUID_index += 1
+
+
+def _element_to_tuple(element):
+    # plain python form of an element that can be marshalled much faster than serializing it as xml
+    if len(element):
+        return element.tag, dict(element.attrib), element.text, [_element_to_tuple(child) for child in element]
+    return element.tag, dict(element.attrib), element.text
+
+
+def _tuple_to_element(element_tuple, parent=None):
+    if parent is None:
+        element = eT.Element(element_tuple[0], element_tuple[1])
+    else:
+        element = eT.SubElement(parent, element_tuple[0], element_tuple[1])
+    element.text = element_tuple[2]
+    if len(element_tuple) > 3:
+        for child in element_tuple[3]:
+            _tuple_to_element(child, element)
+    return element
+
+
+class Building:
+    def __init__(self, uuid, feature_list, namespaces):
+        self.UUID = uuid
+        self.feature_list = feature_list
+        self.namespaces = namespaces
+        # footprint bounding box (min x, min y, max x, max y) and area, set by the GeometryStage
+        self.bbox = None
+        self.footprint_area = None
+        # quarantine record of a processing stage the building failed (see stage_failure), it is not translated then
+        self.failure = None
+
+        # flatten the features once into attribute name -> list of elements, one element per feature
+        # in the order of the features, so that find is a dictionary lookup
+        self.attributes = {}
+        prefix = '{{{uri}}}'.format(uri=namespaces['CitiEnGov_01_1'])
+        for feature in feature_list:
+            record = feature.find('./CitiEnGov_01_1:GML_BUILDINGS_CEG', namespaces=namespaces)
+            if record is None:
+                continue
+            feature_attributes = {}
+            for element in record:
+                if element.tag.startswith(prefix):
+                    feature_attributes.setdefault(element.tag[len(prefix):], element)
+            for attribute, element in feature_attributes.items():
+                self.attributes.setdefault(attribute, []).append(element)
+
+    def to_bytes(self, version=marshal.version):
+        """
+        :param version: marshal version, 2 has no references between the objects so the same features give the same
+            bytes whatever the backend that parsed them (to be hashed)
+        :return: the features of the building serialized, to be sent to another process or hashed
+        """
+        return marshal.dumps([_element_to_tuple(feature) for feature in self.feature_list], version)
+
+    @classmethod
+    def from_bytes(cls, uuid, features, namespaces):
+        """
+        rebuild a building serialized with to_bytes
+
+        :param uuid: UUID of the building
+        :param features: serialized features
+        :param namespaces: namespaces of the CitiEnGov gml
+        :return: Building instance
+        """
+        feature_list = [_tuple_to_element(feature) for feature in marshal.loads(features)]
+        return cls(uuid=uuid, feature_list=feature_list, namespaces=namespaces)
+
+    def find(self, attribute, _all=False):
+        """
+        get the xml element(s) of an attribute of the building
+
+        :param attribute: name of the CitiEnGov attribute, optionally followed by a path inside it
+            (e.g. 'GEOMETRY2D/gml:Polygon')
+        :param _all: if True return the elements of all features instead of the first one
+        :return: the first xml element or None if not found, with _all a list of all the elements (do not modify)
+        """
+        elements = self.attributes.get(attribute)
+        if elements is None:
+            name, sep, path = attribute.partition('/')
+            if path:
+                # resolve the sub path once and keep it in the table
+                elements = [element.find(path, namespaces=self.namespaces)
+                            for element in self.attributes.get(name, [])]
+                elements = [element for element in elements if element is not None]
+                self.attributes[attribute] = elements
+            else:
+                elements = []
+
+        if _all:
+            # return a list of xml elements containing all not None features of the building
+            return elements
+        # return the first not None feature of the building as an xml element
+        return elements[0] if elements else None
+
+
+class Snapshot:
+    # layout: magic, offset of the index (0 until the snapshot is complete), length of the header, json header,
+    # the encoded features of the buildings one after the other, marshalled table of the tags and index of
+    # (UUID, offset, length)
+    magic = b'CEGSNAP1'
+    prefix = struct.Struct('<8sQI')
+
+    def __init__(self, snapshot_path, source_path):
+        """
+        binary snapshot of the features of a CitiEnGov gml grouped by building, read memory-mapped instead of
+        parsing the gml again
+
+        The snapshot belongs to the version of the source it was made of, identified by its size, modification time
+        and hash: it is used while the size and modification time match, or the hash when only the modification
+        time changed. Loaded, it is a mapping of the UUIDs (in the order of the gml) to their features.
+
+        :param snapshot_path: path of the snapshot
+        :param source_path: path of the CitiEnGov gml
+        """
+        self.snapshot_path = snapshot_path
+        self.source_path = source_path
+        self.buffer = None
+        self.tags = []
+        self.index = {}
+
+    def source_hash(self):
+        import hashlib
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.source_path, 'rb') as source:
+            for block in iter(lambda: source.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def load(self):
+        """
+        :return: True if the snapshot is complete and belongs to the current source, its index is loaded then
+        """
+        import mmap
+        try:
+            snapshot_file = open(self.snapshot_path, 'rb')
+        except FileNotFoundError:
+            return False
+        with snapshot_file:
+            prefix = snapshot_file.read(self.prefix.size)
+            if len(prefix) < self.prefix.size:
+                return False
+            magic, index_offset, header_length = self.prefix.unpack(prefix)
+            if magic != self.magic or not index_offset:
+                return False
+            header = json.loads(snapshot_file.read(header_length).decode('utf-8'))
+            stat = os.stat(self.source_path)
+            if header['size'] != stat.st_size:
+                return False
+            if header['mtime_ns'] != stat.st_mtime_ns and header['hash'] != self.source_hash():
+                return False
+            self.buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.tags, index = marshal.loads(self.buffer[index_offset:])
+        self.index = {uuid: (offset, length) for uuid, offset, length in index}
+        return True
+
+    def record(self, buildings):
+        """
+        write the snapshot of the buildings while they pass, in a temporary file that replaces the snapshot
+        once all the buildings of the source went through
+
+        :param buildings: iterable of all the Building instances of the source
+        :return: generator of the same Building instances
+        """
+        stat = os.stat(self.source_path)
+        header = json.dumps({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': self.source_hash()})
+        header = header.encode('utf-8')
+        tags = {}
+        index = []
+        temporary_path = self.snapshot_path + '.tmp'
+        try:
+            with open(temporary_path, 'wb') as snapshot_file:
+                snapshot_file.write(self.prefix.pack(self.magic, 0, len(header)) + header)
+                offset = snapshot_file.tell()
+                for bu in buildings:
+                    features = self.encode(bu.feature_list, tags)
+                    snapshot_file.write(features)
+                    index.append((bu.UUID, offset, len(features)))
+                    offset += len(features)
+                    yield bu
+                snapshot_file.write(marshal.dumps((list(tags), index)))
+                snapshot_file.seek(0)
+                snapshot_file.write(self.prefix.pack(self.magic, offset, len(header)))
+            os.replace(temporary_path, self.snapshot_path)
+            print('Snapshot written: {path}'.format(path=self.snapshot_path))
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    @staticmethod
+    def encode(features, tags):
+        """
+        encode the elements of the features in document order as flat arrays of their parents and tags (numbers in
+        the table of the tags), their texts and their attributes, much faster to rebuild than nested elements
+
+        :param features: list of the xml elements of the features
+        :param tags: tag -> number of the tags met so far, extended with the new ones
+        :return: the encoded features
+        """
+        parents = array.array('i')
+        numbers = array.array('I')
+        texts = []
+        attributes = []
+        for feature in features:
+            elements = [(feature, -1)]
+            while elements:
+                element, parent = elements.pop()
+                position = len(texts)
+                if element.attrib:
+                    attributes.append((position, dict(element.attrib)))
+                parents.append(parent)
+                numbers.append(tags.setdefault(element.tag, len(tags)))
+                texts.append(element.text)
+                elements.extend((child, position) for child in reversed(element))
+        return marshal.dumps((parents.tobytes(), numbers.tobytes(), texts, attributes))
+
+    def __getitem__(self, uuid):
+        offset, length = self.index[uuid]
+        parents, numbers, texts, attributes = marshal.loads(self.buffer[offset:offset + length])
+        tags = self.tags
+        features = []
+        elements = []
+        for parent, number, text in zip(array.array('i', parents), array.array('I', numbers), texts):
+            if parent < 0:
+                element = eT.Element(tags[number])
+                features.append(element)
+            else:
+                element = eT.SubElement(elements[parent], tags[number])
+            element.text = text
+            elements.append(element)
+        for position, attrib in attributes:
+            elements[position].attrib.update(attrib)
+        return features
+
+    def get(self, uuid, default=None):
+        return self[uuid] if uuid in self.index else default
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+def footprint_bbox(coordinates):
+    """
+    :param coordinates: gml:coordinates element of a footprint or None
+    :return: bounding box of the coordinates (min x, min y, max x, max y), None without coordinates or if they cannot
+        be parsed (the building is then left out of the bounding box selections only)
+    """
+    if coordinates is None or not coordinates.text or not coordinates.text.strip():
+        return None
+    cs, ts, decimal = coordinates.get('cs', ','), coordinates.get('ts', ' '), coordinates.get('decimal', '.')
+    text = coordinates.text.strip()
+    if decimal != '.':
+        text = text.replace(decimal, '.')
+    tuples = text.split() if ts.isspace() else text.split(ts)
+    xs, ys = [], []
+    try:
+        for point in tuples:
+            values = point.split(cs)
+            xs.append(float(values[0]))
+            ys.append(float(values[1]))
+    except (ValueError, IndexError):
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def building_bbox(bu):
+    """
+    :param bu: Building instance
+    :return: bounding box of the footprint of the building, computed by the GeometryStage if it ran on the building,
+        None without footprint
+    """
+    return bu.bbox if bu.bbox is not None else footprint_bbox(bu.find(GeometryStage.coordinates_path))
+
+
+def intersects(bbox, other):
+    """
+    :param bbox: bounding box (min x, min y, max x, max y)
+    :param other: bounding box or None
+    :return: True if the bounding boxes intersect (or touch)
+    """
+    return (other is not None and other[0] <= bbox[2] and other[2] >= bbox[0] and other[1] <= bbox[3]
+            and other[3] >= bbox[1])
+
+
+class BuildingFilter:
+    def __init__(self, uuids=None, bbox=None, where=None):
+        """
+        selection of the buildings to export, all the given conditions have to hold
+
+        :param uuids: UUIDs of the buildings, None for any
+        :param bbox: (min x, min y, max x, max y) in the coordinates of the input that the footprints have to
+            intersect, None for any
+        :param where: dictionary of CitiEnGov attribute -> list of the accepted values (text of its first element)
+        """
+        self.uuids = set(uuids) if uuids is not None else None
+        self.bbox = tuple(bbox) if bbox is not None else None
+        self.where = {field: set(values) for field, values in (where or {}).items()}
+
+    @classmethod
+    def from_arguments(cls, uuids_path=None, bbox=None, where=None):
+        """
+        :param uuids_path: path of a text file with one UUID per line
+        :param bbox: (min x, min y, max x, max y)
+        :param where: list of FIELD=VALUE conditions, the values of the same field are alternatives
+        :return: BuildingFilter instance
+        """
+        uuids = None
+        if uuids_path is not None:
+            with open(uuids_path) as uuids_file:
+                uuids = [line.strip() for line in uuids_file if line.strip()]
+        conditions = {}
+        for condition in where or []:
+            field, sep, value = condition.partition('=')
+            if not sep or not field:
+                raise ValueError('Conditions are given as FIELD=VALUE instead of \'{c}\'!'.format(c=condition))
+            conditions.setdefault(field.strip(), []).append(value)
+        return cls(uuids=uuids, bbox=bbox, where=conditions)
+
+    def matches(self, bu):
+        """
+        :param bu: Building instance
+        :return: True if the building is selected
+        """
+        if self.uuids is not None and bu.UUID not in self.uuids:
+            return False
+        for field, values in self.where.items():
+            element = bu.find(field)
+            if element is None or element.text not in values:
+                return False
+        if self.bbox is not None:
+            return intersects(self.bbox, building_bbox(bu))
+        return True
+
+
+class BuildingIndex:
+    # attributes indexed by default
+    fields = ('USE_S', 'BUILDINGTYPE', 'ENERGYPERFORMANCE_PERF_CLASS')
+
+    def __init__(self, uuids, bboxes, values, cell_size=None):
+        """
+        index of the buildings of a source: a grid over the bounding boxes of the footprints and a hash index on the
+        values of some attributes, the buildings are selected by position in the source without touching the others
+
+        :param uuids: UUIDs of the buildings in the order of the source
+        :param bboxes: footprint bounding box of each building or None
+        :param values: dictionary of attribute -> list of the value of each building (None if it is missing)
+        :param cell_size: size of the cells of the grid (default: a few buildings per cell on average)
+        """
+        self.uuids = uuids
+        self.positions = {uuid: position for position, uuid in enumerate(uuids)}
+        self.bboxes = bboxes
+        self.values = {}
+        for field, field_values in values.items():
+            index = self.values[field] = {}
+            for position, value in enumerate(field_values):
+                index.setdefault(value, []).append(position)
+
+        boxes = [bbox for bbox in bboxes if bbox is not None]
+        self.cells = {}
+        self.cell_size = cell_size
+        if not boxes:
+            return
+        self.extent = (min(bbox[0] for bbox in boxes), min(bbox[1] for bbox in boxes),
+                       max(bbox[2] for bbox in boxes), max(bbox[3] for bbox in boxes))
+        if self.cell_size is None:
+            area = (self.extent[2] - self.extent[0]) * (self.extent[3] - self.extent[1])
+            self.cell_size = math.sqrt(4 * area / len(boxes)) or 1.0
+        for position, bbox in enumerate(bboxes):
+            if bbox is None:
+                continue
+            (min_x, min_y), (max_x, max_y) = self.cell(bbox[0], bbox[1]), self.cell(bbox[2], bbox[3])
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    self.cells.setdefault((x, y), []).append(position)
+
+    def cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def query(self, building_filter):
+        """
+        :param building_filter: BuildingFilter instance
+        :return: positions of the selected buildings in the order of the source
+        """
+        selected = None
+        if building_filter.uuids is not None:
+            selected = {self.positions[uuid] for uuid in building_filter.uuids if uuid in self.positions}
+        for field, accepted in building_filter.where.items():
+            if field not in self.values:
+                raise ValueError('{f} is not indexed, the buildings can be selected by: {i}'.format(
+                    f=field, i=', '.join(self.values)))
+            positions = {position for value in accepted for position in self.values[field].get(value, ())}
+            selected = positions if selected is None else selected & positions
+        if building_filter.bbox is not None:
+            candidates = self.candidates(building_filter.bbox) if selected is None else selected
+            selected = {position for position in candidates
+                        if intersects(building_filter.bbox, self.bboxes[position])}
+        if selected is None:
+            return list(range(len(self.uuids)))
+        return sorted(selected)
+
+    def candidates(self, bbox):
+        """
+        :param bbox: (min x, min y, max x, max y)
+        :return: positions of the buildings in the cells of the grid the bounding box overlaps
+        """
+        if not self.cells or not intersects(bbox, self.extent):
+            return set()
+        # only the cells within the extent of the buildings
+        (min_x, min_y), (max_x, max_y) = (self.cell(max(bbox[0], self.extent[0]), max(bbox[1], self.extent[1])),
+                                          self.cell(min(bbox[2], self.extent[2]), min(bbox[3], self.extent[3])))
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.cells):
+            return {position for cell in self.cells.values() for position in cell}
+        return {position for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+                for position in self.cells.get((x, y), ())}
+
+    @classmethod
+    def from_buildings(cls, buildings, fields=None):
+        """
+        :param buildings: list of Building instances
+        :param fields: attributes to index (default: BuildingIndex.fields)
+        :return: BuildingIndex of the buildings
+        """
+        def value(bu, field):
+            element = bu.find(field)
+            return element.text if element is not None else None
+
+        return cls([bu.UUID for bu in buildings],
+                   [building_bbox(bu) for bu in buildings],
+                   {field: [value(bu, field) for bu in buildings] for field in fields or cls.fields})
+
+
+class GeometryStage:
+    # path of the footprint coordinates in the CitiEnGov gml
+    coordinates_path = 'GEOMETRY2D/gml:Polygon/gml:outerBoundaryIs/gml:LinearRing/gml:coordinates'
+
+    def __init__(self, affine=None, transform=None, precision=None, batch_size=1000, profiler=None, tolerant=False):
+        """
+        batched processing of the footprints with numpy: the coordinates of a batch of buildings are parsed into
+        one packed array with ring offsets, transformed and rounded, and the bounding box and area of each
+        footprint is computed (Building.bbox, Building.footprint_area)
+
+        :param affine: (a, b, c, d, e, f) parameters of the affine transformation x' = a*x + b*y + c,
+            y' = d*x + e*y + f
+        :param transform: function transforming arrays of x and y, e.g. the transform of a pyproj Transformer
+        :param precision: number of decimals to round the coordinates to
+        :param batch_size: number of buildings processed at once
+        :param profiler: Profiler instance to measure the stage
+        :param tolerant: a building whose footprint cannot be processed gets a quarantine record (Building.failure)
+            instead of stopping the export
+        """
+        if optional_import('numpy') is None:
+            raise ImportError('The geometry stage needs numpy.')
+        self.affine = affine
+        self.transform = transform
+        self.precision = precision
+        self.batch_size = batch_size
+        self.profiler = profiler
+        self.tolerant = tolerant
+
+    def apply(self, buildings, footprint_path=None):
+        """
+        :param buildings: CitiEnGov instance (or any iterable of Building instances)
+        :param footprint_path: path of a csv file to write the bounding box and area of each footprint to
+        :return: generator of the processed buildings
+        """
+        footprints = None
+        if footprint_path is not None:
+            footprints = open(footprint_path, 'w', newline='')
+            footprints.write('UUID,MIN_X,MIN_Y,MAX_X,MAX_Y,AREA\n')
+        try:
+            batch = []
+            for bu in buildings:
+                batch.append(bu)
+                if len(batch) == self.batch_size:
+                    self.process_batch(batch, footprints)
+                    yield from batch
+                    batch = []
+            if batch:
+                self.process_batch(batch, footprints)
+                yield from batch
+        finally:
+            if footprints is not None:
+                footprints.close()
+
+    def process_batch(self, batch, footprints=None):
+        with profile_stage(self.profiler, 'geometry'):
+            try:
+                self.process(batch)
+            except Exception:
+                if not self.tolerant:
+                    raise
+                # a footprint of the batch cannot be processed, process the buildings one by one to find it
+                for bu in batch:
+                    try:
+                        self.process([bu])
+                    except Exception as exception:
+                        bu.failure = stage_failure('geometry', bu, exception)
+        if footprints is not None:
+            footprints.writelines('{u},{b[0]!r},{b[1]!r},{b[2]!r},{b[3]!r},{a!r}\n'.format(
+                u=bu.UUID, b=bu.bbox, a=bu.footprint_area) for bu in batch if bu.bbox is not None)
+
+    def process(self, batch):
+        """
+        process the footprints of a batch of buildings
+
+        :param batch: list of Building instances
+        """
+        np = optional_import('numpy')
+        elements = []
+        values = []
+        counts = []
+        for bu in batch:
+            co = bu.find(self.coordinates_path)
+            if co is None or not co.text or not co.text.strip():
+                continue
+            cs, ts, decimal = co.get('cs', ','), co.get('ts', ' '), co.get('decimal', '.')
+            text = co.text.strip()
+            if decimal != '.':
+                text = text.replace(decimal, '.')
+            tuples = text.split() if ts.isspace() else text.split(ts)
+            # 2 or 3 dimensional coordinates
+            dimension = tuples[0].count(cs) + 1
+            values.extend(text.replace(cs, ' ').replace(ts, ' ').split())
+            elements.append((bu, co, dimension))
+            counts.append(len(tuples))
+        if not elements:
+            return
+
+        # packed coordinates of all the rings with the offset of each ring
+        dimensions = np.repeat([dimension for bu, co, dimension in elements], counts)
+        if (dimensions == 2).all():
+            points = np.array(values, dtype=float).reshape(-1, 2)
+        else:
+            points = np.zeros((len(dimensions), 3))
+            flat = np.array(values, dtype=float)
+            starts = np.concatenate(([0], np.cumsum(dimensions)[:-1]))
+            for axis in range(3):
+                has_axis = dimensions > axis
+                points[has_axis, axis] = flat[starts[has_axis] + axis]
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        x, y = points[:, 0], points[:, 1]
+
+        changed = False
+        if self.affine is not None:
+            a, b, c, d, e, f = self.affine
+            x, y = a * x + b * y + c, d * x + e * y + f
+            changed = True
+        if self.transform is not None:
+            x, y = self.transform(x, y)
+            x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+            changed = True
+        if self.precision is not None:
+            x, y = np.round(x, self.precision), np.round(y, self.precision)
+            changed = True
+
+        # bounding boxes and shoelace areas of the rings
+        starts, ends = offsets[:-1], offsets[1:]
+        min_x, max_x = np.minimum.reduceat(x, starts), np.maximum.reduceat(x, starts)
+        min_y, max_y = np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
+        # relative to the first vertex of the ring, the products of large projected coordinates lose precision
+        counts = np.diff(offsets)
+        rx, ry = x - np.repeat(x[starts], counts), y - np.repeat(y[starts], counts)
+        cross = np.zeros(len(x))
+        cross[:-1] = rx[:-1] * ry[1:] - rx[1:] * ry[:-1]
+        # the term closing each ring replaces the one reaching over to the next ring
+        last = ends - 1
+        cross[last] = rx[last] * ry[starts] - rx[starts] * ry[last]
+        areas = np.abs(np.add.reduceat(cross, starts)) / 2
+        for (bu, co, dimension), bbox, area in zip(elements, zip(min_x.tolist(), min_y.tolist(), max_x.tolist(),
+                                                                   max_y.tolist()), areas.tolist()):
+            bu.bbox = bbox
+            bu.footprint_area = area
+
+        if changed:
+            points[:, 0], points[:, 1] = x, y
+            self.write_coordinates(elements, points, offsets)
+
+    def write_coordinates(self, elements, points, offsets):
+        # format all the numbers at once, then join them by ring in the convention of each element
+        if self.precision is not None:
+            numbers = ['{v:.{p}f}'.format(v=v, p=self.precision) for v in points.ravel().tolist()]
+        else:
+            numbers = [repr(v) for v in points.ravel().tolist()]
+        width = points.shape[1]
+        for (bu, co, dimension), start, end in zip(elements, offsets[:-1].tolist(), offsets[1:].tolist()):
+            cs, ts, decimal = co.get('cs', ','), co.get('ts', ' '), co.get('decimal', '.')
+            ring = [cs.join(numbers[i * width:i * width + dimension]) for i in range(start, end)]
+            text = ts.join(ring)
+            if decimal != '.':
+                text = text.replace('.', decimal)
+            co.text = text
+
+
+def regular_time_series(years, values):
+    """
+    order the yearly values of a building by year
+
+    :param years: list of the year texts
+    :param values: list of the value texts, in the order of the years (None for an empty value, written as 'None')
+    :return: tuple of the first year, the last year, the number of years and the values separated by whitespace
+    """
+    sorted_years = sorted(years)
+    # check if the years are consecutive:
+    if len(years) != int(sorted_years[-1]) - int(sorted_years[0]) + 1:
+        raise UnboundLocalError('Years have to be consecutive, but here they are: {l}'.format(l=sorted_years))
+    year_values = dict(zip(years, values))
+    return (sorted_years[0], sorted_years[-1], str(len(years)),
+            ' '.join(['{v}'.format(v=year_values[y]) for y in sorted_years]).strip())
+
+
+class EnergySeriesStage:
+    # energy carriers with the suffix of their CitiEnGov attributes
+    carriers = {'electricity': 'E', 'thermal': 'T'}
+
+    def __init__(self, batch_size=1000, profiler=None, tolerant=False):
+        """
+        batched aggregation of the yearly energy values with numpy: the years and values of a batch of buildings
+        are gathered into columns and the sum, the mean and the mean per floor area of each series computed at once
+
+        The RegularTimeSeries of the output are built by make_demand building by building (see regular_time_series),
+        converting the short yearly histories to arrays costs more than it saves there.
+
+        :param batch_size: number of buildings processed at once
+        :param profiler: Profiler instance to measure the stage
+        :param tolerant: a building whose values cannot be aggregated gets a quarantine record (Building.failure),
+            otherwise it is only left out of the aggregates
+        """
+        if optional_import('numpy') is None:
+            raise ImportError('The energy series stage needs numpy.')
+        self.batch_size = batch_size
+        self.profiler = profiler
+        self.tolerant = tolerant
+
+    def apply(self, buildings, aggregate_path):
+        """
+        :param buildings: CitiEnGov instance (or any iterable of Building instances)
+        :param aggregate_path: path of a csv file to write the sum, the mean and the mean per floor area
+            (SURFACE_VALUE) of the yearly values of each building and energy carrier to
+        :return: generator of the processed buildings
+        """
+        with open(aggregate_path, 'w', newline='') as aggregates:
+            aggregates.write('UUID,CARRIER,UOM,BEGIN,END,YEARS,SUM,MEAN,MEAN_PER_M2\n')
+            batch = []
+            for bu in buildings:
+                batch.append(bu)
+                if len(batch) == self.batch_size:
+                    self.process_batch(batch, aggregates)
+                    yield from batch
+                    batch = []
+            if batch:
+                self.process_batch(batch, aggregates)
+                yield from batch
+
+    def process_batch(self, batch, aggregates):
+        with profile_stage(self.profiler, 'energy series'):
+            try:
+                rows = self.process(batch)
+            except Exception:
+                # a building of the batch has values the arrays cannot take, process the buildings one by one
+                rows = []
+                for bu in batch:
+                    try:
+                        rows += self.process([bu])
+                    except Exception as exception:
+                        if self.tolerant:
+                            bu.failure = stage_failure('energy series', bu, exception)
+        aggregates.writelines('{u},{c},{uom},{b},{e},{n},{s!r},{m!r},{i}\n'.format(
+            u=uuid, c=carrier, uom=uom, b=begin, e=end, n=number, s=total, m=mean,
+            i=repr(intensity) if intensity is not None else '') for uuid, carrier, uom, begin, end, number, total,
+            mean, intensity in rows)
+
+    def process(self, batch):
+        """
+        aggregate the yearly values of a batch of buildings
+
+        :param batch: list of Building instances
+        :return: list of the aggregates of the series (UUID, carrier, uom, first year, last year, number of years,
+            sum, mean, mean per floor area)
+        """
+        np = optional_import('numpy')
+        # one row per yearly value, a group per building and carrier
+        groups = []
+        group_column = []
+        year_column = []
+        value_column = []
+        for bu in batch:
+            for carrier, suffix in self.carriers.items():
+                values = [v.text for v in bu.find('CONSUMONORM_VALORE_' + suffix, _all=True)]
+                if not values:
+                    continue
+                years = [y.text for y in bu.find('ENERGYAMOUNT_E_YEAR_ONLY_' + suffix, _all=True)]
+                if len(years) != len(values) or None in years:
+                    # not a series, make_demand reports the building
+                    continue
+                group_column.extend([len(groups)] * len(years))
+                year_column.extend(years)
+                value_column.extend(values)
+                groups.append((bu, carrier, suffix))
+        if not groups:
+            return []
+
+        group = np.array(group_column)
+        years = np.array(year_column)
+        # the years are ordered as texts like in regular_time_series
+        order = np.lexsort((years, group))
+        group, years = group[order], years[order]
+        values = np.array(value_column, dtype=object)[order]
+        starts = np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1])))
+        ends = np.append(starts[1:], len(group))
+        numbers = ends - starts
+        first_years, last_years = years[starts].tolist(), years[ends - 1].tolist()
+
+        numeric = np.array([_to_float(value) for value in values.tolist()])
+        totals = np.add.reduceat(numeric, starts)
+        means = totals / numbers
+        surfaces = np.array([_to_float(bu.find('SURFACE_VALUE').text) if bu.find('SURFACE_VALUE') is not None
+                             else np.nan for bu, carrier, suffix in groups])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intensities = means / surfaces
+        rows = []
+        for index, (bu, carrier, suffix) in enumerate(groups):
+            uom = bu.find('CONSUMONORM_UOM_' + suffix)
+            intensity = float(intensities[index])
+            rows.append((bu.UUID, carrier, uom.text if uom is not None else '', first_years[index],
+                         last_years[index], int(numbers[index]), float(totals[index]), float(means[index]),
+                         intensity if np.isfinite(intensity) else None))
+        return rows
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def serialize_member(member):
+    """
+    serialize a member element to be placed under a root that declares all the namespaces
+
+    :param member: xml element of one member of the document
+    :return: the member as a string without namespace declarations
+    """
+    fragment = eT.tostring(member, encoding='unicode', method='xml', short_empty_elements=True)
+    # ElementTree declares the namespaces on the top element, drop them from the start tag
+    start_tag_end = fragment.index('>') + 1
+    return NAMESPACE_DECLARATION.sub('', fragment[:start_tag_end]) + fragment[start_tag_end:]
+
+
+class OutputSink:
+    # compression of the outputs by file extension
+    extensions = {'.gz': 'gzip', '.zst': 'zstd'}
+    # suffix of an output file while it is written, it is renamed to the target path once complete
+    temporary_suffix = '.tmp'
+
+    def __init__(self, compression=None, level=None, buffer_size=1 << 20):
+        """
+        where and how the output documents are written: to files or to the standard output ('-'),
+        compressed with gzip or zstd as they are written, through a large buffer
+
+        :param compression: 'gzip' or 'zstd', by default taken from the extension of the target path (.gz, .zst)
+        :param level: compression level (default: 6 for gzip, 3 for zstd)
+        :param buffer_size: size of the blocks written to the file or to the compressor in bytes
+        """
+        if compression not in (None, 'gzip', 'zstd'):
+            raise ValueError('Compression can be either \'gzip\' or \'zstd\'!')
+        if compression == 'zstd' and optional_import('zstandard') is None:
+            raise ImportError('zstd compression needs the zstandard package.')
+        self.compression = compression
+        self.level = level
+        self.buffer_size = buffer_size
+
+    def compression_of(self, target_path):
+        """
+        :param target_path: path of the output, '-' for the standard output
+        :return: compression of the output or None
+        """
+        if self.compression is not None:
+            return self.compression
+        compression = self.extensions.get(os.path.splitext(target_path)[1])
+        if compression == 'zstd' and optional_import('zstandard') is None:
+            raise ImportError('zstd compression needs the zstandard package.')
+        return compression
+
+    def open(self, target_path, offset=None, temporary=False):
+        """
+        :param target_path: path of the output, '-' for the standard output
+        :param offset: continue an uncompressed output file from this byte offset (what follows is dropped)
+        :param temporary: write to <target_path>.tmp instead, see commit and discard
+        :return: binary file object writing to the output
+        """
+        compression = self.compression_of(target_path)
+        if temporary and target_path != '-':
+            target_path += self.temporary_suffix
+        if offset is not None:
+            if compression is not None or target_path == '-':
+                raise ValueError('Only uncompressed output files can be continued: {p}'.format(p=target_path))
+            target = open(target_path, 'r+b', buffering=self.buffer_size)
+            target.truncate(offset)
+            target.seek(offset)
+            return target
+        if target_path == '-':
+            sys.__stdout__.flush()
+            target = open(sys.__stdout__.fileno(), 'wb', buffering=0 if compression else self.buffer_size,
+                          closefd=False)
+        else:
+            target = open(target_path, 'wb', buffering=0 if compression else self.buffer_size)
+        if compression is None:
+            return target
+        if compression == 'gzip':
+            compressor = gzip.GzipFile(filename='', mode='wb', fileobj=target,
+                                       compresslevel=6 if self.level is None else self.level)
+        else:
+            zstandard = optional_import('zstandard')
+            compressor = zstandard.ZstdCompressor(level=3 if self.level is None else self.level).stream_writer(target)
+        return _CompressedFile(compressor, target, self.buffer_size)
+
+    def commit(self, target_path):
+        """
+        the output opened as temporary is complete, rename it to the target path
+
+        :param target_path: path of the output
+        """
+        if target_path != '-':
+            os.replace(target_path + self.temporary_suffix, target_path)
+
+    def discard(self, target_path):
+        """
+        the output opened as temporary is not going to be completed, remove it
+
+        :param target_path: path of the output
+        """
+        if target_path != '-' and os.path.exists(target_path + self.temporary_suffix):
+            os.remove(target_path + self.temporary_suffix)
+
+
+class _CompressedFile(io.BufferedWriter):
+    # buffered writer feeding a compressor in large blocks, closing the compressor and then the file
+    def __init__(self, compressor, target, buffer_size):
+        super().__init__(compressor, buffer_size)
+        self.target = target
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.target.close()
+
+
+def document_tags(root, namespaces):
+    """
+    :param root: the (empty) root element of the document
+    :param namespaces: uris of the namespaces to declare on the root
+    :return: start tag and end tag of the root
+    """
+    # serialize the root with a placeholder child for each namespace to get the declarations
+    shell = eT.Element(root.tag, root.attrib)
+    for uri in namespaces:
+        eT.SubElement(shell, '{{{uri}}}_'.format(uri=uri))
+    shell = eT.tostring(shell, encoding='unicode', method='xml', short_empty_elements=True)
+    start_tag = shell[:shell.index('>') + 1]
+    return start_tag, '</{tag}>'.format(tag=start_tag[1:].split(None, 1)[0].rstrip('>'))
+
+
+class GMLWriter:
+    def __init__(self, target_path, root, namespaces, sink=None, resume=None, keep_partial=False):
+        """
+        incremental writer of a gml document, each member is written out as soon as it is added
+
+        The output is the same as writing the whole tree with ElementTree, as long as the namespaces given
+        are the ones used by the members: the root start tag is written before the members are known, so all the
+        namespaces given are declared on it. The document is written to <target_path>.tmp and renamed to the
+        target path when it is closed complete.
+
+        :param target_path: path of the file to write, '-' for the standard output
+        :param root: the (empty) root element of the document
+        :param namespaces: uris of the namespaces to declare on the root
+        :param sink: OutputSink opening the target (default: uncompressed)
+        :param resume: (offset, members) state from checkpoint to continue the file of an interrupted run
+        :param keep_partial: keep the unfinished <target_path>.tmp when the writer is closed incomplete, to resume
+            it from a checkpoint
+        """
+        # a document without members is the bare root
+        self.empty_root = eT.tostring(eT.Element(root.tag, root.attrib), encoding='unicode', method='xml',
+                                      short_empty_elements=True)
+        self.start_tag, self.end_tag = document_tags(root, namespaces)
+        self.target_path = target_path
+        self.sink = sink or OutputSink()
+        self.keep_partial = keep_partial
+
+        if resume is not None:
+            offset, self.members = resume
+            self.file = io.TextIOWrapper(self.sink.open(target_path, offset=offset, temporary=True),
+                                         encoding='utf-8')
+        else:
+            self.file = io.TextIOWrapper(self.sink.open(target_path, temporary=True), encoding='utf-8')
+            self.file.write(XML_DECLARATION)
+            self.members = 0
+
+    def write_member(self, member):
+        """
+        serialize and write out a member element
+
+        :param member: xml element of the member
+        """
+        self.write_fragment(serialize_member(member))
+
+    def write_fragment(self, fragment, bbox=None):
+        """
+        write out an already serialized member
+
+        :param fragment: member serialized with serialize_member
+        :param bbox: bounding box of the member, only used by the ShardWriter
+        """
+        if not self.members:
+            # the root start tag is written with the first member
+            self.file.write(self.start_tag)
+        self.file.write(fragment)
+        self.members += 1
+
+    def checkpoint(self):
+        """
+        flush the output to disk
+
+        :return: (offset, members) state to continue the file from with resume
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.buffer.tell(), self.members
+
+    def close(self, complete=True):
+        """
+        :param complete: the document is complete, otherwise it is dropped (or kept with keep_partial)
+        """
+        if not complete:
+            self.file.close()
+            if not self.keep_partial and self.target_path != '-':
+                self.sink.discard(self.target_path)
+            return
+        if self.members:
+            self.file.write(self.end_tag)
+        else:
+            self.file.write(self.empty_root)
+        self.file.close()
+        if self.target_path != '-':
+            self.sink.commit(self.target_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(complete=exc_type is None)
+
+
+class ShardWriter:
+    def __init__(self, target_path, standard, mode, size, workers=4, sink=None):
+        """
+        writer splitting the members of a document into standalone shard documents
+
+        The members are spooled to a temporary file, a shard is written out with its numberReturned and
+        boundedBy (the envelope of the bounding boxes of its members) once it is complete: when it is full in
+        count and bytes mode, at the end in tile mode. The shards are written on a thread pool and listed in a
+        json manifest next to the target path.
+
+        :param target_path: path of the output gml, the shards are named after it (output_<shard>.gml)
+        :param standard: Standard instance of the document
+        :param mode: 'tile' (grid of the footprint bounding box centers), 'count' (members) or 'bytes'
+        :param size: tile size in the units of the coordinates, number of members or bytes per shard
+        :param workers: number of threads writing the shards
+        :param sink: OutputSink opening the shards (default: uncompressed)
+        """
+        if mode not in ('tile', 'count', 'bytes'):
+            raise ValueError('Shard mode can be either \'tile\', \'count\' or \'bytes\'!')
+        self.target_path = target_path
+        self.standard = standard
+        self.mode = mode
+        self.size = size
+        self.sink = sink or OutputSink()
+        self.root_path, self.extension = os.path.splitext(target_path)
+        if self.extension in OutputSink.extensions:
+            # the shards are named output_<shard>.gml.gz
+            self.root_path, extension = os.path.splitext(self.root_path)
+            self.extension = extension + self.extension
+        self.namespaces = [standard.nss.dict[prefix] for prefix in standard.document_prefixes]
+
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+        spool, self.spool_path = tempfile.mkstemp(prefix='.shards_', dir=os.path.dirname(target_path) or '.')
+        self.spool = os.fdopen(spool, 'wb')
+        self.offset = 0
+        # shards being filled: key -> ranges of the spool, number of members, bytes, envelope
+        self.shards = {}
+        self.current = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.written = []
+
+    def shard_key(self, size, bbox):
+        if self.mode == 'tile':
+            if bbox is None:
+                return 'untiled'
+            return (math.floor((bbox[0] + bbox[2]) / 2 / self.size),
+                    math.floor((bbox[1] + bbox[3]) / 2 / self.size))
+        shard = self.shards.get(self.current)
+        if shard is not None and (shard['members'] >= self.size if self.mode == 'count'
+                                  else shard['bytes'] + size > self.size):
+            self.flush(self.current)
+            self.current += 1
+        return self.current
+
+    def write_fragment(self, fragment, bbox=None):
+        """
+        spool a serialized member to its shard
+
+        :param fragment: member serialized with serialize_member
+        :param bbox: bounding box of the member (min x, min y, max x, max y)
+        """
+        data = fragment.encode('utf-8')
+        key = self.shard_key(len(data), bbox)
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = self.shards[key] = {'ranges': [], 'members': 0, 'bytes': 0, 'bbox': None}
+        ranges = shard['ranges']
+        if ranges and ranges[-1][0] + ranges[-1][1] == self.offset:
+            ranges[-1][1] += len(data)
+        else:
+            ranges.append([self.offset, len(data)])
+        self.spool.write(data)
+        self.offset += len(data)
+        shard['members'] += 1
+        shard['bytes'] += len(data)
+        if bbox is not None:
+            envelope = shard['bbox']
+            shard['bbox'] = bbox if envelope is None else (
+                min(envelope[0], bbox[0]), min(envelope[1], bbox[1]),
+                max(envelope[2], bbox[2]), max(envelope[3], bbox[3]))
+
+    def flush(self, key):
+        """
+        hand a complete shard over to the thread pool
+
+        :param key: key of the shard
+        """
+        self.spool.flush()
+        shard = self.shards.pop(key)
+        if self.mode == 'tile' and key != 'untiled':
+            name = '{x}_{y}'.format(x=key[0], y=key[1])
+        else:
+            name = key if isinstance(key, str) else '{n:04d}'.format(n=key)
+        shard['path'] = '{root}_{name}{ext}'.format(root=self.root_path, name=name, ext=self.extension)
+        if self.mode == 'tile' and key != 'untiled':
+            shard['tile'] = list(key)
+            shard['tile_bbox'] = [key[0] * self.size, key[1] * self.size,
+                                  (key[0] + 1) * self.size, (key[1] + 1) * self.size]
+
+        # the header is serialized here, the prefixes registered in ElementTree may change in the meantime
+        root = eT.Element(self.standard.root.tag, self.standard.root.attrib)
+        if 'numberReturned' in root.attrib:
+            root.set('numberReturned', str(shard['members']))
+        self.standard.register_namespaces()
+        start_tag, end_tag = document_tags(root, self.namespaces)
+        if shard['bbox'] is not None:
+            start_tag += serialize_member(self.standard.bounded_by(shard['bbox']))
+        self.written.append((shard, self.executor.submit(self.write_shard, shard, start_tag, end_tag)))
+
+    def write_shard(self, shard, start_tag, end_tag):
+        try:
+            with self.sink.open(shard['path'], temporary=True) as target, open(self.spool_path, 'rb') as spool:
+                target.write(XML_DECLARATION.encode('utf-8'))
+                target.write(start_tag.encode('utf-8'))
+                for offset, length in shard['ranges']:
+                    spool.seek(offset)
+                    target.write(spool.read(length))
+                target.write(end_tag.encode('utf-8'))
+        except BaseException:
+            self.sink.discard(shard['path'])
+            raise
+        self.sink.commit(shard['path'])
+
+    def close(self, complete=True):
+        """
+        :param complete: the export is complete, otherwise the shards written so far are removed and no manifest
+            is written
+        """
+        try:
+            if not complete:
+                for shard, future in self.written:
+                    if future.exception() is None:
+                        os.remove(shard['path'])
+                return
+            for key in list(self.shards):
+                self.flush(key)
+            manifest = []
+            for shard, future in self.written:
+                future.result()
+                manifest.append({
+                    'path': os.path.basename(shard['path']),
+                    'members': shard['members'],
+                    'bbox': list(shard['bbox']) if shard['bbox'] is not None else None
+                })
+                if 'tile' in shard:
+                    manifest[-1]['tile'] = shard['tile']
+                    manifest[-1]['tile_bbox'] = shard['tile_bbox']
+        finally:
+            self.executor.shutdown()
+            self.spool.close()
+            os.remove(self.spool_path)
+        with open(self.root_path + '.shards.json', 'w') as manifest_file:
+            json.dump({'standard': self.standard.name, 'mode': self.mode, 'size': self.size, 'shards': manifest},
+                      manifest_file, indent=2)
+        print('{std} gml written to {n} shards, manifest: {path}'.format(
+            std=self.standard.name, n=len(manifest), path=self.root_path + '.shards.json'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(complete=exc_type is None)
+
+
+class Quarantine:
+    def __init__(self, target_path, append=False):
+        """
+        file of the buildings that failed to translate, one json record per line (see quarantine_record)
+
+        :param target_path: path of the quarantine file
+        :param append: keep the records already in the file (resumed run)
+        """
+        self.target_path = target_path
+        self.file = open(target_path, 'a' if append else 'w', encoding='utf-8')
+        # (standard, mapping, exception) -> number of buildings
+        self.causes = {}
+        self.buildings = set()
+
+    def add(self, record):
+        """
+        :param record: quarantine record of a building
+        """
+        self.file.write(json.dumps(record) + '\n')
+        self.count(record)
 
+    def count(self, record):
+        cause = (record['standard'], record['mapping'], record['exception'])
+        self.causes[cause] = self.causes.get(cause, 0) + 1
+        self.buildings.add(record['uuid'])
 
-class NameSpaceSolver:
-    def __init__(self, namespace_dict):
+    def checkpoint(self):
         """
-        initialize the solver instance
+        flush the records to disk
 
-        :param namespace_dict: dictionary that contains the prefixes and full uris as key-value pairs
+        :return: byte offset to cut the file back to with truncate
         """
-        self.dict = namespace_dict
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.buffer.tell()
 
-    def solve(self, full_tag):
+    def truncate(self, offset):
         """
-        convert element tags from prefix:tag to {full_uri}tag which is necessary for ElementTree
+        drop the records after an offset of the file and count the ones before it (resumed run)
 
-        :param full_tag: tag to be resolved presented as prefix:tag
-        :return: resolved tag as {full_uri}tag
+        :param offset: byte offset from checkpoint
         """
+        self.file.truncate(offset)
+        with open(self.target_path, encoding='utf-8') as records:
+            for line in records:
+                self.count(json.loads(line))
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        print('Buildings quarantined: {n}{path}'.format(
+            n=len(self.buildings), path=', see: {p}'.format(p=self.target_path) if self.buildings else ''))
+        for (standard, mapping, exception), number in sorted(self.causes.items(), key=lambda item: -item[1]):
+            print('  {std} {mapping}: {exception} x {n}'.format(std=standard, mapping=mapping, exception=exception,
+                                                                 n=number))
+
+    def __enter__(self):
+        return self
 
-        prefix, sep, tag = full_tag.rpartition(':')
-        return '{{{uri}}}{tag}'.format(uri=self.dict[prefix], tag=tag)
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
-class CitiEnGov:
-    def __init__(self, gml_path, input_mode='file'):
-        # Parse base xml with all data
-        if input_mode == 'file':
-            print('Opening file: {f_p}'.format(f_p=gml_path))
-            gml = eT.parse(gml_path)
-            self.root = gml.getroot()
-        elif input_mode == 'url':
-            with request.urlopen(gml_path) as url_gml:
-                print('Opening URL: {u}'.format(u=gml_path))
-                data = url_gml.read()
-                self.root = eT.fromstring(data)
-        else:
-            raise ValueError('Mode should be either \'file\' or \'url\'.')
+class Checkpoint:
+    def __init__(self, checkpoint_path, targets, interval=1000, resume=False, quarantine=None):
+        """
+        periodic checkpoints of a streamed export: the outputs are flushed to disk and their offsets are saved
+        with the UUIDs of the buildings exported so far, an interrupted export can be resumed from the last one
+
+        :param checkpoint_path: path of the checkpoint (json), the UUIDs are kept next to it (<path>.uuids)
+        :param targets: list of (standard name, target_path) tuples of the export
+        :param interval: number of buildings between the checkpoints
+        :param resume: continue from the checkpoint at the path instead of starting a new export, a new export is
+            started if there is no checkpoint yet
+        :param quarantine: Quarantine instance of the export, its offset is saved with the checkpoint and its records
+            after the checkpoint are dropped on resume
+        """
+        self.checkpoint_path = checkpoint_path
+        self.uuids_path = checkpoint_path + '.uuids'
+        self.targets = [[standard, target_path] for standard, target_path in targets]
+        self.interval = interval
+        self.quarantine = quarantine
+        self.state = None
+        self.done = set()
+        self.pending = 0
+        if resume and not os.path.exists(checkpoint_path):
+            # interrupted before the first checkpoint
+            print('No checkpoint to resume from: {path}, starting the export again'.format(path=checkpoint_path))
+            resume = False
+        if resume:
+            with open(checkpoint_path) as checkpoint_file:
+                self.state = json.load(checkpoint_file)
+            if self.state['targets'] != self.targets:
+                raise ValueError('The checkpoint was made for other outputs: {t}'.format(t=self.state['targets']))
+            with open(self.uuids_path, 'r+b') as uuids_file:
+                # the UUIDs written after the checkpoint are dropped
+                uuids_file.truncate(self.state['uuids_offset'])
+                self.done = set(uuids_file.read().decode('utf-8').split())
+            print('Resuming from checkpoint: {path}, {n} buildings exported'.format(path=checkpoint_path,
+                                                                                 n=len(self.done)))
+        if quarantine is not None:
+            # the buildings after the checkpoint are exported (and quarantined) again
+            quarantine.truncate(self.state['quarantine_offset'] if resume else 0)
+        self.uuids = open(self.uuids_path, 'ab' if resume else 'wb')
+
+    def writer_state(self, number):
+        """
+        :param number: index of the target
+        :return: state to resume the writer of the target with, None for a new export
+        """
+        return tuple(self.state['outputs'][number]) if self.state is not None else None
 
-        # Prepare namespace to translate for ElementTree
-        self.namespaces = {
-            'CitiEnGov_01_1': 'http://maps.dedagroup.it/energy/geoserver/CitiEnGov_01_1',
-            'gml': 'http://www.opengis.net/gml'
-        }
+    def skip(self, buildings, cache=None):
+        """
+        :param buildings: CitiEnGov instance (or any iterable of Building instances)
+        :param cache: DeltaCache instance, the skipped buildings are kept in it
+        :return: generator of the buildings not exported before the checkpoint
+        """
+        for bu in buildings:
+            if bu.UUID in self.done:
+                if cache is not None:
+                    cache.keep(bu.UUID)
+                continue
+            yield bu
+
+    def add(self, uuid, writers):
+        """
+        record an exported building, make a checkpoint every interval buildings
+
+        :param uuid: UUID of the building
+        :param writers: GMLWriter instances of the outputs
+        """
+        self.uuids.write(uuid.encode('utf-8') + b'\n')
+        self.pending += 1
+        if self.pending >= self.interval:
+            self.save(writers)
+
+    def save(self, writers):
+        """
+        :param writers: GMLWriter instances of the outputs
+        """
+        outputs = [list(writer.checkpoint()) for writer in writers]
+        self.uuids.flush()
+        os.fsync(self.uuids.fileno())
+        state = {'targets': self.targets, 'outputs': outputs, 'uuids_offset': self.uuids.tell(),
+                 'quarantine_offset': self.quarantine.checkpoint() if self.quarantine is not None else 0}
+        with open(self.checkpoint_path + '.tmp', 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+        self.pending = 0
+
+    def finish(self):
+        """
+        the export is complete, remove the checkpoint
+        """
+        self.uuids.close()
+        for path in (self.checkpoint_path, self.uuids_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-        # Get all feature members
-        self.feature_members = self.root.findall('./gml:featureMember', namespaces=self.namespaces)
 
-        # get all unique UUIDs
-        uuid_path = './gml:featureMember/CitiEnGov_01_1:GML_BUILDINGS_CEG/CitiEnGov_01_1:UUID'
-        list_of_uuids = [uuid.text for uuid in self.root.iterfind(uuid_path, namespaces=self.namespaces)]
-        self.building_UUIDs = list(set(list_of_uuids))  # get unique UUIDs
+class DeltaCache:
+    def __init__(self, cache_path, partial=False):
+        """
+        persistent cache of the translated buildings, keyed by UUID and the hash of the source features
 
-        # initiate first building object
-        self.UUID_index = 0
-        self.UUID = self.building_UUIDs[self.UUID_index]
-        self.building = self.get_building(self.UUID)
+        The cache is emptied of fragments when the script itself changes, as the mappings may have changed.
 
-    def get_building(self, uuid):
-        feature_list = [feature for feature in self.feature_members
-                        if feature.find('./CitiEnGov_01_1:GML_BUILDINGS_CEG/CitiEnGov_01_1:UUID',
-                                        namespaces=self.namespaces).text == uuid]
-        return Building(uuid=uuid, feature_list=feature_list, namespaces=self.namespaces)
+        :param cache_path: path of the sqlite database of the cache
+        :param partial: the buildings looked up are a selection of the input (--bbox, --where, --uuids), the
+            buildings left out are kept instead of being removed from the cache
+        """
+        import sqlite3
+        import hashlib
+        print('Opening cache: {path}'.format(path=cache_path))
+        # used by the translation stage of a pipeline too, never by two threads at the same time
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self.partial = partial
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS buildings (uuid TEXT PRIMARY KEY, hash TEXT);
+            CREATE TABLE IF NOT EXISTS fragments (uuid TEXT, standard TEXT, fragment TEXT,
+                                                  PRIMARY KEY (uuid, standard));
+            CREATE TEMP TABLE seen (uuid TEXT PRIMARY KEY);
+        ''')
+        with open(__file__, 'rb') as script:
+            script_hash = hashlib.sha1(script.read()).hexdigest()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'script'").fetchone()
+        if row is None or row[0] != script_hash:
+            self.connection.execute('DELETE FROM fragments')
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('script', ?)", (script_hash,))
+        self.statistics = {'added': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+
+    def lookup(self, bu, standards):
+        """
+        :param bu: Building instance
+        :param standards: list of Standard instances
+        :return: hash of the features of the building and the cached fragments for the standards,
+            None instead of the fragments if the building has to be translated
+        """
+        import hashlib
+        digest = hashlib.blake2b(bu.to_bytes(version=2), digest_size=16).hexdigest()
+        self.connection.execute('INSERT OR IGNORE INTO seen VALUES (?)', (bu.UUID,))
+        row = self.connection.execute('SELECT hash FROM buildings WHERE uuid = ?', (bu.UUID,)).fetchone()
+        if row is None:
+            self.statistics['added'] += 1
+            return digest, None
+        if row[0] != digest:
+            self.statistics['changed'] += 1
+            return digest, None
+
+        self.statistics['unchanged'] += 1
+        cached = dict(self.connection.execute('SELECT standard, fragment FROM fragments WHERE uuid = ?', (bu.UUID,)))
+        fragments = tuple(cached.get(standard.name) for standard in standards)
+        if None in fragments:
+            # the building was not exported to all these standards yet
+            return digest, None
+        return digest, fragments
+
+    def keep(self, uuid):
+        """
+        keep a building that is in the input but not looked up (e.g. exported before a checkpoint)
 
-    # make the class iterable so that it yields tha actual Building instance
-    def __iter__(self):
-        return self
+        :param uuid: UUID of the building
+        """
+        self.connection.execute('INSERT OR IGNORE INTO seen VALUES (?)', (uuid,))
 
-    def __next__(self):
+    def store(self, uuid, digest, standards, fragments):
+        """
+        :param uuid: UUID of the building
+        :param digest: hash of its features from lookup
+        :param standards: list of Standard instances
+        :param fragments: serialized members of the building for each standard
+        """
+        self.connection.execute('INSERT OR REPLACE INTO buildings VALUES (?, ?)', (uuid, digest))
+        self.connection.executemany('INSERT OR REPLACE INTO fragments VALUES (?, ?, ?)',
+                                    [(uuid, standard.name, fragment) for standard, fragment in zip(standards, fragments)])
+
+    def close(self):
+        """
+        drop the buildings that were not in the input (unless it was a selection), save the cache and print the
+        statistics of the run
+        """
+        if not self.partial:
+            self.connection.execute('DELETE FROM fragments WHERE uuid NOT IN (SELECT uuid FROM seen)')
+            self.statistics['removed'] = self.connection.execute(
+                'DELETE FROM buildings WHERE uuid NOT IN (SELECT uuid FROM seen)').rowcount
+        self.connection.commit()
+        self.connection.close()
+        print('Buildings added: {added}, changed: {changed}, unchanged: {unchanged}, removed: {removed}'.format(
+            **self.statistics))
+
+
+class Field:
+    def __init__(self, name, template=None, codelist=None, lower=False, default=None, optional=False):
+        """
+        value of a mapping table taken from a CitiEnGov attribute (the text of the first element)
+
+        :param name: name of the attribute, e.g. 'DATE_C_BEGINNING'
+        :param template: format string of the value with the text as {v}, e.g. '{v}-01-01T00:00:00'
+        :param codelist: name of the codelist dictionary of the translator the text is looked up in
+        :param lower: convert the text to lower case (before the codelist lookup)
+        :param default: text used when the attribute is missing
+        :param optional: no value (no xml attribute) when the attribute is missing instead of an error
+        """
+        self.name = name
+        self.template = template
+        self.codelist = codelist
+        self.lower = lower
+        self.default = default
+        self.optional = optional
+
+
+class Node:
+    def __init__(self, tag, text=None, attrib=None, children=(), when=None, copy=None):
+        """
+        element of a mapping table
+
+        :param tag: tag of the element as prefix:tag
+        :param text: text of the element, a constant string or a Field
+        :param attrib: dictionary of the attributes of the element, values are constant strings or Fields
+        :param children: list of the child Nodes
+        :param when: name of a CitiEnGov attribute, the element is only added if the building has it
+        :param copy: path of a CitiEnGov element whose text and attributes are copied (e.g. the footprint)
+        """
+        self.tag = tag
+        self.text = text
+        self.attrib = attrib or {}
+        self.children = children
+        self.when = when
+        self.copy = copy
+
+    def fields(self):
+        """
+        :return: set of the CitiEnGov attributes (and paths) used by the element and its children
+        """
+        fields = {value.name for value in [self.text] + list(self.attrib.values()) if isinstance(value, Field)}
+        fields.update(name for name in (self.when, self.copy) if name is not None)
+        for child in self.children:
+            fields |= child.fields()
+        return fields
+
+    def tags(self):
+        """
+        :return: set of the tags (and prefixed attribute names) as prefix:tag of the element and its children
+        """
+        tags = {self.tag} | {key for key in self.attrib if ':' in key}
+        for child in self.children:
+            tags |= child.tags()
+        return tags
+
+
+class Standard(ABC):
+    """
+    base of the output standards, subclasses prepare the namespace solver (nss), the root element,
+    the member_tag and the mappings and implement translate_building
+    """
+    name = None
+    vocabulary = ()
+    # tag of the bounding box of the document
+    bounded_by_tag = 'gml:boundedBy'
+    # Profiler instance measuring the translation
+    profiler = None
+
+    def register_namespaces(self):
+        """
+        register the namespaces of the standard to be used as prefixes in the output
+
+        ElementTree keeps a single global prefix map and the standards use the same prefixes for different uris
+        (e.g. gml), so this has to be done before serializing whenever another standard may have been serialized.
+        """
+        global _registered_namespaces
+        if _registered_namespaces is not self.nss.dict:
+            for prefix, uri in self.nss.dict.items():
+                eT.register_namespace(prefix=prefix, uri=uri)
+            _registered_namespaces = self.nss.dict
+
+    def write_to_file(self, target_path, sink=None):
+        # wrap the whole data into an ElementTree object
+        tree = eT.ElementTree(self.root)
+
+        # write out the data to the target file
+        print('Writing {std} gml to: {path}'.format(std=self.name, path=target_path))
+        self.register_namespaces()
+        sink = sink or OutputSink()
         try:
-            self.UUID = self.building_UUIDs[self.UUID_index]
-            self.building = self.get_building(self.UUID)
-            return self.building
-        except IndexError:
-            raise StopIteration
-        finally:
-            self.UUID_index += 1
+            with sink.open(target_path, temporary=True) as target:
+                tree.write(target, encoding='utf-8', xml_declaration=True, method='xml', short_empty_elements=True)
+        except BaseException:
+            sink.discard(target_path)
+            raise
+        sink.commit(target_path)
 
+    def translate(self, citi_en_gov):
 
-class Building:
-    def __init__(self, uuid, feature_list, namespaces):
-        self.UUID = uuid
-        self.feature_list = feature_list
-        self.namespaces = namespaces
+        print('Translating CitiEnGov to {std}.'.format(std=self.name))
 
-    def find(self, attribute, _all=False):
-        path = './CitiEnGov_01_1:GML_BUILDINGS_CEG/CitiEnGov_01_1:{attr}'.format(attr=attribute)
-        if _all:
-            # return a list of xml elements containing all not None features of the building
-            return [element.find(path, namespaces=self.namespaces)
-                    for element in self.feature_list
-                    if element.find(path, namespaces=self.namespaces) is not None]
+        # iterate on all buildings contained in the CitiEnGov gml:
+        for bu in citi_en_gov:
+            self.root.append(self.translate_building(bu))
+
+    def stream_to_file(self, citi_en_gov, target_path, workers=1, sink=None):
+        """
+        translate the buildings and write each of them to the target file right away instead of
+        building up the whole document in memory
+
+        :param citi_en_gov: CitiEnGov instance
+        :param target_path: path of the output gml
+        :param workers: number of processes translating the buildings
+        :param sink: OutputSink opening the target
+        """
+        print('Translating CitiEnGov to {std}, writing gml to: {path}'.format(std=self.name, path=target_path))
+        with self.open_writer(target_path, sink=sink) as writer:
+            for fragment in self.translate_fragments(citi_en_gov, workers=workers):
+                writer.write_fragment(fragment)
+
+    def translate_fragments(self, citi_en_gov, workers=1):
+        """
+        translate the buildings and serialize them one by one
+
+        :param citi_en_gov: CitiEnGov instance (or any iterable of Building instances)
+        :param workers: number of processes translating the buildings
+        :return: generator of the serialized members in the order of the buildings
+        """
+        for fragments in translate_buildings([self], citi_en_gov, workers=workers):
+            yield fragments[0]
+
+    @property
+    def document_prefixes(self):
+        """
+        :return: prefixes of the namespaces used in the vocabulary and the mapping table, declared on the root of a
+            streamed document even if no member uses them (e.g. gmd of INSPIRE without external references)
+        """
+        return sorted({full_tag.partition(':')[0] for full_tag in set(self.vocabulary) | self.table_tags})
+
+    @property
+    def table_tags(self):
+        """
+        :return: set of the tags as prefix:tag the nodes of the mapping table create
+        """
+        return set().union(*(node.tags() for name, nodes in self.mapping_table if not isinstance(nodes, str)
+                             for node in nodes))
+
+    def open_writer(self, target_path, sink=None, resume=None, keep_partial=False):
+        """
+        :param target_path: path of the output gml
+        :param sink: OutputSink opening the target
+        :param resume: writer state from a checkpoint to continue the output from
+        :param keep_partial: keep the unfinished output of a failed export to resume it from a checkpoint
+        :return: GMLWriter for the document of the standard
+        """
+        self.register_namespaces()
+        return GMLWriter(target_path, self.root, [self.nss.dict[prefix] for prefix in self.document_prefixes],
+                         sink=sink, resume=resume, keep_partial=keep_partial)
+
+    def failed_mapping(self, bu):
+        """
+        find the mapping a building fails in by running the mappings one by one
+
+        :param bu: Building instance
+        :return: name of the first failing mapping or None
+        """
+        building = eT.Element('building')
+        for name, mapping in self.mappings:
+            try:
+                mapping(bu, building)
+            except Exception:
+                return name
+        return None
+
+    def new_document(self):
+        """
+        prepare the translator for the next document, so that it can be reused instead of creating a new one
+        """
+        del self.root[:]
+
+    def bounded_by(self, bbox):
+        """
+        :param bbox: bounding box (min x, min y, max x, max y)
+        :return: boundedBy element of the document with the envelope of the bounding box
+        """
+        bounded_by = eT.Element(self.nss.solve(self.bounded_by_tag))
+        envelope = eT.SubElement(bounded_by, self.nss.solve('gml:Envelope'))
+        envelope.attrib = {'srsDimension': '2'}
+        lower_corner = eT.SubElement(envelope, self.nss.solve('gml:lowerCorner'))
+        lower_corner.text = '{x!r} {y!r}'.format(x=bbox[0], y=bbox[1])
+        upper_corner = eT.SubElement(envelope, self.nss.solve('gml:upperCorner'))
+        upper_corner.text = '{x!r} {y!r}'.format(x=bbox[2], y=bbox[3])
+        return bounded_by
+
+    @CachedProperty
+    def mappings(self):
+        """
+        mappings of the CitiEnGov attributes to the building in the order of the output, compiled from the mapping
+        table the first time they are used
+        """
+        return self.compile_mappings(self.mapping_table)
+
+    @CachedProperty
+    def build_building(self):
+        """
+        function adding the elements of the whole mapping table to a building, compiled the first time it is used
+        (the tags of the vocabulary are resolved along with it)
+        """
+        self.nss.prepare(self.vocabulary)
+        return self.compile_function([mapping for name, mapping in self.mapping_table], 'building')
+
+    def compile_mappings(self, mapping_table):
+        """
+        compile the mapping table of the standard into the functions run on every building, one for each mapping
+        (profiled one by one), the whole table is compiled into build_building
+
+        :param mapping_table: list of (name, mapping) tuples, mapping being a list of Nodes or the name of a method
+            of the translator for the mappings that do not fit in a table
+        :return: list of (name, function(bu, building)) tuples
+        """
+        return [(name, getattr(self, mapping) if isinstance(mapping, str) else self.compile_function([mapping], name))
+                for name, mapping in mapping_table]
+
+    def compile_function(self, mappings, name):
+        """
+        generate the source of a function adding the elements of the mappings to a building and compile it: the tags,
+        templates and constants are written into the code and each attribute of the building is looked up once
+
+        The source is compiled as the file <mapping STANDARD.NAME> and kept in linecache, so that the tracebacks of
+        the errors in a mapping show its lines.
+
+        :param mappings: list of mappings, each a list of Nodes or the name of a method of the translator
+        :param name: name of the mapping (or 'building' for the whole table)
+        :return: function(bu, building) adding the elements of the mappings to a building
+        """
+        fields = sorted(set().union(*(node.fields() for nodes in mappings if not isinstance(nodes, str)
+                                      for node in nodes)))
+        variables = {field: 'v{n}'.format(n=n) for n, field in enumerate(fields)}
+        names = {'sub_element': eT.SubElement}
+        lines = ['def mapping(bu, building):']
+        lines += ['    {v} = bu.find({f!r})'.format(v=variables[field], f=field) for field in fields]
+        elements = iter(range(1 << 30))
+        for nodes in mappings:
+            if isinstance(nodes, str):
+                names[nodes] = getattr(self, nodes)
+                lines.append('    {m}(bu, building)'.format(m=nodes))
+                continue
+            for node in nodes:
+                self.compile_node(node, 'building', 1, lines, variables, names, elements)
+        source = '\n'.join(lines) + '\n'
+        filename = '<mapping {std}.{name}>'.format(std=self.name, name=name)
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        exec(compile(source, filename, 'exec'), names)
+        mapping = names['mapping']
+        mapping.source = source
+        return mapping
+
+    def compile_node(self, node, parent, depth, lines, variables, names, elements):
+        """
+        add the lines creating the element of a node (and its children) to the source of a mapping
+
+        :param node: Node of the mapping table
+        :param parent: variable of the parent element
+        :param depth: indentation level of the lines
+        :param lines: list of the lines of the source
+        :param variables: dictionary of CitiEnGov attribute -> variable of its element
+        :param names: dictionary of the names used by the source (codelists)
+        :param elements: iterator of the numbers of the element variables
+        """
+        indent = '    ' * depth
+        if node.when is not None:
+            lines.append('{i}if {v} is not None:'.format(i=indent, v=variables[node.when]))
+            indent += '    '
+        element = 'e{n}'.format(n=next(elements))
+        attrib = [(self.nss.solve(key) if ':' in key else key, value) for key, value in node.attrib.items()]
+        optional = any(isinstance(value, Field) and value.optional and value.default is None
+                       for key, value in attrib)
+        if attrib and not optional:
+            lines.append('{i}{e} = sub_element({p}, {t!r}, {{{a}}})'.format(
+                i=indent, e=element, p=parent, t=self.nss.solve(node.tag), a=', '.join(
+                    '{k!r}: {v}'.format(k=key, v=self.value_source(value, variables, names)) for key, value in attrib)))
         else:
-            # return the first not None feature of the building as an xml element
-            for feature in self.feature_list:
-                feature_attrib = feature.find(path, namespaces=self.namespaces)
-                if feature_attrib is not None:
-                    return feature_attrib
-            else:
-                # if no feature was found for that attribute, return None:
-                return None
+            lines.append('{i}{e} = sub_element({p}, {t!r})'.format(i=indent, e=element, p=parent,
+                                                                   t=self.nss.solve(node.tag)))
+            for key, value in attrib:
+                self.optional_source(value, ('{e}.set({k!r}, '.format(e=element, k=key), ')'), indent, lines,
+                                     variables, names)
+        if node.copy is not None:
+            lines.append('{i}{e}.attrib = dict({v}.attrib)'.format(i=indent, e=element, v=variables[node.copy]))
+            lines.append('{i}{e}.text = {v}.text'.format(i=indent, e=element, v=variables[node.copy]))
+        if node.text is not None:
+            self.optional_source(node.text, ('{e}.text = '.format(e=element), ''), indent, lines, variables, names)
+        for child in node.children:
+            self.compile_node(child, element, len(indent) // 4, lines, variables, names, elements)
+
+    def optional_source(self, value, statement, indent, lines, variables, names):
+        # statement: source before and after the value, skipped when an optional field is missing
+        if isinstance(value, Field) and value.optional and value.default is None:
+            lines.append('{i}if {v} is not None:'.format(i=indent, v=variables[value.name]))
+            indent += '    '
+        lines.append(indent + statement[0] + self.value_source(value, variables, names) + statement[1])
+
+    def value_source(self, value, variables, names):
+        """
+        :param value: constant string or Field
+        :param variables: dictionary of CitiEnGov attribute -> variable of its element
+        :param names: dictionary of the names used by the source, the codelists are added to it
+        :return: python expression of the value
+        """
+        if not isinstance(value, Field):
+            return repr(value)
+        source = '{v}.text'.format(v=variables[value.name])
+        if value.default is not None:
+            source = '({v}.text if {v} is not None else {d!r})'.format(v=variables[value.name], d=value.default)
+        if value.lower:
+            source += '.lower()'
+        if value.codelist is not None:
+            names[value.codelist] = getattr(self, value.codelist)
+            source = '{c}[{s}]'.format(c=value.codelist, s=source)
+        if value.template is not None:
+            source = '{t!r}.format(v={s})'.format(t=value.template, s=source)
+        return source
+
+    @abstractmethod
+    def translate_building(self, bu):
+        """
+        :param bu: Building instance
+        :return: the member element of the building
+        """
 
+    def map_building(self, bu, building):
+        """
+        add the elements of the building with the mappings of the standard
+
+        :param bu: Building instance
+        :param building: building element of the output
+        """
+        if self.profiler is None:
+            self.build_building(bu, building)
+            return
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        for name, mapping in self.mappings:
+            start = time.perf_counter()
+            mapping(bu, building)
+            self.profiler.add_mapping(self.name, name, time.perf_counter() - start)
+        self.profiler.add_stage('translate ' + self.name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+# namespace dictionary of the standard last registered in ElementTree
+_registered_namespaces = None
+# translators of a worker process of translate_buildings
+_worker_standards = None
+
+
+def translate_buildings(standards, buildings, workers=1, chunk_size=64, cache=None, tolerant=False):
+    """
+    translate each building to all the standards and serialize the results
+
+    With more than one worker the buildings are sent in chunks to a process pool, the results
+    are still yielded in the order of the buildings.
+
+    :param standards: list of Standard instances
+    :param buildings: CitiEnGov instance (or any iterable of Building instances)
+    :param workers: number of processes translating the buildings
+    :param chunk_size: number of buildings sent to a worker at once
+    :param cache: DeltaCache instance, only new and changed buildings are translated
+    :param tolerant: a building failing to translate to a standard gets a quarantine record (see quarantine_record)
+        in place of its member instead of stopping the translation
+    :return: generator of tuples of serialized members, one member for each standard
+    """
+    if workers <= 1:
+        for bu in buildings:
+            if cache is None or bu.failure is not None:
+                yield _translate(standards, bu, tolerant)
+                continue
+            digest, fragments = cache.lookup(bu, standards)
+            if fragments is None:
+                fragments = _translate(standards, bu, tolerant)
+                if not any(isinstance(fragment, dict) for fragment in fragments):
+                    cache.store(bu.UUID, digest, standards, fragments)
+            yield fragments
+        return
+
+    def collect(entries, future):
+        translated = iter(future.result())
+        for uuid, digest, fragments in entries:
+            if fragments is None:
+                fragments = next(translated)
+                if cache is not None and not any(isinstance(fragment, dict) for fragment in fragments):
+                    cache.store(uuid, digest, standards, fragments)
+            yield fragments
+
+    from concurrent.futures import ProcessPoolExecutor
+    standard_classes = [type(standard) for standard in standards]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(standard_classes,)) as executor:
+        # keep a limited number of chunks in flight so that a streamed input is not read ahead entirely
+        pending = deque()
+        entries = []
+        chunk = []
+        for bu in buildings:
+            if bu.failure is not None:
+                # the stage that failed ran in this process, the records are made here
+                digest, fragments = None, _translate(standards, bu, tolerant)
+            else:
+                digest, fragments = cache.lookup(bu, standards) if cache is not None else (None, None)
+            if fragments is None:
+                # only the buildings not found in the cache are sent to the workers
+                chunk.append((bu.UUID, bu.to_bytes()))
+            entries.append((bu.UUID, digest, fragments))
+            if len(entries) == chunk_size:
+                pending.append((entries, executor.submit(_translate_chunk, chunk, bu.namespaces, tolerant)))
+                entries = []
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    yield from collect(*pending.popleft())
+        if entries:
+            pending.append((entries, executor.submit(_translate_chunk, chunk, bu.namespaces, tolerant)))
+        while pending:
+            yield from collect(*pending.popleft())
+
+
+def _translate(standards, bu, tolerant=False):
+    fragments = []
+    for standard in standards:
+        member = translate_member(standard, bu, tolerant)
+        if isinstance(member, dict):
+            fragments.append(member)
+            continue
+        standard.register_namespaces()
+        with profile_stage(standard.profiler, 'serialize'):
+            fragments.append(serialize_member(member))
+    return tuple(fragments)
+
+
+def translate_member(standard, bu, tolerant=False):
+    """
+    :param standard: Standard instance
+    :param bu: Building instance
+    :param tolerant: return a quarantine record instead of raising if the translation fails
+    :return: the member element of the building or the quarantine record
+    """
+    if bu.failure is not None:
+        # failed a processing stage
+        return dict(bu.failure, standard=standard.name)
+    if not tolerant:
+        return standard.translate_building(bu)
+    try:
+        return standard.translate_building(bu)
+    except Exception as exception:
+        return quarantine_record(standard, bu, exception)
+
+
+def quarantine_record(standard, bu, exception):
+    """
+    :param standard: Standard instance the building failed to translate to
+    :param bu: Building instance
+    :param exception: the exception raised by the translation
+    :return: dictionary of the UUID, the standard, the failing mapping and the exception
+    """
+    return {
+        'uuid': bu.UUID,
+        'standard': standard.name,
+        'mapping': standard.failed_mapping(bu),
+        'exception': type(exception).__name__,
+        'message': str(exception)
+    }
+
+
+def stage_failure(stage, bu, exception):
+    """
+    :param stage: name of the processing stage
+    :param bu: Building instance
+    :param exception: the exception raised by the stage
+    :return: quarantine record of the building, the standard is filled in by translate_member
+    """
+    return {
+        'uuid': bu.UUID,
+        'standard': None,
+        'mapping': '{stage} stage'.format(stage=stage),
+        'exception': type(exception).__name__,
+        'message': str(exception)
+    }
+
+
+def _start_worker(standard_classes):
+    global _worker_standards
+    _worker_standards = [standard_class() for standard_class in standard_classes]
+
+
+def _translate_chunk(chunk, namespaces, tolerant=False):
+    """
+    translate serialized buildings in a worker process
+
+    :param chunk: list of (UUID, serialized features) tuples
+    :param namespaces: namespaces of the CitiEnGov gml
+    :param tolerant: quarantine the buildings failing to translate
+    :return: list of tuples of the serialized members
+    """
+    return [_translate(_worker_standards, Building.from_bytes(uuid, features, namespaces), tolerant)
+            for uuid, features in chunk]
+
+
+class Inspire(Standard):
+    name = 'INSPIRE'
+    bounded_by_tag = 'wfs:boundedBy'
+    # every tag of the standard, resolved at once when the mappings are first used (see Standard.build_building)
+    vocabulary = (
+        'xsi:schemaLocation', 'wfs:FeatureCollection', 'wfs:member', 'bu-core2d:Building',
+        'bu-base:beginLifespanVersion', 'bu-base:conditionOfConstruction', 'xlink:href',
+        'bu-base:dateOfConstruction', 'bu-base:DateOfEvent', 'bu-base:beginning', 'bu-base:end',
+        'bu-base:externalReference', 'bu-base:ExternalReference', 'bu-base:informationSystem',
+        'bu-base:informationSystemName', 'gmd:LocalisedCharacterString', 'bu-base:reference',
+        'bu-base:heightAboveGround', 'bu-base:HeightAboveGround', 'bu-base:heightReference',
+        'bu-base:lowReference', 'bu-base:status', 'bu-base:value', 'bu-base:inspireId', 'base:Identifier',
+        'base:localId', 'base:namespace', 'bu-base:buildingNature', 'bu-base:currentUse', 'bu-base:CurrentUse',
+        'bu-base:percentage', 'bu-base:numberOfBuildingUnits', 'bu-base:numberOfFloorsAboveGround',
+        'bu-core2d:geometry2D', 'bu-base:BuildingGeometry2D', 'bu-base:geometry', 'bu-base:referenceGeometry',
+        'bu-base:horizontalGeometryReference', 'bu-base:horizontalGeometryEstimatedAccuracy', 'gml:Polygon',
+        'gml:exterior', 'gml:LinearRing', 'gml:coordinates'
+    )
+
+    # mappings of the CitiEnGov attributes to the building, compiled on first use (see Standard.mappings)
+    mapping_table = [
+        ('LIFESPAN_BEGINNING', [
+            Node('bu-base:beginLifespanVersion', text=Field('LIFESPAN_BEGINNING', template='{v}-01-01T00:00:00'))
+        ]),
+        ('CONDITION_OF_CONSTRUCTION', [
+            Node('bu-base:conditionOfConstruction', attrib={
+                'xlink:href': Field('CONDITION', lower=True, codelist='condition_of_construction_dict',
+                                    optional=True)})
+        ]),
+        ('DATE_OF_CONSTRUCTION', [
+            Node('bu-base:dateOfConstruction', when='DATE_C_BEGINNING', children=[
+                Node('bu-base:DateOfEvent', children=[
+                    Node('bu-base:beginning', text=Field('DATE_C_BEGINNING', template='{v}-01-01T00:00:00')),
+                    Node('bu-base:end', when='DATE_C_END',
+                         text=Field('DATE_C_BEGINNING', template='{v}-01-01T00:00:00'))
+                ])
+            ])
+        ]),
+        ('DATE_OF_RENOVATION', [
+            Node('bu-base:dateOfConstruction', when='DATE_R_BEGINNING', children=[
+                Node('bu-base:DateOfEvent', children=[
+                    Node('bu-base:beginning', text=Field('DATE_R_BEGINNING', template='{v}-01-01T00:00:00')),
+                    Node('bu-base:end', when='DATE_R_END',
+                         text=Field('DATE_R_BEGINNING', template='{v}-01-01T00:00:00'))
+                ])
+            ])
+        ]),
+        ('EXTERNAL_REFERENCE', [
+            Node('bu-base:externalReference', when='EXT_REF_REFERENCE', children=[
+                Node('bu-base:ExternalReference', children=[
+                    Node('bu-base:informationSystem', text=Field('EXT_REF_IDENTIFIER')),
+                    Node('bu-base:informationSystemName', children=[
+                        Node('gmd:LocalisedCharacterString', text=Field('EXT_REF_INF_SYS_NAME'))
+                    ]),
+                    Node('bu-base:reference', text=Field('EXT_REF_REFERENCE'))
+                ])
+            ])
+        ]),
+        ('HEIGHT_ABOVE_GROUND', [
+            Node('bu-base:heightAboveGround', when='HEIGHT_HEIGHT_VAL', children=[
+                Node('bu-base:HeightAboveGround', children=[
+                    Node('bu-base:heightReference', attrib={
+                        'xlink:href': Field('HEIGHT_HEIGHT_REF', lower=True, default='generalroof',
+                                            codelist='elevation_reference_dict')}),
+                    Node('bu-base:lowReference'),
+                    # TODO get list of possible values HEIGHT STATUS
+                    Node('bu-base:status', attrib={
+                        'xlink:href': Field('HEIGHT_HEIGHT_STAT', lower=True, codelist='height_status_dict')}),
+                    Node('bu-base:value', attrib={'uom': 'm'}, text=Field('HEIGHT_HEIGHT_VAL'))
+                ])
+            ])
+        ]),
+        ('ID', [
+            Node('bu-base:inspireId', children=[
+                Node('base:Identifier', children=[
+                    Node('base:localId', text=Field('IDENTIFIER_ID_LOC')),
+                    Node('base:namespace', text=Field('IDENTIFIER_ID_NAME'))
+                ])
+            ])
+        ]),
+        ('BUILDING_NATURE', [
+            Node('bu-base:buildingNature', when='BUILDINGTYPE', attrib={
+                'xlink:href': Field('BUILDINGTYPE', lower=True, codelist='building_nature_dict')})
+        ]),
+        ('CURRENT_USE', 'map_current_use'),
+        ('NUMBER_OF_BUILDING_UNITS', [
+            Node('bu-base:numberOfBuildingUnits', when='UNITS', text=Field('UNITS'))
+        ]),
+        ('NUMBER_OF_FLOORS_ABOVE_GROUND', [
+            Node('bu-base:numberOfFloorsAboveGround', when='FLOORS', text=Field('FLOORS'))
+        ]),
+        ('GEOMETRY', [
+            Node('bu-core2d:geometry2D', children=[
+                Node('bu-base:BuildingGeometry2D', children=[
+                    Node('bu-base:geometry', children=[
+                        Node('gml:Polygon', children=[
+                            Node('gml:exterior', children=[
+                                Node('gml:LinearRing', children=[
+                                    Node('gml:coordinates', copy='GEOMETRY2D/gml:Polygon/gml:outerBoundaryIs/'
+                                                                 'gml:LinearRing/gml:coordinates')
+                                ])
+                            ])
+                        ])
+                    ]),
+                    Node('bu-base:referenceGeometry', text='false'),
+                    Node('bu-base:horizontalGeometryReference'),
+                    Node('bu-base:horizontalGeometryEstimatedAccuracy', attrib={'uom': '!'}, text='0')
+                ])
+            ])
+        ])
+    ]
 
-class Inspire:
     def __init__(self):
         # Prepare the INSPIRE namespaces dictionary
         inspire_ns = {
@@ -120,37 +2840,65 @@ class Inspire:
         }
         self.nss = NameSpaceSolver(inspire_ns)
 
-        # register namespaces to include it in the output file
-        for prefix, uri in inspire_ns.items():
-            eT.register_namespace(prefix=prefix, uri=uri)
+        # prepare root element attributes:
+        root_attrib = {
+            'xmlns': 'http://www.opengis.net/wfs',
+            'numberMatched': 'unknown',
+            'numberReturned': '1000',
+            'timeStamp': '{ts}'.format(ts=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')),
+            self.nss.solve('xsi:schemaLocation'): ('http://www.opengis.net/wfs/2.0 '
+                                                   'http://schemas.opengis.net/wfs/2.0/wfs.xsd '
+                                                   'http://www.opengis.net/gml/3.2 '
+                                                   'http://schemas.opengis.net/gml/3.2.1/gml.xsd '
+                                                   'http://inspire.ec.europa.eu/schemas/bu-core2d/4.0 '
+                                                   'https://inspire.ec.europa.eu/schemas/bu-core2d/4.0/BuildingsCore2D.xsd')
+        }
+
+        # create root element
+        self.root = eT.Element(self.nss.solve('wfs:FeatureCollection'))
+        self.root.attrib = root_attrib
+
+        # tag of the elements wrapping the buildings
+        self.member_tag = self.nss.solve('wfs:member')
 
-        # Prepare INSPIRE CodeLists:
-        # http://inspire.ec.europa.eu/codelist/ConditionOfConstructionValue
-        self.condition_of_construction_dict = {
+    # INSPIRE codelists, built the first time they are looked up
+
+    # http://inspire.ec.europa.eu/codelist/ConditionOfConstructionValue
+    @CachedProperty
+    def condition_of_construction_dict(self):
+        return {
             'functional': 'http://inspire.ec.europa.eu/codelist/ConditionOfConstructionValue/functional',
             # TODO get list of possible values CONDITION OF CONSTRUCTION
         }
 
-        # http://inspire.ec.europa.eu/codelist/ElevationReferenceValue
-        self.elevation_reference_dict = {
+    # http://inspire.ec.europa.eu/codelist/ElevationReferenceValue
+    @CachedProperty
+    def elevation_reference_dict(self):
+        return {
             'generalroof': 'http://inspire.ec.europa.eu/codelist/ElevationReferenceValue/generalRoof'
             # TODO get list of possible values ELEVATION REFERENCE
         }
 
-        # http://inspire.ec.europa.eu/codelist/HeightStatusValue
-        self.height_status_dict = {
+    # http://inspire.ec.europa.eu/codelist/HeightStatusValue
+    @CachedProperty
+    def height_status_dict(self):
+        return {
             'stimata': 'http://inspire.ec.europa.eu/codelist/HeightStatusValue/estimated',
             # 'measured': 'http://inspire.ec.europa.eu/codelist/HeightStatusValue/measured'
         }
 
-        # http://inspire.ec.europa.eu/codelist/BuildingNatureValue
-        self.building_nature_dict = {
+    # http://inspire.ec.europa.eu/codelist/BuildingNatureValue
+    @CachedProperty
+    def building_nature_dict(self):
+        return {
             # TODO possible values from inspire codelist and citiengov codelist
         }
 
-        # http://inspire.ec.europa.eu/codelist/CurrentUseValue
-        # TODO extend list of current uses
-        self.current_use_dict = {
+    # http://inspire.ec.europa.eu/codelist/CurrentUseValue
+    # TODO extend list of current uses
+    @CachedProperty
+    def current_use_dict(self):
+        return {
             'ausiliario': 'http://inspire.ec.europa.eu/codelist/CurrentUseValue/ancillary',
             'negozio': 'http://inspire.ec.europa.eu/codelist/CurrentUseValue/trade',
             'residenziale': 'http://inspire.ec.europa.eu/codelist/CurrentUseValue/residential',
@@ -159,183 +2907,196 @@ class Inspire:
             'ausiliario': 'http://inspire.ec.europa.eu/codelist/CurrentUseValue/ancillary'
         }
 
-        # http://inspire.ec.europa.eu/codelist/HorizontalGeometryReferenceValue
-        self.horizontal_geometry_reference_dict = {
+    # http://inspire.ec.europa.eu/codelist/HorizontalGeometryReferenceValue
+    @CachedProperty
+    def horizontal_geometry_reference_dict(self):
+        return {
             # TODO horizontal geom reference values - not in use
         }
 
-        # prepare root element attributes:
-        root_attrib = {
-            'xmlns': 'http://www.opengis.net/wfs',
-            'numberMatched': 'unknown',
-            'numberReturned': '1000',
-            'timeStamp': '{ts}'.format(ts=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')),
-            self.nss.solve('xsi:schemaLocation'): ('http://www.opengis.net/wfs/2.0 '
-                                                   'http://schemas.opengis.net/wfs/2.0/wfs.xsd '
-                                                   'http://www.opengis.net/gml/3.2 '
-                                                   'http://schemas.opengis.net/gml/3.2.1/gml.xsd '
-                                                   'http://inspire.ec.europa.eu/schemas/bu-core2d/4.0 '
-                                                   'https://inspire.ec.europa.eu/schemas/bu-core2d/4.0/BuildingsCore2D.xsd')
-        }
-
-        # create root element
-        self.root = eT.Element(self.nss.solve('wfs:FeatureCollection'))
-        self.root.attrib = root_attrib
-
-    def write_to_file(self, target_path):
-        # wrap the whole data into an ElementTree object
-        tree = eT.ElementTree(self.root)
-
-        # write out the data to the target file
-        print('Writing INSPIRE gml to: {path}'.format(path=target_path))
-        tree.write(target_path, encoding='utf-8', xml_declaration=True, method='xml', short_empty_elements=True)
-
-    def translate(self, citi_en_gov):
+    def new_document(self):
+        super().new_document()
+        self.root.set('timeStamp', '{ts}'.format(ts=datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')))
 
-        print('Translating CitiEnGov to INSPIRE.')
+    def translate_building(self, bu):
+        """
+        translate a single building
 
-        # iterate on all buildings contained in the CitiEnGov gml:
-        for bu in citi_en_gov:
+        :param bu: Building instance
+        :return: the wfs:member element of the building
+        """
 
-            # add a member to the list
-            wfs_member = eT.SubElement(self.root, self.nss.solve('wfs:member'))
-
-            # add building element
-            bu_core2d_building = eT.SubElement(wfs_member, self.nss.solve('bu-core2d:Building'))
-
-            # add elements to the building
-            # LIFESPAN_BEGINNING
-            begin_lifespan_version = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:beginLifespanVersion'))
-            l_year = bu.find('LIFESPAN_BEGINNING').text
-            begin_lifespan_version.text = '{y}-01-01T00:00:00'.format(y=l_year)
-
-            # CONDITION_OF_CONSTRUCTION
-            condition_of_construction = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:conditionOfConstruction'))
-            if bu.find('CONDITION')is not None:
-                cond = bu.find('CONDITION').text.lower()
-                condition_of_construction.attrib = {
-                    self.nss.solve('xlink:href'): self.condition_of_construction_dict[cond]}
-
-            # DATE_OF_CONSTRUCTION
-            if bu.find('DATE_C_BEGINNING') is not None:
-                date_of_construction = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:dateOfConstruction'))
-                date_of_event = eT.SubElement(date_of_construction, self.nss.solve('bu-base:DateOfEvent'))
-                beginning = eT.SubElement(date_of_event, self.nss.solve('bu-base:beginning'))
-                c_year_b = bu.find('DATE_C_BEGINNING').text
-                beginning.text = '{y}-01-01T00:00:00'.format(y=c_year_b)
-                if bu.find('DATE_C_END') is not None:
-                    end = eT.SubElement(date_of_event, self.nss.solve('bu-base:end'))
-                    c_year_e = bu.find('DATE_C_BEGINNING').text
-                    end.text = '{y}-01-01T00:00:00'.format(y=c_year_e)
-
-            # DATE_OF_RENOVATION
-            if bu.find('DATE_R_BEGINNING') is not None:
-                date_of_renovation = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:dateOfConstruction'))
-                date_of_event_r = eT.SubElement(date_of_renovation, self.nss.solve('bu-base:DateOfEvent'))
-                beginning_r = eT.SubElement(date_of_event_r, self.nss.solve('bu-base:beginning'))
-                r_year_b = bu.find('DATE_R_BEGINNING').text
-                beginning_r.text = '{y}-01-01T00:00:00'.format(y=r_year_b)
-                if bu.find('DATE_R_END') is not None:
-                    end_r = eT.SubElement(date_of_event_r, self.nss.solve('bu-base:end'))
-                    r_year_e = bu.find('DATE_R_BEGINNING').text
-                    end_r.text = '{y}-01-01T00:00:00'.format(y=r_year_e)
-
-            # EXTERNAL_REFERENCE
-            if bu.find('EXT_REF_REFERENCE') is not None:
-                external_reference = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:externalReference'))
-                external_ref = eT.SubElement(external_reference, self.nss.solve('bu-base:ExternalReference'))
-                info_system = eT.SubElement(external_ref, self.nss.solve('bu-base:informationSystem'))
-                info_system.text = bu.find('EXT_REF_IDENTIFIER').text
-                info_system_name = eT.SubElement(external_ref, self.nss.solve('bu-base:informationSystemName'))
-                loc_char_str = eT.SubElement(info_system_name, self.nss.solve('gmd:LocalisedCharacterString'))
-                loc_char_str.text = bu.find('EXT_REF_INF_SYS_NAME').text
-                external_ref_ref = eT.SubElement(external_ref, self.nss.solve('bu-base:reference'))
-                external_ref_ref.text = bu.find('EXT_REF_REFERENCE').text
-
-            # HEIGHT_ABOVE_GROUND
-            if bu.find('HEIGHT_HEIGHT_VAL') is not None:
-                height_above_ground = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:heightAboveGround'))
-                height_ab_gr = eT.SubElement(height_above_ground, self.nss.solve('bu-base:HeightAboveGround'))
-                height_reference = eT.SubElement(height_ab_gr, self.nss.solve('bu-base:heightReference'))
-                if bu.find('HEIGHT_HEIGHT_REF') is not None:
-                    height_ref = bu.find('HEIGHT_HEIGHT_REF').text.lower()
-                else:
-                    height_ref = 'generalroof'
-                height_reference.attrib = {self.nss.solve('xlink:href'): self.elevation_reference_dict[height_ref]}
-                low_reference = eT.SubElement(height_ab_gr, self.nss.solve('bu-base:lowReference'))
-                height_status = eT.SubElement(height_ab_gr, self.nss.solve('bu-base:status'))
-                # TODO get list of possible values HEIGHT STATUS
-                height_stat = bu.find('HEIGHT_HEIGHT_STAT').text.lower()
-                height_status.attrib = {self.nss.solve('xlink:href'): self.height_status_dict[height_stat]}
-                height_value = eT.SubElement(height_ab_gr, self.nss.solve('bu-base:value'))
-                height_value.attrib = {'uom': 'm'}
-                height_value.text = bu.find('HEIGHT_HEIGHT_VAL').text
-
-            # ID
-            inspire_id = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:inspireId'))
-            identifier = eT.SubElement(inspire_id, self.nss.solve('base:Identifier'))
-            local_id = eT.SubElement(identifier, self.nss.solve('base:localId'))
-            namespace = eT.SubElement(identifier, self.nss.solve('base:namespace'))
-            local_id.text = bu.find('IDENTIFIER_ID_LOC').text
-            namespace.text = bu.find('IDENTIFIER_ID_NAME').text
-
-            # BUILDING_NATURE
-            if bu.find('BUILDINGTYPE') is not None:
-                building_nature = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:buildingNature'))
-                building_nat = bu.find('BUILDINGTYPE').text.lower()
-                building_nature.attrib = {self.nss.solve('xlink:href'): self.building_nature_dict[building_nat]}
-
-            # CURRENT_USE
-            if bu.find('USE_M') is not None:
-                # divide the long string into a list of uses with percentages
-                uses = bu.find('USE_M').text.split(',')
-                for use in uses:
-                    current_use = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:currentUse'))
-                    current_us = eT.SubElement(current_use, self.nss.solve('bu-base:CurrentUse'))
-                    current_u = eT.SubElement(current_us, self.nss.solve('bu-base:currentUse'))
-                    percentage = eT.SubElement(current_us, self.nss.solve('bu-base:percentage'))
-                    # separate use and percentage and get rid of parentheses
-                    curr_use, sep, percent = use.partition('(')
-                    percent = percent.strip('%)')
-                    current_u.attrib = {self.nss.solve('xlink:href'): self.current_use_dict[curr_use]}
-                    percentage.text = percent
-
-            # NUMBER_OF_BUILDING_UNITS
-            if bu.find('UNITS') is not None:
-                number_of_building_units = eT.SubElement(bu_core2d_building,
-                                                         self.nss.solve('bu-base:numberOfBuildingUnits'))
-                number_of_building_units.text = bu.find('UNITS').text
-
-            # NUMBER_OF_FLOORS_ABOVE_GROUND
-            if bu.find('FLOORS') is not None:
-                number_of_floors = eT.SubElement(bu_core2d_building,
-                                                 self.nss.solve('bu-base:numberOfFloorsAboveGround'))
-                number_of_floors.text = bu.find('FLOORS').text
-
-            # GEOMETRY
-            geometry_2d = eT.SubElement(bu_core2d_building, self.nss.solve('bu-core2d:geometry2D'))
-            building_geometry_2d = eT.SubElement(geometry_2d, self.nss.solve('bu-base:BuildingGeometry2D'))
-            geometry = eT.SubElement(building_geometry_2d, self.nss.solve('bu-base:geometry'))
-            reference_geometry = eT.SubElement(building_geometry_2d, self.nss.solve('bu-base:referenceGeometry'))
-            horizontal_geom_ref = eT.SubElement(building_geometry_2d,
-                                                self.nss.solve('bu-base:horizontalGeometryReference'))
-            horizontal_geom_est_acc = eT.SubElement(building_geometry_2d,
-                                                    self.nss.solve('bu-base:horizontalGeometryEstimatedAccuracy'))
-            polygon = eT.SubElement(geometry, self.nss.solve('gml:Polygon'))
-            exterior = eT.SubElement(polygon, self.nss.solve('gml:exterior'))
-            linear_ring = eT.SubElement(exterior, self.nss.solve('gml:LinearRing'))
-            coordinates = eT.SubElement(linear_ring, self.nss.solve('gml:coordinates'))
-            co = bu.find('GEOMETRY2D/gml:Polygon/gml:outerBoundaryIs/gml:LinearRing/gml:coordinates')
-            coordinates.attrib = co.attrib
-            coordinates.text = co.text
-
-            reference_geometry.text = 'false'
-            horizontal_geom_est_acc.attrib = {'uom': '!'}
-            horizontal_geom_est_acc.text = '0'
-
-
-
-class CityGML:
+        # add a member to the list
+        wfs_member = eT.Element(self.member_tag)
+
+        # add building element
+        bu_core2d_building = eT.SubElement(wfs_member, self.nss.solve('bu-core2d:Building'))
+
+        # add elements to the building
+        self.map_building(bu, bu_core2d_building)
+
+        return wfs_member
+
+    def map_current_use(self, bu, bu_core2d_building):
+        if bu.find('USE_M') is not None:
+            # divide the long string into a list of uses with percentages
+            uses = bu.find('USE_M').text.split(',')
+            for use in uses:
+                current_use = eT.SubElement(bu_core2d_building, self.nss.solve('bu-base:currentUse'))
+                current_us = eT.SubElement(current_use, self.nss.solve('bu-base:CurrentUse'))
+                current_u = eT.SubElement(current_us, self.nss.solve('bu-base:currentUse'))
+                percentage = eT.SubElement(current_us, self.nss.solve('bu-base:percentage'))
+                # separate use and percentage and get rid of parentheses
+                curr_use, sep, percent = use.partition('(')
+                percent = percent.strip('%)')
+                current_u.attrib = {self.nss.solve('xlink:href'): self.current_use_dict[curr_use]}
+                percentage.text = percent
+
+
+class CityGML(Standard):
+    name = 'CityGML'
+    # every tag of the standard, resolved at once when the mappings are first used (see Standard.build_building)
+    vocabulary = (
+        'xsi:schemaLocation', 'core:CityModel', 'core:cityObjectMember', 'bldg:Building', 'gml:name',
+        'core:creationDate', 'core:terminationDate', 'core:externalReference', 'core:informationSystem',
+        'core:externalObject', 'core:name', 'energy:demands', 'energy:EnergyDemand', 'energy:energyAmount',
+        'energy:RegularTimeSeries', 'energy:variableProperties', 'energy:TimeValuesProperties',
+        'energy:acquisitionMethod', 'energy:interpolationType', 'energy:temporalExtent', 'gml:TimePeriod',
+        'gml:beginPosition', 'gml:endPosition', 'energy:timeInterval', 'energy:values', 'energy:endUse',
+        'energy:energyCarrierType', 'bldg:usage', 'bldg:yearOfConstruction', 'bldg:roofType',
+        'bldg:storeysAboveGround', 'bldg:storeyHeightsAboveGround', 'bldg:lod0FootPrint', 'gml:MultiSurface',
+        'gml:surfaceMember', 'gml:Polygon', 'gml:outerBoundaryIs', 'gml:LinearRing', 'gml:coordinates',
+        'energy:refurbishmentMeasure', 'energy:RefurbishmentMeasure', 'energy:date', 'energy:DateOfEvent',
+        'energy:period', 'energy:level', 'energy:energyPerformanceCertification',
+        'energy:EnergyPerformanceCertification', 'energy:rating', 'energy:name', 'energy:certificationId',
+        'energy:heightAboveGround', 'energy:HeightAboveGround', 'energy:heightReference', 'energy:value',
+        'energy:volume', 'energy:VolumeType', 'energy:type', 'energy:floorArea', 'energy:FloorArea',
+        'energy:buildingType'
+    )
+
+    # mappings of the CitiEnGov attributes to the building, compiled on first use (see Standard.mappings)
+    mapping_table = [
+        ('NAME', [
+            Node('gml:name', when='NAME', text=Field('NAME'))
+        ]),
+        ('LIFESPAN_BEGINNING', [
+            Node('core:creationDate', when='LIFESPAN_BEGINNING', text=Field('LIFESPAN_BEGINNING', template='{v}-01-01'))
+        ]),
+        ('LIFESPAN_END', [
+            Node('core:terminationDate', when='LIFESPAN_END', text=Field('LIFESPAN_END', template='{v}-01-01'))
+        ]),
+        ('EXTERNAL_REFERENCE', [
+            Node('core:externalReference', when='EXT_REF_REFERENCE', children=[
+                Node('core:informationSystem', text=Field('EXT_REF_IDENTIFIER')),
+                Node('core:externalObject', children=[
+                    Node('core:name', text=Field('EXT_REF_REFERENCE'))
+                ])
+            ])
+        ]),
+        ('ID', [
+            Node('core:externalReference', when='IDENTIFIER_ID_LOC', children=[
+                Node('core:informationSystem', text=Field('IDENTIFIER_ID_NAME')),
+                Node('core:externalObject', children=[
+                    Node('core:name', text=Field('IDENTIFIER_ID_LOC'))
+                ])
+            ])
+        ]),
+        ('ENERGY_DEMAND', 'map_energy_demand'),
+        ('USAGE', [
+            Node('bldg:usage', when='USE_S', attrib={
+                'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_usage.xml'
+            }, text=Field('USE_S', lower=True, codelist='usage_dict'))
+        ]),
+        ('YEAR_OF_CONSTRUCTION', [
+            Node('bldg:yearOfConstruction', when='DATE_C_BEGINNING', text=Field('DATE_C_BEGINNING'))
+        ]),
+        ('ROOF_TYPE', [
+            Node('bldg:roofType', when='ROOF_TYPE', attrib={
+                'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_roofType.xml'
+            }, text=Field('ROOF_TYPE', lower=True, codelist='roof_type_dict'))
+        ]),
+        ('STOREYS_ABOVE_GROUND', 'map_storeys_above_ground'),
+        ('GEOMETRY', [
+            Node('bldg:lod0FootPrint', children=[
+                Node('gml:MultiSurface', children=[
+                    Node('gml:surfaceMember', children=[
+                        Node('gml:Polygon', children=[
+                            Node('gml:outerBoundaryIs', children=[
+                                Node('gml:LinearRing', children=[
+                                    Node('gml:coordinates', copy='GEOMETRY2D/gml:Polygon/gml:outerBoundaryIs/'
+                                                                 'gml:LinearRing/gml:coordinates')
+                                ])
+                            ])
+                        ])
+                    ])
+                ])
+            ])
+        ]),
+        ('REFURBISHMENT_MEASURE', [
+            Node('energy:refurbishmentMeasure', when='DATE_R_BEGINNING', children=[
+                Node('energy:RefurbishmentMeasure', children=[
+                    Node('energy:date', children=[
+                        Node('energy:DateOfEvent', children=[
+                            Node('energy:period', children=[
+                                Node('gml:TimePeriod', children=[
+                                    Node('gml:beginPosition', text=Field('DATE_R_BEGINNING')),
+                                    Node('gml:beginPosition', text=Field('DATE_R_END'))
+                                ])
+                            ])
+                        ])
+                    ]),
+                    Node('energy:level', text='unknown')
+                ])
+            ])
+        ]),
+        ('ENERGY_PERFORMANCE_CERTIFICATION', [
+            Node('energy:energyPerformanceCertification', when='ENERGYPERFORMANCE_PERF_CLASS', children=[
+                Node('energy:EnergyPerformanceCertification', children=[
+                    Node('energy:rating', text=Field('ENERGYPERFORMANCE_PERF_CLASS')),
+                    Node('energy:name', text=Field('ENERGYPERFORMANCE_PERF_METHOD')),
+                    # TODO cert id is missing
+                    Node('energy:certificationId')
+                ])
+            ])
+        ]),
+        ('HEIGHT_ABOVE_GROUND', [
+            Node('energy:heightAboveGround', when='HEIGHT_HEIGHT_VAL', children=[
+                Node('energy:HeightAboveGround', children=[
+                    Node('energy:heightReference',
+                         text=Field('HEIGHT_HEIGHT_REF', lower=True, codelist='height_reference_dict')),
+                    Node('energy:value', attrib={'uom': 'm'}, text=Field('HEIGHT_HEIGHT_VAL'))
+                ])
+            ])
+        ]),
+        ('VOLUME', [
+            Node('energy:volume', when='VOLUME_VALUE', children=[
+                Node('energy:VolumeType', children=[
+                    Node('energy:type', text='grossVolume'),
+                    Node('energy:value', attrib={'uom': 'm3'}, text=Field('VOLUME_VALUE'))
+                ])
+            ]),
+            Node('energy:volume', when='ENERGYPERF_VOLUME_VALUE', children=[
+                Node('energy:VolumeType', children=[
+                    Node('energy:type', text='energyReferenceVolume'),
+                    Node('energy:value', attrib={'uom': 'm3'}, text=Field('ENERGYPERF_VOLUME_VALUE'))
+                ])
+            ])
+        ]),
+        ('FLOOR_AREA', [
+            Node('energy:floorArea', when='SURFACE_VALUE', children=[
+                Node('energy:FloorArea', children=[
+                    Node('energy:type', text='grossFloorArea'),
+                    Node('energy:value', attrib={'uom': 'm2'}, text=Field('SURFACE_VALUE'))
+                ])
+            ])
+        ]),
+        # OCCUPANTS
+        ('BUILDING_TYPE', [
+            Node('energy:buildingType', when='BUILDINGTYPE', attrib={
+                'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/energy/0.6.0/energy_BuildingType.xml'
+            }, text=Field('BUILDINGTYPE', lower=True, codelist='building_type_dict'))
+        ])
+    ]
 
     def __init__(self):
         # Prepare the CityGML namespaces dictionary
@@ -351,25 +3112,42 @@ class CityGML:
         }
         self.nss = NameSpaceSolver(city_gml_ns)
 
-        # register namespaces to include it in the output file
-        for prefix, uri in city_gml_ns.items():
-            eT.register_namespace(prefix=prefix, uri=uri)
+        # prepare root element attributes:
+        root_attrib = {
+            self.nss.solve('xsi:schemaLocation'): ('http://www.sig3d.org/citygml/2.0/energy/1.0 '
+                                                   'http://www.citygmlwiki.org/images/a/ac/EnergyADE.xsd')
+        }
+
+        # create root element
+        self.root = eT.Element(self.nss.solve('core:CityModel'))
+        self.root.attrib = root_attrib
+
+        # tag of the elements wrapping the buildings
+        self.member_tag = self.nss.solve('core:cityObjectMember')
 
-        # prepare cityGML codeLists
-        # https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_usage.xml
-        self.usage_dict = {
+    # CityGML codelists, built the first time they are looked up
+
+    # https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_usage.xml
+    @CachedProperty
+    def usage_dict(self):
+        return {
             'school': '2070',  # building for education and research
             'residential': '1000',  # residential building
             'residenziale': '1000',
             'commercio': '1150',  # business building
             'ausiliario': '2700'  # others
         }
-        # https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_roofType.xml
-        self.roof_type_dict = {
+
+    # https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_roofType.xml
+    @CachedProperty
+    def roof_type_dict(self):
+        return {
             # TODO get roof types
         }
 
-        self.height_reference_dict = {
+    @CachedProperty
+    def height_reference_dict(self):
+        return {
             # TODO check values from citiengov
             'bottomOfConstruction': 'bottomOfConstruction',
             'entrancePoint': 'entrancePoint',
@@ -387,295 +3165,733 @@ class CityGML:
             'bottomThermalBoundary': 'topThermalBoundary'
         }
 
-        # https://www.sig3d.org/codelists/citygml/2.0/energy/0.6.0/energy_BuildingType.xml
-        # TODO this does not seem to be an appropriate code list...
-        self.building_type_dict = {
+    # https://www.sig3d.org/codelists/citygml/2.0/energy/0.6.0/energy_BuildingType.xml
+    # TODO this does not seem to be an appropriate code list...
+    @CachedProperty
+    def building_type_dict(self):
+        return {
             'ApartmentBlock': 'ApartmentBlock',
             'MultiFamilyHouse': 'MultiFamilyHouse',
             'RowHouse': 'RowHouse',
             'SingleFamilyHouse': 'SingleFamilyHouse'
         }
 
-        # prepare root element attributes:
-        root_attrib = {
-            self.nss.solve('xsi:schemaLocation'): ('http://www.sig3d.org/citygml/2.0/energy/1.0 '
-                                                   'http://www.citygmlwiki.org/images/a/ac/EnergyADE.xsd')
+    def translate_building(self, bu):
+        """
+        translate a single building
+
+        :param bu: Building instance
+        :return: the core:cityObjectMember element of the building
+        """
+
+        # add a member to the list
+        city_object_member = eT.Element(self.member_tag)
+
+        # add building element
+        bldg_building = eT.SubElement(city_object_member, self.nss.solve('bldg:Building'))
+
+        # add elements to the building
+        self.map_building(bu, bldg_building)
+
+        return city_object_member
+
+    def map_energy_demand(self, bu, bldg_building):
+        if not all(i is None for i in bu.find('CONSUMONORM_VALORE_E', _all=True)):
+            self.make_demand(bu, bldg_building, 'electricity')
+
+        if not all(i is None for i in bu.find('CONSUMONORM_VALORE_T', _all=True)):
+            self.make_demand(bu, bldg_building, 'thermal')
+
+    def map_storeys_above_ground(self, bu, bldg_building):
+        if bu.find('FLOORS') is not None:
+            storeys_above_ground = eT.SubElement(bldg_building, self.nss.solve('bldg:storeysAboveGround'))
+            floors = bu.find('FLOORS').text
+            storeys_above_ground.text = floors
+
+            # STORY_HEIGHTS_ABOVE_GROUND
+            if bu.find('H_FLOOR') is not None:
+                storey_heights = eT.SubElement(bldg_building, self.nss.solve('bldg:storeyHeightsAboveGround'))
+                storey_heights.attrib = {'uom': 'm'}
+                hei = bu.find('H_FLOOR').text
+                storey_heights.text = ''.join(['{h},'.format(h=hei) for i in range(int(floors))]).rstrip(',')
+
+    def make_demand(self, bu, bldg_building, energy_carrier):
+        """
+        add an energy demand with the yearly time series of an energy carrier
+
+        :param bu: Building instance
+        :param bldg_building: building element of the output
+        :param energy_carrier: 'electricity' or 'thermal'
+        """
+        # other energy_carrier types can be added here
+        if energy_carrier == 'electricity':
+            energy_source = bu.find('ENERGYAMOUNT_E_SOURCE_E').text.lower()
+            if energy_source != 'electricity':
+                raise UnboundLocalError('\'electricity\' is expected for E_SOURCE instead of {e_s}'.format(
+                    e_s=energy_source))
+            energy_carrier_t = 'Electricity'
+            uom = bu.find('CONSUMONORM_UOM_E').text.lower()  # uom is taken from the first element
+            series = regular_time_series([y.text for y in bu.find('ENERGYAMOUNT_E_YEAR_ONLY_E', _all=True)],
+                                         [v.text for v in bu.find('CONSUMONORM_VALORE_E', _all=True)])
+        elif energy_carrier == 'thermal':
+            energy_source = bu.find('ENERGYAMOUNT_E_SOURCE_T').text.lower()
+            if energy_source != 'thermal':
+                raise UnboundLocalError('\'thermal\' is expected for E_SOURCE instead of {e_s}'.format(
+                    e_s=energy_source))
+            uom = bu.find('CONSUMONORM_UOM_T').text.lower()  # uom is taken from the first element
+            series = regular_time_series([y.text for y in bu.find('ENERGYAMOUNT_E_YEAR_ONLY_T', _all=True)],
+                                         [v.text for v in bu.find('CONSUMONORM_VALORE_T', _all=True)])
+            energy_carrier_t = 'HotWater'
+        else:
+            raise KeyError(
+                'energy_carrier can be either \'electricity\' or \'thermal\' instead of \'{e_c}\''.format(
+                e_c=energy_carrier))
+
+        demand = eT.SubElement(bldg_building, self.nss.solve('energy:demands'))
+        dem = eT.SubElement(demand, self.nss.solve('energy:EnergyDemand'))
+        amount = eT.SubElement(dem, self.nss.solve('energy:energyAmount'))
+        time_series = eT.SubElement(amount, self.nss.solve('energy:RegularTimeSeries'))
+        var_prop = eT.SubElement(time_series, self.nss.solve('energy:variableProperties'))
+        time_val_prop = eT.SubElement(var_prop, self.nss.solve('energy:TimeValuesProperties'))
+        aqu_method = eT.SubElement(time_val_prop, self.nss.solve('energy:acquisitionMethod'))
+        interp_type = eT.SubElement(time_val_prop, self.nss.solve('energy:interpolationType'))
+        aqu_method.text = 'measurement'
+        interp_type.text = 'instantaneousTotal'
+
+        temp_ext = eT.SubElement(time_series, self.nss.solve('energy:temporalExtent'))
+        time_period = eT.SubElement(temp_ext, self.nss.solve('gml:TimePeriod'))
+        begin_pos = eT.SubElement(time_period, self.nss.solve('gml:beginPosition'))
+        end_pos = eT.SubElement(time_period, self.nss.solve('gml:endPosition'))
+        # start year, end year, number of years and the list of values (separator: whitespace)
+        begin_pos.text, end_pos.text, number_of_years, values_text = series
+
+        time_interval = eT.SubElement(time_series, self.nss.solve('energy:timeInterval'))
+        values = eT.SubElement(time_series, self.nss.solve('energy:values'))
+        time_interval.attrib = {'unit': 'year'}
+        time_interval.text = number_of_years
+        values.attrib = {'uom': uom}
+        values.text = values_text
+
+        end_use = eT.SubElement(dem, self.nss.solve('energy:endUse'))
+        end_use.text = 'otherOrCombination'
+
+        energy_carrier_type = eT.SubElement(dem, self.nss.solve('energy:energyCarrierType'))
+        energy_carrier_type.attrib = {
+            'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/energy/0.6.0/energy_EnergyCarrierType.xml'
         }
+        energy_carrier_type.text = energy_carrier_t
+
+
+# standards that can be exported to by name
+STANDARDS = {
+    'INSPIRE': Inspire,
+    'CityGML': CityGML
+}
+
+
+def _record_buildings(buildings, records, bboxes=False):
+    for bu in buildings:
+        records.append((bu.UUID, building_bbox(bu) if bboxes else None))
+        yield bu
+
+
+def export(citi_en_gov, targets, stream_output=False, workers=1, profiler=None, cache=None, shards=None,
+           sink=None, quarantine=None, checkpoint=None, pipeline=None):
+    """
+    translate the CitiEnGov gml to several standards at once, the input is iterated only once
+
+    :param citi_en_gov: CitiEnGov instance
+    :param targets: list of (standard, target_path) tuples, standard being a name from STANDARDS or a Standard instance
+    :param stream_output: write each building out as soon as it is translated
+    :param workers: number of processes translating the buildings (the output is streamed), the mappings
+        are not profiled then
+    :param profiler: Profiler instance to measure the translation and the writing
+    :param cache: DeltaCache instance to translate only the new and changed buildings (the output is streamed),
+        closed at the end
+    :param shards: (mode, size) tuple to split each output into shards with a ShardWriter (the output is streamed),
+        the bounding boxes of the buildings come from the GeometryStage if it ran, from their footprints otherwise
+    :param sink: OutputSink opening the outputs (compression, standard output)
+    :param quarantine: Quarantine instance, the buildings failing to translate to a standard are left out of its
+        output and recorded in the quarantine instead of stopping the export, closed at the end (also if the export
+        fails)
+    :param checkpoint: Checkpoint instance to save the progress of the export (the output is streamed) or to resume
+        it, not with shards
+    :param pipeline: Pipeline the input is read in, the translation runs as a stage of it and the outputs are
+        written in this thread as the last stage (the output is streamed)
+    """
+    standards = [STANDARDS[standard]() if isinstance(standard, str) else standard for standard, path in targets]
+    print('Translating CitiEnGov to {std}.'.format(std=', '.join(standard.name for standard in standards)))
+    for standard in standards:
+        standard.profiler = profiler
+
+    # the quarantine is closed (its records flushed) even if the export fails
+    with quarantine if quarantine is not None else nullcontext():
+        if (stream_output or workers > 1 or cache is not None or shards is not None or checkpoint is not None
+                or pipeline is not None):
+            if shards is not None and checkpoint is not None:
+                raise ValueError('Sharded outputs cannot be checkpointed!')
+            writers = []
+            # UUIDs and bounding boxes of the buildings in translation, the fragments come back in the same order
+            records = deque()
+            # the outputs of a failed export are dropped (kept for --resume when checkpointed)
+            complete = False
+            try:
+                for number, (standard, (_, target_path)) in enumerate(zip(standards, targets)):
+                    print('Writing {std} gml to: {path}'.format(std=standard.name, path=target_path))
+                    if shards is not None:
+                        writers.append(ShardWriter(target_path, standard, *shards, sink=sink))
+                    elif checkpoint is not None:
+                        writers.append(standard.open_writer(target_path, sink=sink,
+                                                            resume=checkpoint.writer_state(number), keep_partial=True))
+                    else:
+                        writers.append(standard.open_writer(target_path, sink=sink))
+                buildings = citi_en_gov
+                if checkpoint is not None:
+                    buildings = checkpoint.skip(buildings, cache=cache)
+                if shards is not None or checkpoint is not None:
+                    buildings = _record_buildings(buildings, records, bboxes=shards is not None)
+                translated = translate_buildings(standards, buildings, workers=workers, cache=cache,
+                                                 tolerant=quarantine is not None)
+                if pipeline is not None:
+                    translated = pipeline.drain('write', pipeline.stage('translate', translated))
+                for fragments in translated:
+                    uuid, bbox = records.popleft() if records else (None, None)
+                    with profile_stage(profiler, 'write'):
+                        for writer, fragment in zip(writers, fragments):
+                            if isinstance(fragment, dict):
+                                quarantine.add(fragment)
+                            else:
+                                writer.write_fragment(fragment, bbox)
+                        if checkpoint is not None:
+                            checkpoint.add(uuid, writers)
+                    if profiler is not None:
+                        profiler.count('buildings')
+                complete = True
+            finally:
+                if pipeline is not None:
+                    pipeline.stopped.set()
+                with profile_stage(profiler, 'write'):
+                    for writer in writers:
+                        writer.close(complete)
+            if checkpoint is not None:
+                checkpoint.finish()
+            if cache is not None:
+                cache.close()
+                if profiler is not None:
+                    for change, number in cache.statistics.items():
+                        profiler.count('buildings ' + change, number)
+        else:
+            for bu in citi_en_gov:
+                for standard in standards:
+                    member = translate_member(standard, bu, tolerant=quarantine is not None)
+                    if isinstance(member, dict):
+                        quarantine.add(member)
+                    else:
+                        standard.root.append(member)
+                if profiler is not None:
+                    profiler.count('buildings')
+            for standard, (_, target_path) in zip(standards, targets):
+                with profile_stage(profiler, 'write'):
+                    standard.write_to_file(target_path, sink=sink)
+    if quarantine is not None and profiler is not None:
+        profiler.count('buildings quarantined', len(quarantine.buildings))
+
+
+# translators of the batch jobs run in this process, reused from job to job
+_batch_standards = {}
+
+
+def _batch_standard(name):
+    standard = _batch_standards.get(name)
+    if standard is None:
+        standard = _batch_standards[name] = STANDARDS[name]()
+    else:
+        standard.new_document()
+    return standard
+
+
+def _count_buildings(buildings, counter):
+    for bu in buildings:
+        counter[0] += 1
+        yield bu
+
+
+def read_batch(manifest_path):
+    """
+    read the jobs of a batch from a json manifest, either a list of jobs or an object with a "jobs" list
+
+    A job has an "input", an "output" and a "standard" and/or a list of "targets" ([standard, output] pairs),
+    optionally "input_mode" ('file' or 'url'), "stream", "page_size", "quarantine" and "snapshot" (paths), e.g.
+    {"input": "ferrara.gml", "output": "ferrara_inspire.gml", "standard": "INSPIRE"}
+
+    :param manifest_path: path of the manifest
+    :return: list of job dictionaries
+    """
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    jobs = manifest['jobs'] if isinstance(manifest, dict) else manifest
+    for number, job in enumerate(jobs):
+        targets = [tuple(target) for target in job.get('targets', [])]
+        if 'output' in job:
+            targets.insert(0, (job.get('standard'), job['output']))
+        if 'input' not in job or not targets:
+            raise ValueError('Job {n} of the batch needs an input and an output with a standard!'.format(n=number))
+        for standard, output in targets:
+            if standard not in STANDARDS:
+                raise ValueError('Standard can be either \'INSPIRE\' or \'CityGML\'!')
+        job['targets'] = targets
+    return jobs
+
+
+def run_job(job, sink=None):
+    """
+    run one job of a batch with the translators of this process, the output is streamed
+
+    :param job: job dictionary from read_batch
+    :param sink: OutputSink opening the outputs
+    :return: dictionary of the status and throughput of the job
+    """
+    result = {'input': job['input'], 'targets': [list(target) for target in job['targets']], 'status': 'ok',
+              'buildings': 0}
+    start = time.perf_counter()
+    counter = [0]
+    try:
+        with redirect_stdout(io.StringIO()):
+            citi_en_gov = CitiEnGov(job['input'], input_mode=job.get('input_mode', 'file'),
+                                    stream=job.get('stream', False), page_size=job.get('page_size'),
+                                    snapshot_path=job.get('snapshot'))
+            targets = [(_batch_standard(standard), output) for standard, output in job['targets']]
+            quarantine = Quarantine(job['quarantine']) if job.get('quarantine') else None
+            with quarantine if quarantine is not None else nullcontext():
+                export(_count_buildings(citi_en_gov, counter), targets, stream_output=True, sink=sink,
+                       quarantine=quarantine)
+        if quarantine is not None:
+            result['quarantined'] = len(quarantine.buildings)
+    except Exception as exception:
+        result['status'] = 'failed'
+        result['error'] = '{name}: {message}'.format(name=type(exception).__name__, message=exception)
+    result['buildings'] = counter[0]
+    result['seconds'] = time.perf_counter() - start
+    result['buildings_per_second'] = counter[0] / result['seconds'] if result['seconds'] else 0
+    result['output_bytes'] = sum(os.path.getsize(output) for standard, output in job['targets']
+                                 if output != '-' and os.path.exists(output))
+    return result
+
+
+def run_batch(jobs, workers=1, sink=None):
+    """
+    run the jobs of a batch on a pool of processes, each process keeps its translators for the next jobs
+
+    :param jobs: list of job dictionaries from read_batch
+    :param workers: number of jobs run at the same time
+    :param sink: OutputSink opening the outputs
+    :return: list of the results of the jobs (see run_job) in the order of the jobs
+    """
+    results = [None] * len(jobs)
+    if workers <= 1:
+        for number, job in enumerate(jobs):
+            results[number] = run_job(job, sink)
+            print_job(number, len(jobs), results[number])
+        return results
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, sink): number for number, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            number = futures[future]
+            results[number] = future.result()
+            print_job(number, len(jobs), results[number])
+    return results
+
+
+def print_job(number, jobs, result):
+    print('[{n}/{jobs}] {status:<6} {input}: {buildings} buildings in {s:.1f} s{error}'.format(
+        n=number + 1, jobs=jobs, status=result['status'], input=result['input'], buildings=result['buildings'],
+        s=result['seconds'], error=' ({e})'.format(e=result['error']) if 'error' in result else ''))
+
+
+def print_batch_report(results, seconds):
+    """
+    :param results: results of the jobs from run_batch
+    :param seconds: wall time of the whole batch
+    """
+    buildings = sum(result['buildings'] for result in results)
+    failed = [result for result in results if result['status'] != 'ok']
+    print('Batch finished: {ok} jobs ok, {failed} failed, {buildings} buildings in {s:.1f} s '
+          '({rate:.0f} buildings/s, {mb:.1f} MiB written)'.format(
+              ok=len(results) - len(failed), failed=len(failed), buildings=buildings, s=seconds,
+              rate=buildings / seconds if seconds else 0,
+              mb=sum(result['output_bytes'] for result in results) / 2 ** 20))
+    for result in failed:
+        print('  failed: {input}: {error}'.format(**result))
+
+
+# lock around registering the namespaces of a standard and serializing with them, for the threads of the service
+_namespace_lock = threading.Lock()
+
+
+class _ChunkedResponse(io.RawIOBase):
+    def __init__(self, stream):
+        """
+        binary stream writing the body of an http response in chunks (chunked transfer encoding)
 
-        # create root element
-        self.root = eT.Element(self.nss.solve('core:CityModel'))
-        self.root.attrib = root_attrib
+        :param stream: the (socket) stream of the response
+        """
+        super().__init__()
+        self.stream = stream
 
-    def write_to_file(self, target_path):
-        # wrap the whole data into an ElementTree object
-        tree = eT.ElementTree(self.root)
+    def writable(self):
+        return True
 
-        # write out the data to the target file
-        print('Writing CityGML gml to: {path}'.format(path=target_path))
-        tree.write(target_path, encoding='utf-8', xml_declaration=True, method='xml', short_empty_elements=True)
+    def write(self, data):
+        if data:
+            self.stream.write(b'%x\r\n' % len(data) + bytes(data) + b'\r\n')
+        return len(data)
 
-    def translate(self, citi_en_gov):
+    def close(self):
+        if not self.closed:
+            self.stream.write(b'0\r\n\r\n')
+            self.stream.flush()
+        super().close()
 
-        print('Translating CitiEnGov to CityGML.')
 
-        # iterate on all buildings contained in the CitiEnGov gml:
-        for bu in citi_en_gov:
+class ResponseSink:
+    def __init__(self, stream, buffer_size=1 << 16):
+        """
+        output sink of the writers writing the document to an http response instead of a file
 
-            # add a member to the list
-            city_object_member = eT.SubElement(self.root, self.nss.solve('core:cityObjectMember'))
-
-            # add building element
-            bldg_building = eT.SubElement(city_object_member, self.nss.solve('bldg:Building'))
-
-            # NAME
-            if bu.find('NAME') is not None:
-                name = eT.SubElement(bldg_building, self.nss.solve('gml:name'))
-                name.text = bu.find('NAME').text
-
-            # LIFESPAN_BEGINNING
-            if bu.find('LIFESPAN_BEGINNING') is not None:
-                creation_date = eT.SubElement(bldg_building, self.nss.solve('core:creationDate'))
-                year = bu.find('LIFESPAN_BEGINNING').text
-                creation_date.text = '{y}-01-01'.format(y=year)
-
-            # LIFESPAN_END
-            if bu.find('LIFESPAN_END') is not None:
-                creation_date = eT.SubElement(bldg_building, self.nss.solve('core:terminationDate'))
-                year = bu.find('LIFESPAN_END').text
-                creation_date.text = '{y}-01-01'.format(y=year)
-
-            # EXTERNAL_REFERENCE
-            if bu.find('EXT_REF_REFERENCE') is not None:
-                external_reference = eT.SubElement(bldg_building, self.nss.solve('core:externalReference'))
-                information_system = eT.SubElement(external_reference, self.nss.solve('core:informationSystem'))
-                information_system.text = bu.find('EXT_REF_IDENTIFIER').text
-                external_object = eT.SubElement(external_reference, self.nss.solve('core:externalObject'))
-                ext_name = eT.SubElement(external_object, self.nss.solve('core:name'))
-                ext_name.text = bu.find('EXT_REF_REFERENCE').text
-
-            # ID
-            if bu.find('IDENTIFIER_ID_LOC') is not None:
-                external_reference_id = eT.SubElement(bldg_building, self.nss.solve('core:externalReference'))
-                information_system_id = eT.SubElement(external_reference_id, self.nss.solve('core:informationSystem'))
-                information_system_id.text = bu.find('IDENTIFIER_ID_NAME').text
-                external_object_id = eT.SubElement(external_reference_id, self.nss.solve('core:externalObject'))
-                ext_name_id = eT.SubElement(external_object_id, self.nss.solve('core:name'))
-                ext_name_id.text = bu.find('IDENTIFIER_ID_LOC').text
-
-            # ENERGY_DEMAND
-            def make_demand(energy_carrier):
-
-                # other energy_carrier types can be added here
-                if energy_carrier == 'electricity':
-                    energy_source = bu.find('ENERGYAMOUNT_E_SOURCE_E').text.lower()
-                    if energy_source != 'electricity':
-                        raise UnboundLocalError('\'electricity\' is expected for E_SOURCE instead of {e_s}'.format(
-                            e_s=energy_source))
-                    energy_carrier_t = 'Electricity'
-                    years = [y.text for y in bu.find('ENERGYAMOUNT_E_YEAR_ONLY_E', _all=True)]
-                    uom = bu.find('CONSUMONORM_UOM_E').text.lower()  # uom is taken from the first element
-                    energy_values = [v.text for v in bu.find('CONSUMONORM_VALORE_E', _all=True)]
-                elif energy_carrier == 'thermal':
-                    energy_source = bu.find('ENERGYAMOUNT_E_SOURCE_T').text.lower()
-                    if energy_source != 'thermal':
-                        raise UnboundLocalError('\'thermal\' is expected for E_SOURCE instead of {e_s}'.format(
-                            e_s=energy_source))
-                    years = [y.text for y in bu.find('ENERGYAMOUNT_E_YEAR_ONLY_T', _all=True)]
-                    uom = bu.find('CONSUMONORM_UOM_T').text.lower()  # uom is taken from the first element
-                    energy_values = [v.text for v in bu.find('CONSUMONORM_VALORE_T', _all=True)]
-                    energy_carrier_t = 'HotWater'
-                else:
-                    raise KeyError(
-                        'energy_carrier can be either \'electricity\' or \'thermal\' instead of \'{e_c}\''.format(
-                        e_c=energy_carrier))
-                
-                demand = eT.SubElement(bldg_building, self.nss.solve('energy:demands'))
-                dem = eT.SubElement(demand, self.nss.solve('energy:EnergyDemand'))
-                amount = eT.SubElement(dem, self.nss.solve('energy:energyAmount'))
-                time_series = eT.SubElement(amount, self.nss.solve('energy:RegularTimeSeries'))
-                var_prop = eT.SubElement(time_series, self.nss.solve('energy:variableProperties'))
-                time_val_prop = eT.SubElement(var_prop, self.nss.solve('energy:TimeValuesProperties'))
-                aqu_method =  eT.SubElement(time_val_prop, self.nss.solve('energy:acquisitionMethod'))
-                interp_type = eT.SubElement(time_val_prop, self.nss.solve('energy:interpolationType'))
-                aqu_method.text = 'measurement'
-                interp_type.text = 'instantaneousTotal'
-
-                temp_ext = eT.SubElement(time_series, self.nss.solve('energy:temporalExtent'))
-                time_period = eT.SubElement(temp_ext, self.nss.solve('gml:TimePeriod'))
-                begin_pos = eT.SubElement(time_period, self.nss.solve('gml:beginPosition'))
-                end_pos = eT.SubElement(time_period, self.nss.solve('gml:endPosition'))
-                begin_pos.text = sorted(years)[0] # start year
-                end_pos.text = sorted(years)[-1] # end year
-
-                time_interval = eT.SubElement(time_series,
-                                                          self.nss.solve('energy:timeInterval'))
-                values = eT.SubElement(time_series, self.nss.solve('energy:values'))
-                time_interval.attrib = {'unit': 'year'}
-                # check if the years are consecutive:
-                if len(years) != int(sorted(years)[-1]) - int(sorted(years)[0]) + 1:
-                    raise UnboundLocalError('Years have to be consecutive, but here they are: {l}'.format(
-                        l=sorted(years)))
-                time_interval.text = str(len(years))  # number of years
-                values.attrib = {'uom': uom}
-                year_values = {y: v for y, v in zip(years, energy_values)}
-                # list of values, separator: whitespace
-                values.text = ''.join('{v} '.format(v=year_values[y]) for y in sorted(years)).strip()  # list of values
-
-                end_use = eT.SubElement(dem, self.nss.solve('energy:endUse'))
-                end_use.text = 'otherOrCombination'
-
-                energy_carrier_type = eT.SubElement(dem, self.nss.solve('energy:energyCarrierType'))
-                energy_carrier_type.attrib = {
-                    'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/energy/0.6.0/energy_EnergyCarrierType.xml'
-                }
-                energy_carrier_type.text = energy_carrier_t
-
-            if not all(i is None for i in bu.find('CONSUMONORM_VALORE_E', _all=True)):
-                make_demand('electricity')
-
-            if not all(i is None for i in bu.find('CONSUMONORM_VALORE_T', _all=True)):
-                make_demand('thermal')
-
-            # USAGE
-            if bu.find('USE_S') is not None:
-                usage = eT.SubElement(bldg_building, self.nss.solve('bldg:usage'))
-                usage.attrib = {
-                    'codeSpace':'https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_usage.xml'
-                }
-                predominant_use = bu.find('USE_S').text.lower()
-                usage.text = self.usage_dict[predominant_use]
-
-            # YEAR_OF_CONSTRUCTION
-            if bu.find('DATE_C_BEGINNING') is not None:
-                year_of_construction = eT.SubElement(bldg_building, self.nss.solve('bldg:yearOfConstruction'))
-                year_of_construction.text = bu.find('DATE_C_BEGINNING').text
-
-            # ROOF_TYPE
-            if bu.find('ROOF_TYPE') is not None:
-                roof_type = eT.SubElement(bldg_building, self.nss.solve('bldg:roofType'))
-                roof_type.attrib = {
-                    'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/building/2.0/_AbstractBuilding_roofType.xml'
-                }
-                roof_t = bu.find('ROOF_TYPE').text.lower()
-                roof_type.text = self.roof_type_dict[roof_t]
-
-            # STOREYES_ABOVE_GROUND
-            if bu.find('FLOORS') is not None:
-                storeys_above_ground = eT.SubElement(bldg_building, self.nss.solve('bldg:storeysAboveGround'))
-                floors = bu.find('FLOORS').text
-                storeys_above_ground.text = floors
-
-                # STORY_HEIGHTS_ABOVE_GROUND
-                if bu.find('H_FLOOR') is not None:
-                    storey_heights = eT.SubElement(bldg_building, self.nss.solve('bldg:storeyHeightsAboveGround'))
-                    storey_heights.attrib = {'uom': 'm'}
-                    hei = bu.find('H_FLOOR').text
-                    storey_heights.text = ''.join(['{h},'.format(h=hei) for i in range(int(floors))]).rstrip(',')
-
-            # GEOMETRY
-            lod_0_foot_print = eT.SubElement(bldg_building, self.nss.solve('bldg:lod0FootPrint'))
-            multi_surface = eT.SubElement(lod_0_foot_print, self.nss.solve('gml:MultiSurface'))
-            surface_member = eT.SubElement(multi_surface, self.nss.solve('gml:surfaceMember'))
-            polygon = eT.SubElement(surface_member, self.nss.solve('gml:Polygon'))
-            outer_boundary_is = eT.SubElement(polygon, self.nss.solve('gml:outerBoundaryIs'))
-            linear_ring = eT.SubElement(outer_boundary_is, self.nss.solve('gml:LinearRing'))
-            coordinates = eT.SubElement(linear_ring, self.nss.solve('gml:coordinates'))
-            co = bu.find('GEOMETRY2D/gml:Polygon/gml:outerBoundaryIs/gml:LinearRing/gml:coordinates')
-            coordinates.attrib = co.attrib
-            coordinates.text = co.text
-
-            # REFURBISHMENT_MEASURE
-            if bu.find('DATE_R_BEGINNING') is not None:
-                refurbishment_measure = eT.SubElement(bldg_building, self.nss.solve('energy:refurbishmentMeasure'))
-                refurbishment_mea = eT.SubElement(refurbishment_measure, self.nss.solve('energy:RefurbishmentMeasure'))
-                r_date = eT.SubElement(refurbishment_mea, self.nss.solve('energy:date'))
-                r_date_of_event = eT.SubElement(r_date, self.nss.solve('energy:DateOfEvent'))
-                r_period = eT.SubElement(r_date_of_event, self.nss.solve('energy:period'))
-                r_time_period = eT.SubElement(r_period, self.nss.solve('gml:TimePeriod'))
-                r_begin_position = eT.SubElement(r_time_period, self.nss.solve('gml:beginPosition'))
-                r_end_position = eT.SubElement(r_time_period, self.nss.solve('gml:beginPosition'))
-                r_level = eT.SubElement(refurbishment_mea, self.nss.solve('energy:level'))
-                r_begin_position.text = bu.find('DATE_R_BEGINNING').text
-                r_end_position.text = bu.find('DATE_R_END').text
-                r_level.text = 'unknown'
-
-            # ENERGY_PERFORMANCE_CERTIFICATION
-            if bu.find('ENERGYPERFORMANCE_PERF_CLASS') is not None:
-                energy_certification = eT.SubElement(bldg_building,
-                                                     self.nss.solve('energy:energyPerformanceCertification'))
-                energy_cert = eT.SubElement(energy_certification,
-                                            self.nss.solve('energy:EnergyPerformanceCertification'))
-                cert_rating = eT.SubElement(energy_cert, self.nss.solve('energy:rating'))
-                cert_name = eT.SubElement(energy_cert, self.nss.solve('energy:name'))
-                cert_id = eT.SubElement(energy_cert, self.nss.solve('energy:certificationId'))
-                cert_rating.text = bu.find('ENERGYPERFORMANCE_PERF_CLASS').text
-                cert_name.text = bu.find('ENERGYPERFORMANCE_PERF_METHOD').text
-                # TODO cert id is missing
-
-            # HEIGHT_ABOVE_GROUND
-            if bu.find('HEIGHT_HEIGHT_VAL') is not None:
-                height_above_ground = eT.SubElement(bldg_building, self.nss.solve('energy:heightAboveGround'))
-                height_above_gr = eT.SubElement(height_above_ground, self.nss.solve('energy:HeightAboveGround'))
-                height_reference = eT.SubElement(height_above_gr, self.nss.solve('energy:heightReference'))
-                height_value = eT.SubElement(height_above_gr, self.nss.solve('energy:value'))
-                h_reference = bu.find('HEIGHT_HEIGHT_REF').text.lower()
-                height_reference.text = self.height_reference_dict[h_reference]
-                height_value.attrib = {'uom': 'm'}
-                height_value.text = bu.find('HEIGHT_HEIGHT_VAL').text
-
-            # VOLUME
-            if bu.find('VOLUME_VALUE') is not None:
-                gross_volume = eT.SubElement(bldg_building, self.nss.solve('energy:volume'))
-                gross_volume_type = eT.SubElement(gross_volume, self.nss.solve('energy:VolumeType'))
-                gross_volume_typ = eT.SubElement(gross_volume_type, self.nss.solve('energy:type'))
-                gross_volume_value = eT.SubElement(gross_volume_type, self.nss.solve('energy:value'))
-                gross_volume_typ.text = 'grossVolume'
-                gross_volume_value.attrib = {'uom': 'm3'}
-                gross_volume_value.text = bu.find('VOLUME_VALUE').text
-
-            if bu.find('ENERGYPERF_VOLUME_VALUE') is not None:
-                energy_volume = eT.SubElement(bldg_building, self.nss.solve('energy:volume'))
-                energy_volume_type = eT.SubElement(energy_volume, self.nss.solve('energy:VolumeType'))
-                energy_volume_typ = eT.SubElement(energy_volume_type, self.nss.solve('energy:type'))
-                energy_volume_value = eT.SubElement(energy_volume_type, self.nss.solve('energy:value'))
-                energy_volume_typ.text = 'energyReferenceVolume'
-                energy_volume_value.attrib = {'uom': 'm3'}
-                energy_volume_value.text = bu.find('ENERGYPERF_VOLUME_VALUE').text
-
-            # FLOOR_AREA
-            if bu.find('SURFACE_VALUE') is not None:
-                floor_area = eT.SubElement(bldg_building, self.nss.solve('energy:floorArea'))
-                floor_ar = eT.SubElement(floor_area, self.nss.solve('energy:FloorArea'))
-                floor_area_type = eT.SubElement(floor_ar, self.nss.solve('energy:type'))
-                floor_area_value = eT.SubElement(floor_ar, self.nss.solve('energy:value'))
-                floor_area_type.text = 'grossFloorArea'
-                floor_area_value.attrib = {'uom': 'm2'}
-                floor_area_value.text = bu.find('SURFACE_VALUE').text
-
-            # OCCUPANTS
-
-            # BUILDING_TYPE
-            if bu.find('BUILDINGTYPE') is not None:
-                building_type = eT.SubElement(bldg_building, self.nss.solve('energy:buildingType'))
-                building_type.attrib = {
-                    'codeSpace': 'https://www.sig3d.org/codelists/citygml/2.0/energy/0.6.0/energy_BuildingType.xml'
-                }
-                building_typ = bu.find('BUILDINGTYPE').text.lower()
-                building_type.text = self.building_type_dict[building_typ]
+        :param stream: the (socket) stream of the response
+        :param buffer_size: size of the chunks of the response in bytes
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+
+    def open(self, target_path, offset=None, temporary=False):
+        return io.BufferedWriter(_ChunkedResponse(self.stream), self.buffer_size)
+
+
+class ExportService:
+    def __init__(self, source_path, stream=False, snapshot_path=None, backend=None):
+        """
+        export service keeping the buildings of a CitiEnGov gml and the translators in memory, the buildings are
+        selected by UUID or bounding box and translated on demand, the translated members are kept until the
+        source changes
+
+        The source is loaded again when its modification time changes, the requests being answered go on with the
+        buildings they started with.
+
+        :param source_path: path of the CitiEnGov gml
+        :param stream: parse the source incrementally (it has to be sorted by UUID)
+        :param snapshot_path: path of a Snapshot of the source, loaded instead of parsing it while it is unchanged
+        :param backend: XMLBackend parsing the source (default: lxml if it is installed)
+        """
+        self.source_path = source_path
+        self.stream = stream
+        self.snapshot_path = snapshot_path
+        self.backend = backend or XMLBackend()
+        self.standards = {name: standard_class() for name, standard_class in STANDARDS.items()}
+        for standard in self.standards.values():
+            # compile the mappings before the first request
+            standard.build_building, standard.mappings
+        self.lock = threading.Lock()
+        # modification time, buildings, BuildingIndex, (standard, UUID) -> member of the loaded source
+        self.dataset = None
+        self.current_dataset()
+
+    def current_dataset(self):
+        """
+        :return: (modification time, buildings, index, translated members) of the source, loaded again if the
+            source has changed since it was loaded
+        """
+        mtime = os.stat(self.source_path).st_mtime_ns
+        dataset = self.dataset
+        if dataset is not None and dataset[0] == mtime:
+            return dataset
+        with self.lock:
+            if self.dataset is None or self.dataset[0] != mtime:
+                try:
+                    self.dataset = self.load(mtime)
+                except self.backend.errors + (OSError,) as exception:
+                    # e.g. the source is being written, keep serving the buildings loaded before
+                    if self.dataset is None:
+                        raise
+                    print('Loading {path} failed, serving the previous version: {e}'.format(
+                        path=self.source_path, e=exception))
+            return self.dataset
+
+    def load(self, mtime):
+        print('Loading CitiEnGov gml: {path}'.format(path=self.source_path))
+        buildings = list(CitiEnGov(self.source_path, stream=self.stream, snapshot_path=self.snapshot_path,
+                                   backend=self.backend))
+        print('Serving {n} buildings'.format(n=len(buildings)))
+        return mtime, buildings, BuildingIndex.from_buildings(buildings), {}
+
+    def select(self, dataset, building_filter):
+        """
+        :param dataset: dataset from current_dataset
+        :param building_filter: BuildingFilter instance
+        :return: list of the selected buildings in the order of the source
+        """
+        mtime, buildings, index, members = dataset
+        return [buildings[position] for position in index.query(building_filter)]
+
+    def write(self, name, dataset, buildings, sink):
+        """
+        translate the buildings and write the document to the sink member by member
+
+        :param name: name of the standard
+        :param dataset: dataset from current_dataset the buildings are from
+        :param buildings: list of Building instances
+        :param sink: sink opening the output (e.g. a ResponseSink)
+        :return: number of buildings written, the ones failing to translate are left out
+        """
+        standard = self.standards[name]
+        members = dataset[3]
+        with _namespace_lock:
+            # e.g. the time stamp of the document
+            standard.new_document()
+            writer = standard.open_writer('-', sink=sink)
+        with writer:
+            for bu in buildings:
+                fragment = members.get((name, bu.UUID))
+                if fragment is None:
+                    member = translate_member(standard, bu, tolerant=True)
+                    if isinstance(member, dict):
+                        print('Building {uuid} failed to translate to {std} in {mapping}: {exception}: '
+                              '{message}'.format(std=name, **member))
+                        continue
+                    with _namespace_lock:
+                        standard.register_namespaces()
+                        fragment = serialize_member(member)
+                    members[(name, bu.UUID)] = fragment
+                writer.write_fragment(fragment)
+            return writer.members
+
+
+def export_server(service, port, host='127.0.0.1'):
+    """
+    http server answering export requests, each request in its own thread:
+
+    GET /INSPIRE or /CityGML with the optional query parameters uuid (comma separated, can be repeated), bbox
+    (min x, min y, max x, max y) and where (FIELD=VALUE of an indexed attribute, can be repeated) streams the document
+    of the selected buildings, GET /status the state of the source as json
+
+    :param service: ExportService instance
+    :param port: port to listen on (0: any free port, see server_port)
+    :param host: address to listen on
+    :return: ThreadingHTTPServer instance, bound but not serving yet
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from urllib import parse
+
+    class ExportRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = parse.urlsplit(self.path)
+            query = parse.parse_qs(parts.query)
+            name = parts.path.strip('/')
+            try:
+                dataset = service.current_dataset()
+            except service.backend.errors + (OSError,) as exception:
+                self.send_error(503, 'The source cannot be loaded: {e}'.format(e=exception))
+                return
+            if name == 'status':
+                body = json.dumps({'source': service.source_path, 'buildings': len(dataset[1]),
+                                   'translated': len(dataset[3]), 'modified': dataset[0] / 1e9}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if name not in service.standards:
+                self.send_error(404, 'Standard can be either \'INSPIRE\' or \'CityGML\'!')
+                return
+            try:
+                bbox = None
+                if 'bbox' in query:
+                    bbox = [float(value) for value in query['bbox'][0].split(',')]
+                    if len(bbox) != 4:
+                        raise ValueError('bbox needs min x, min y, max x and max y')
+                building_filter = BuildingFilter.from_arguments(bbox=bbox, where=query.get('where'))
+                if 'uuid' in query:
+                    building_filter.uuids = {uuid for value in query['uuid'] for uuid in value.split(',') if uuid}
+                buildings = service.select(dataset, building_filter)
+            except ValueError as exception:
+                self.send_error(400, str(exception))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/gml+xml; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('X-Buildings', str(len(buildings)))
+            self.end_headers()
+            service.write(name, dataset, buildings, ResponseSink(self.wfile))
+
+    server = ThreadingHTTPServer((host, port), ExportRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(service, port, host='127.0.0.1'):
+    """
+    answer export requests over http until interrupted (see export_server)
+
+    :param service: ExportService instance
+    :param port: port to listen on
+    :param host: address to listen on
+    """
+    server = export_server(service, port, host)
+    print('Serving exports of {path} on http://{host}:{port}/'.format(path=service.source_path, host=host,
+                                                                    port=server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 
 if __name__ == '__main__':
 
     # parse command line arguments
     parser = argparse.ArgumentParser(description='Translate input CitiEnGov GML to a standard compliant GML')
+    parser.add_argument('--version', action='version', version='%(prog)s {v}'.format(v=__version__))
     origin = parser.add_mutually_exclusive_group()
     origin.add_argument('-u', '--url', help='set input mode to url', action='store_true')
     origin.add_argument('-f', '--file', help='set input mode to file', action='store_true')
-    parser.add_argument('input', help='path to the input CitiEnGov gml to be translated', type=str)
-    parser.add_argument('output', help='path where the output gml can be written', type=str)
-    parser.add_argument('standard', help='the standard to make the output compliant to', type=str,
-                        choices=['INSPIRE', 'CityGML'])
-    args = parser.parse_args()
+    parser.add_argument('-s', '--stream', help='parse the input incrementally instead of loading it at once '
+                                               '(the input has to be sorted by UUID)', action='store_true')
+    parser.add_argument('--page-size', help='in url mode fetch the WFS layer in pages of this many features '
+                                            '(startIndex/count)', type=int)
+    parser.add_argument('--page-workers', help='number of pages fetched at the same time (default: 4)', type=int,
+                        default=4)
+    parser.add_argument('--stream-output', help='write each building to the output as soon as it is translated',
+                        action='store_true')
+    parser.add_argument('--workers', help='number of processes translating the buildings (implies --stream-output)',
+                        type=int, default=1)
+    parser.add_argument('-t', '--target', help='additional standard and output path to translate to in the same run, '
+                                               'can be given multiple times', nargs=2, action='append', default=[],
+                        metavar=('STANDARD', 'OUTPUT'))
+    parser.add_argument('--cache', help='cache of the translated buildings, only the new and changed buildings are '
+                                        'translated (implies --stream-output)', type=str, metavar='PATH')
+    parser.add_argument('--quarantine', help='leave the buildings failing to translate out of the output, record them '
+                                             'in a json lines file and go on', type=str, metavar='PATH')
+    parser.add_argument('--checkpoint', help='save the progress of the export to this file from time to time '
+                                             '(implies --stream-output)', type=str, metavar='PATH')
+    parser.add_argument('--checkpoint-interval', help='number of buildings between the checkpoints (default: 1000)',
+                        type=int, default=1000)
+    parser.add_argument('--resume', help='continue an interrupted export from its --checkpoint', action='store_true')
+    parser.add_argument('--pipeline', help='read, parse (or group), translate and write at the same time in stages '
+                                           'linked by bounded queues (implies --stream-output)', action='store_true')
+    parser.add_argument('--queue-size', help='number of items the queues between the --pipeline stages hold '
+                                             '(default: 64)', type=int, default=64)
+    parser.add_argument('--profile-report', help='write the time and memory used by the stages of the export '
+                                                 'and the mappings to a json file', type=str, metavar='PATH')
+    parser.add_argument('--affine', help='affine transformation of the footprints: x\' = A*x + B*y + C, '
+                                         'y\' = D*x + E*y + F (needs numpy)', type=float, nargs=6,
+                        metavar=('A', 'B', 'C', 'D', 'E', 'F'))
+    parser.add_argument('--reproject', help='reproject the footprints from one crs to another, e.g. EPSG:3003 '
+                                            'EPSG:3035 (needs numpy and pyproj)', type=str, nargs=2,
+                        metavar=('SOURCE_CRS', 'TARGET_CRS'))
+    parser.add_argument('--precision', help='round the footprint coordinates to this many decimals (needs numpy)',
+                        type=int)
+    parser.add_argument('--footprints', help='write the bounding box and area of the footprints to a csv file '
+                                             '(needs numpy)', type=str, metavar='PATH')
+    parser.add_argument('--energy-aggregates', help='write the sum, mean and mean per floor area of the yearly energy '
+                                                    'values of the buildings to a csv file (needs numpy)', type=str,
+                        metavar='PATH')
+    sharding = parser.add_mutually_exclusive_group()
+    sharding.add_argument('--shard-tile', help='split the output into shards by a grid of tiles of this size '
+                                               '(in the units of the coordinates)', type=float,
+                          metavar='SIZE')
+    sharding.add_argument('--shard-count', help='split the output into shards of this many buildings', type=int,
+                          metavar='N')
+    sharding.add_argument('--shard-bytes', help='split the output into shards of at most this many bytes of '
+                                                'buildings', type=int, metavar='N')
+    parser.add_argument('--compression', help='compress the outputs (default: by the extension of the output, '
+                                              '.gz or .zst)', choices=['gzip', 'zstd'])
+    parser.add_argument('--compression-level', help='compression level (default: 6 for gzip, 3 for zstd)',
+                        type=int)
+    parser.add_argument('--buffer-size', help='size of the blocks written to the outputs in bytes (default: 1 MiB)',
+                        type=int, default=1 << 20)
+    parser.add_argument('--batch', help='run the jobs of a json manifest instead of a single input', type=str,
+                        metavar='MANIFEST')
+    parser.add_argument('--batch-workers', help='number of batch jobs run at the same time (default: 1)', type=int,
+                        default=1)
+    parser.add_argument('--batch-report', help='write the status and throughput of the batch jobs to a json file',
+                        type=str, metavar='PATH')
+    parser.add_argument('--bbox', help='export only the buildings whose footprint intersects this bounding box '
+                                       '(in the coordinates of the input)', type=float, nargs=4,
+                        metavar=('MIN_X', 'MIN_Y', 'MAX_X', 'MAX_Y'))
+    parser.add_argument('--where', help='export only the buildings with this value of an attribute, e.g. '
+                                        'USE_S=residenziale, can be given multiple times (the values of the same '
+                                        'attribute are alternatives)', action='append', metavar='FIELD=VALUE')
+    parser.add_argument('--uuids', help='export only the buildings listed in this file (one UUID per line)', type=str,
+                        metavar='PATH')
+    parser.add_argument('--snapshot', help='binary snapshot of the input grouped by building, loaded instead of parsing '
+                                           'the input while it is unchanged, (re)written otherwise (file input only)',
+                        type=str, metavar='PATH')
+    parser.add_argument('--xml-backend', help='parser of the input: lxml if it is installed (auto, default), lxml or '
+                                              'etree (the standard library), the output is the same', type=str,
+                        choices=XMLBackend.names, default='auto')
+    parser.add_argument('--serve', help='keep the input and the translators in memory and answer export requests '
+                                        'over http on this port (file input only)', type=int, metavar='PORT')
+    parser.add_argument('--host', help='address the --serve service listens on (default: 127.0.0.1)', type=str,
+                        default='127.0.0.1')
+    parser.add_argument('input', help='path to the input CitiEnGov gml to be translated', type=str, nargs='?')
+    parser.add_argument('output', help='path where the output gml can be written, - for the standard output',
+                        type=str, nargs='?')
+    parser.add_argument('standard', help='the standard to make the output compliant to', type=str, nargs='?',
+                        choices=list(STANDARDS))
+    # the positionals are optional for --batch and --serve, intermixed so that options can still go between them
+    args = parser.parse_intermixed_args()
+
+    if args.batch:
+        if args.input is not None or args.target:
+            parser.error('--batch runs the inputs and outputs of the manifest only')
+        batch_start = time.perf_counter()
+        batch_results = run_batch(read_batch(args.batch), workers=args.batch_workers, sink=OutputSink(
+            compression=args.compression, level=args.compression_level, buffer_size=args.buffer_size))
+        print_batch_report(batch_results, time.perf_counter() - batch_start)
+        if args.batch_report:
+            with open(args.batch_report, 'w') as report_file:
+                json.dump(batch_results, report_file, indent=2)
+        sys.exit(1 if any(result['status'] != 'ok' for result in batch_results) else 0)
+    if args.input is None:
+        parser.error('the input is required')
+    if args.snapshot and not args.file:
+        parser.error('--snapshot needs a file input')
+    try:
+        backend = XMLBackend(args.xml_backend)
+    except ValueError as exception:
+        parser.error(str(exception))
+    if args.serve is not None:
+        if args.url or args.output is not None or args.target:
+            parser.error('--serve needs a file input and no outputs')
+        serve(ExportService(args.input, stream=args.stream, snapshot_path=args.snapshot, backend=backend), args.serve,
+              host=args.host)
+        sys.exit(0)
+
+    # collect the standards to translate to with their output paths
+    targets = []
+    if args.output is not None:
+        if args.standard is None:
+            parser.error('the standard of the output is missing')
+        targets.append((args.standard, args.output))
+    targets += [tuple(target) for target in args.target]
+    if not targets:
+        parser.error('an output and standard or at least one --target is required')
+    for standard, output in targets:
+        if standard not in STANDARDS:
+            parser.error('Standard can be either \'INSPIRE\' or \'CityGML\'!')
+    if [output for standard, output in targets].count('-') > 1:
+        parser.error('only one output can be written to the standard output')
+    if args.compression == 'zstd' and optional_import('zstandard') is None:
+        parser.error('zstd compression needs the zstandard package')
+    sink = OutputSink(compression=args.compression, level=args.compression_level, buffer_size=args.buffer_size)
+    if any(output == '-' for standard, output in targets):
+        # keep the standard output clean for the document
+        sys.stdout = sys.stderr
 
     # prepare (read) CitiEnGov gml
     if args.url:
@@ -684,18 +3900,69 @@ if __name__ == '__main__':
         mode = 'file'
     else:
         raise ValueError('Input mode can be either \'url\' or \'file\'!')
-    CitiEG = CitiEnGov(gml_path=args.input, input_mode=mode)
-
-    # prepare standard to use
-    if args.standard == 'INSPIRE':
-        standard = Inspire()
-    elif args.standard == 'CityGML':
-        standard = CityGML()
-    else:
-        raise ValueError('Standard can be either \'INSPIRE\' or \'CityGML\'!')
-
-    # do the translation
-    standard.translate(citi_en_gov=CitiEG)
-
-    # write result out to file
-    standard.write_to_file(args.output)
+    building_filter = None
+    if args.bbox or args.where or args.uuids:
+        try:
+            building_filter = BuildingFilter.from_arguments(uuids_path=args.uuids, bbox=args.bbox, where=args.where)
+        except ValueError as exception:
+            parser.error(str(exception))
+    profiler = Profiler() if args.profile_report else None
+    pipeline = Pipeline(queue_size=args.queue_size) if args.pipeline else None
+    CitiEG = CitiEnGov(gml_path=args.input, input_mode=mode, stream=args.stream, profiler=profiler,
+                       page_size=args.page_size, page_workers=args.page_workers, building_filter=building_filter,
+                       pipeline=pipeline, snapshot_path=args.snapshot, backend=backend)
+
+    shards = None
+    if args.shard_tile:
+        shards = ('tile', args.shard_tile)
+    elif args.shard_count:
+        shards = ('count', args.shard_count)
+    elif args.shard_bytes:
+        shards = ('bytes', args.shard_bytes)
+    if shards is not None and any(output == '-' for standard, output in targets):
+        parser.error('sharded output cannot be written to the standard output')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume needs the --checkpoint of the interrupted export')
+    if args.checkpoint and shards is not None:
+        parser.error('sharded output cannot be checkpointed')
+    if args.checkpoint and any(output == '-' or sink.compression_of(output) for standard, output in targets):
+        parser.error('only uncompressed output files can be checkpointed')
+
+    # optional batched geometry processing of the footprints, the shards get their bounding box from it (from the
+    # footprints one by one without numpy)
+    buildings = CitiEG
+    if (args.affine or args.reproject or args.precision is not None or args.footprints
+            or (shards is not None and optional_import('numpy') is not None)):
+        if optional_import('numpy') is None:
+            parser.error('the geometry options need numpy')
+        transform = None
+        if args.reproject:
+            try:
+                from pyproj import Transformer
+            except ImportError:
+                parser.error('--reproject needs pyproj')
+            transform = Transformer.from_crs(args.reproject[0], args.reproject[1], always_xy=True).transform
+        geometry = GeometryStage(affine=args.affine, transform=transform, precision=args.precision,
+                                 profiler=profiler, tolerant=args.quarantine is not None)
+        buildings = geometry.apply(CitiEG, footprint_path=args.footprints)
+    if args.energy_aggregates:
+        if optional_import('numpy') is None:
+            parser.error('--energy-aggregates needs numpy')
+        buildings = EnergySeriesStage(profiler=profiler, tolerant=args.quarantine is not None).apply(
+            buildings, aggregate_path=args.energy_aggregates)
+
+    # do the translation and write the results out
+    delta_cache = DeltaCache(args.cache, partial=building_filter is not None) if args.cache else None
+    quarantine = Quarantine(args.quarantine, append=args.resume) if args.quarantine else None
+    checkpoint = Checkpoint(args.checkpoint, targets, interval=args.checkpoint_interval, resume=args.resume,
+                            quarantine=quarantine) if args.checkpoint else None
+    export(buildings, targets, stream_output=args.stream_output, workers=args.workers, profiler=profiler,
+           cache=delta_cache, shards=shards, sink=sink, quarantine=quarantine, checkpoint=checkpoint,
+           pipeline=pipeline)
+    if pipeline is not None:
+        pipeline.print_report()
+        if profiler is not None:
+            profiler.pipeline = pipeline.report()
+
+    if profiler is not None:
+        profiler.write(args.profile_report)
@@ -0,0 +1,63 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import citiengov_benchmark  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def citiengov_gml(tmp_path_factory):
+    """
+    small synthetic CitiEnGov gml, sorted by UUID
+    """
+    path = str(tmp_path_factory.mktemp('input') / 'citiengov.gml')
+    citiengov_benchmark.generate_citiengov(path, buildings=40, rows=2, vertices=5, seed=1)
+    return path
+
+
+@pytest.fixture(scope='session')
+def large_citiengov_gml(tmp_path_factory):
+    """
+    synthetic CitiEnGov gml of a few hundred buildings, more than a chunk of the workers and a batch of the stages
+    """
+    path = str(tmp_path_factory.mktemp('input') / 'citiengov.gml')
+    citiengov_benchmark.generate_citiengov(path, buildings=300, rows=3, vertices=6, seed=2)
+    return path
+
+
+def run_export(*arguments):
+    """
+    run the export script with the command line arguments
+
+    :return: the completed process, its output is captured
+    """
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'citiengov_export_gml.py')] + list(arguments),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, cwd=ROOT)
+
+
+def corrupt_footprint(source, target, number=0):
+    """
+    copy a CitiEnGov gml replacing the coordinates of a footprint with text that is not a number
+
+    :param number: index of the gml:coordinates element (of the features) to replace
+    """
+    with open(source, encoding='utf-8') as source_file:
+        parts = source_file.read().split('<gml:coordinates')
+    start = parts[number + 1].index('>') + 1
+    parts[number + 1] = parts[number + 1][:start] + 'garbage' + parts[number + 1][parts[number + 1].index('<'):]
+    with open(target, 'w', encoding='utf-8') as target_file:
+        target_file.write('<gml:coordinates'.join(parts))
+
+
+def read_document(path):
+    """
+    :return: the text of an output document without its time stamp
+    """
+    with open(path, encoding='utf-8') as document:
+        return re.sub(r' timeStamp="[^"]*"', '', document.read())
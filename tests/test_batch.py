@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from conftest import read_document, run_export
+
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_batch(citiengov_gml, tmp_path, workers):
+    good, missing = str(tmp_path / 'inspire.gml'), str(tmp_path / 'missing_inspire.gml')
+    citygml = str(tmp_path / 'citygml.gml')
+    manifest, report = str(tmp_path / 'manifest.json'), str(tmp_path / 'report.json')
+    with open(manifest, 'w') as manifest_file:
+        json.dump({'jobs': [
+            {'input': citiengov_gml, 'output': good, 'standard': 'INSPIRE', 'targets': [['CityGML', citygml]]},
+            {'input': str(tmp_path / 'missing.gml'), 'output': missing, 'standard': 'INSPIRE'}]}, manifest_file)
+
+    process = run_export('--batch', manifest, '--batch-workers', workers, '--batch-report', report)
+    assert process.returncode == 1, process.stderr
+    assert 'Batch finished: 1 jobs ok, 1 failed, 40 buildings' in process.stdout
+
+    with open(report) as report_file:
+        results = json.load(report_file)
+    assert [result['status'] for result in results] == ['ok', 'failed']
+    assert results[0]['input'] == citiengov_gml and results[0]['targets'] == [['INSPIRE', good],
+                                                                              ['CityGML', citygml]]
+    assert results[0]['buildings'] == 40 and 'error' not in results[0]
+    assert results[0]['output_bytes'] > 0 and results[0]['seconds'] >= 0
+    assert results[1]['buildings'] == 0 and results[1]['output_bytes'] == 0
+    assert 'missing.gml' in results[1]['error']
+
+    # the good job writes the same outputs as a single export
+    single_inspire, single_citygml = str(tmp_path / 'single_inspire.gml'), str(tmp_path / 'single_citygml.gml')
+    single = run_export('-f', citiengov_gml, single_inspire, 'INSPIRE', '-t', 'CityGML', single_citygml,
+                        '--stream-output')
+    assert single.returncode == 0, single.stderr
+    assert read_document(good) == read_document(single_inspire)
+    assert read_document(citygml) == read_document(single_citygml)
@@ -0,0 +1,10 @@
+import citiengov_benchmark
+
+
+def test_run_stages(citiengov_gml):
+    results = citiengov_benchmark.run_stages(citiengov_gml, 'CityGML', trace=True, backend='etree')
+    assert results['buildings'] == 40
+    for stage in citiengov_benchmark.STAGES:
+        assert results[stage]['seconds'] >= 0 and results[stage]['peak_bytes'] > 0
+    # parsing and grouping are measured apart
+    assert set(results) == set(citiengov_benchmark.STAGES) | {'buildings'}
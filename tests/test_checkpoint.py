@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+import citiengov_export_gml
+from conftest import read_document, run_export
+
+
+def interrupted(buildings, number):
+    for position, bu in enumerate(buildings):
+        if position == number:
+            raise KeyboardInterrupt
+        yield bu
+
+
+def test_resume_without_checkpoint(citiengov_gml, tmp_path):
+    # interrupted before the first checkpoint: the export starts again
+    expected, target = str(tmp_path / 'expected.gml'), str(tmp_path / 'inspire.gml')
+    assert run_export('-f', citiengov_gml, expected, 'INSPIRE', '--stream-output').returncode == 0
+    process = run_export('-f', citiengov_gml, target, 'INSPIRE', '--checkpoint', str(tmp_path / 'checkpoint.json'),
+                         '--resume')
+    assert process.returncode == 0 and 'No checkpoint to resume from' in process.stdout
+    assert read_document(target) == read_document(expected)
+    assert sorted(os.listdir(str(tmp_path))) == ['expected.gml', 'inspire.gml']
+
+
+def test_resume_keeps_quarantine_records_once(citiengov_gml, tmp_path):
+    # every third building gets a condition missing from the codelist and is quarantined
+    source = str(tmp_path / 'bad_condition.gml')
+    with open(citiengov_gml, encoding='utf-8') as input_file:
+        parts = input_file.read().split('>Functional<')
+    with open(source, 'w', encoding='utf-8') as input_file:
+        input_file.write(parts[0] + ''.join(('>Bogus<' if number % 6 < 2 else '>Functional<') + part
+                                            for number, part in enumerate(parts[1:])))
+    expected, target = str(tmp_path / 'expected.gml'), str(tmp_path / 'inspire.gml')
+    checkpoint_path, quarantine_path = str(tmp_path / 'checkpoint.json'), str(tmp_path / 'quarantine.jsonl')
+
+    citiengov_export_gml.export(citiengov_export_gml.CitiEnGov(source), [('INSPIRE', expected)], stream_output=True,
+                                quarantine=citiengov_export_gml.Quarantine(str(tmp_path / 'expected.jsonl')))
+
+    quarantine = citiengov_export_gml.Quarantine(quarantine_path)
+    checkpoint = citiengov_export_gml.Checkpoint(checkpoint_path, [('INSPIRE', target)], interval=7,
+                                                 quarantine=quarantine)
+    # interrupted after building 30, the last checkpoint is after building 27
+    with pytest.raises(KeyboardInterrupt):
+        citiengov_export_gml.export(interrupted(citiengov_export_gml.CitiEnGov(source), 31), [('INSPIRE', target)],
+                                    quarantine=quarantine, checkpoint=checkpoint)
+    quarantine.file.close()
+
+    quarantine = citiengov_export_gml.Quarantine(quarantine_path, append=True)
+    checkpoint = citiengov_export_gml.Checkpoint(checkpoint_path, [('INSPIRE', target)], interval=7, resume=True,
+                                                 quarantine=quarantine)
+    citiengov_export_gml.export(citiengov_export_gml.CitiEnGov(source), [('INSPIRE', target)], quarantine=quarantine,
+                                checkpoint=checkpoint)
+
+    assert read_document(target) == read_document(expected)
+    with open(quarantine_path) as records, open(str(tmp_path / 'expected.jsonl')) as expected_records:
+        records = records.readlines()
+        assert records == expected_records.readlines() and len(records) == 14
+    assert len(quarantine.buildings) == len(records)
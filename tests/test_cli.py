@@ -0,0 +1,18 @@
+from conftest import run_export
+
+
+def test_options_between_positionals(citiengov_gml, tmp_path):
+    output = str(tmp_path / 'out.gml')
+    process = run_export('-f', citiengov_gml, '-s', output, 'CityGML')
+    assert process.returncode == 0, process.stderr
+    process = run_export('-f', citiengov_gml, output, '--stream', 'INSPIRE')
+    assert process.returncode == 0, process.stderr
+
+
+def test_missing_positionals(citiengov_gml, tmp_path):
+    process = run_export('-f')
+    assert process.returncode == 2
+    assert 'the input is required' in process.stderr
+    process = run_export('-f', citiengov_gml, str(tmp_path / 'out.gml'))
+    assert process.returncode == 2
+    assert 'the standard of the output is missing' in process.stderr
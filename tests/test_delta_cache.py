@@ -0,0 +1,23 @@
+import re
+
+from conftest import run_export
+
+
+def statistics(process):
+    assert process.returncode == 0, process.stderr
+    return {name: int(number) for name, number in re.findall(r'(\w+): (\d+)', process.stdout.splitlines()[-1])}
+
+
+def test_filtered_run_keeps_unselected_buildings(citiengov_gml, tmp_path):
+    cache = str(tmp_path / 'cache.db')
+    output = str(tmp_path / 'out.gml')
+    first = statistics(run_export('-f', citiengov_gml, output, 'CityGML', '--cache', cache))
+    assert first['added'] == 40
+
+    filtered = statistics(run_export('-f', citiengov_gml, output, 'CityGML', '--cache', cache,
+                                     '--where', 'USE_S=school'))
+    assert 0 < filtered['unchanged'] < 40
+    assert filtered['removed'] == 0
+
+    again = statistics(run_export('-f', citiengov_gml, output, 'CityGML', '--cache', cache))
+    assert again == {'added': 0, 'changed': 0, 'unchanged': 40, 'removed': 0}
@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from conftest import run_export
+
+
+def blank(source_path, target_path, attribute, number):
+    """
+    copy a gml with the number-th element of a CitiEnGov attribute emptied
+    """
+    with open(source_path, encoding='utf-8') as source:
+        text = source.read()
+    elements = list(re.finditer(r'<CitiEnGov_01_1:{a}>[^<]*</CitiEnGov_01_1:{a}>'.format(a=attribute), text))
+    element = elements[number]
+    with open(target_path, 'w', encoding='utf-8') as target:
+        target.write(text[:element.start()] + '<CitiEnGov_01_1:{a}/>'.format(a=attribute) + text[element.end():])
+
+
+def test_empty_value_is_written_as_none(citiengov_gml, tmp_path):
+    gml = str(tmp_path / 'empty_value.gml')
+    blank(citiengov_gml, gml, 'CONSUMONORM_VALORE_E', 3)
+    process = run_export('-f', gml, str(tmp_path / 'out.gml'), 'CityGML')
+    assert process.returncode == 0, process.stderr
+    with open(str(tmp_path / 'out.gml'), encoding='utf-8') as output:
+        plain = output.read()
+    assert re.search(r'<energy:values uom="[^"]*">[^<]*None', plain)
+
+    pytest.importorskip('numpy')
+    process = run_export('-f', gml, str(tmp_path / 'batched.gml'), 'CityGML', '--energy-aggregates',
+                         str(tmp_path / 'aggregates.csv'))
+    assert process.returncode == 0, process.stderr
+    with open(str(tmp_path / 'batched.gml'), encoding='utf-8') as output:
+        assert output.read() == plain
+
+
+def test_energy_series_stage_failures_are_quarantined(citiengov_gml, tmp_path):
+    pytest.importorskip('numpy')
+    gml = str(tmp_path / 'empty_year.gml')
+    blank(citiengov_gml, gml, 'ENERGYAMOUNT_E_YEAR_ONLY_E', 5)
+    process = run_export('-f', gml, str(tmp_path / 'out.gml'), 'CityGML', '--energy-aggregates',
+                         str(tmp_path / 'aggregates.csv'), '--quarantine', str(tmp_path / 'quarantine.jsonl'))
+    assert process.returncode == 0, process.stderr
+    assert 'Buildings quarantined: 1' in process.stdout
+
+
+def test_irregular_years(large_citiengov_gml, tmp_path):
+    pytest.importorskip('numpy')
+    # three electricity rows per building: unsorted, repeated, with a gap, repeated with a gap (which still passes the
+    # check of the number of years)
+    with open(large_citiengov_gml, encoding='utf-8') as source:
+        text = source.read()
+    pattern = re.compile(r'(<CitiEnGov_01_1:ENERGYAMOUNT_E_YEAR_ONLY_E>)(\d+)<')
+    years = [int(match.group(2)) for match in pattern.finditer(text)]
+    first = years[::3]
+    irregular = [first[0] + 2, first[0], first[0] + 1, first[1], first[1], first[1] + 1,
+                 first[2], first[2] + 2, first[2] + 3, first[3], first[3], first[3] + 2]
+    replacements = iter(irregular + years[len(irregular):])
+    gml = str(tmp_path / 'irregular.gml')
+    with open(gml, 'w', encoding='utf-8') as target:
+        target.write(pattern.sub(lambda match: '{t}{y}<'.format(t=match.group(1), y=next(replacements)), text))
+
+    outputs = {}
+    for name, arguments in (('default', []), ('aggregates', ['--energy-aggregates', str(tmp_path / 'aggregates.csv')])):
+        output, quarantine = str(tmp_path / (name + '.gml')), str(tmp_path / (name + '.jsonl'))
+        process = run_export('-f', gml, output, 'CityGML', '--quarantine', quarantine, *arguments)
+        assert process.returncode == 0, process.stderr
+        with open(output, encoding='utf-8') as document, open(quarantine) as records:
+            outputs[name] = (re.findall(r'<energy:values[^>]*>[^<]*<', document.read()), records.read())
+    assert outputs['aggregates'] == outputs['default']
+    # the gappy and the repeated series fail to translate
+    assert outputs['default'][1].count('"CityGML"') == 2
+
+    with open(str(tmp_path / 'aggregates.csv')) as aggregates:
+        rows = [line.split(',') for line in aggregates.read().splitlines()[1:] if ',electricity,' in line]
+    assert [(row[3], row[4], row[5]) for row in rows[:4]] == [
+        (str(first[0]), str(first[0] + 2), '3'), (str(first[1]), str(first[1] + 1), '3'),
+        (str(first[2]), str(first[2] + 3), '3'), (str(first[3]), str(first[3] + 2), '3')]
@@ -0,0 +1,27 @@
+import pytest
+
+from conftest import corrupt_footprint, run_export
+
+MEMBER = '<core:cityObjectMember>'
+
+
+def members(source, target, *arguments):
+    process = run_export('-f', source, target, 'CityGML', *arguments)
+    assert process.returncode == 0, process.stderr
+    with open(target, encoding='utf-8') as document:
+        return document.read().count(MEMBER)
+
+
+@pytest.mark.parametrize('mode', [[], ['-s']], ids=['tree', 'stream'])
+def test_unparseable_footprint(citiengov_gml, tmp_path, mode):
+    # the first building has a footprint that cannot be parsed
+    source = str(tmp_path / 'garbage.gml')
+    corrupt_footprint(citiengov_gml, source)
+    target = str(tmp_path / 'citygml.gml')
+
+    # only the bounding box selections leave it out
+    for where in ('USE_S=residenziale', 'USE_S=school'):
+        assert (members(source, target, '--where', where, *mode)
+                == members(citiengov_gml, target, '--where', where, *mode))
+    everywhere = ['--bbox', '0', '0', '1e8', '1e8']
+    assert members(source, target, *everywhere, *mode) == members(citiengov_gml, target, *everywhere, *mode) - 1
@@ -0,0 +1,52 @@
+import csv
+import re
+
+import pytest
+
+from conftest import run_export
+
+COORDINATES = re.compile(r'<gml:coordinates[^>]*>[^<]*</gml:coordinates>')
+# rectangle of 4 by 3 from (0.5, 0), area 12
+RING = [(0.5, 0.0), (4.5, 0.0), (4.5, 3.0), (0.5, 3.0), (0.5, 0.0)]
+
+
+def coordinates(ring, decimal, cs, ts):
+    return ts.join(cs.join(repr(value).replace('.', decimal) for value in point) for point in ring)
+
+
+@pytest.mark.parametrize('decimal, cs, ts', [('.', ',', ' '), (',', ';', '|')], ids=['default', 'comma-decimal'])
+def test_precision_affine_footprints(citiengov_gml, tmp_path, decimal, cs, ts):
+    pytest.importorskip('numpy')
+    with open(citiengov_gml, encoding='utf-8') as source_file:
+        document = source_file.read()
+    if (decimal, cs, ts) == ('.', ',', ' '):
+        # the default convention when the attributes are left out
+        element = '<gml:coordinates>{c}</gml:coordinates>'
+    else:
+        element = '<gml:coordinates decimal="{d}" cs="{cs}" ts="{ts}">{{c}}</gml:coordinates>'.format(
+            d=decimal, cs=cs, ts=ts)
+    source = str(tmp_path / 'rectangle.gml')
+    with open(source, 'w', encoding='utf-8') as source_file:
+        source_file.write(COORDINATES.sub(element.format(c=coordinates(RING, decimal, cs, ts)), document, count=1))
+    target, footprints = str(tmp_path / 'citygml.gml'), str(tmp_path / 'footprints.csv')
+
+    # x' = 2 * x + 10, y' = y - 1
+    process = run_export('-f', source, target, 'CityGML', '--affine', '2', '0', '10', '0', '1', '-1',
+                         '--precision', '2', '--footprints', footprints)
+    assert process.returncode == 0, process.stderr
+
+    with open(target, encoding='utf-8') as output:
+        written = COORDINATES.findall(output.read())
+    transformed = [('{x:.2f}'.format(x=2 * x + 10), '{y:.2f}'.format(y=y - 1)) for x, y in RING]
+    assert written[0] == element.format(c=ts.join(cs.join(value.replace('.', decimal) for value in point)
+                                                  for point in transformed))
+    # the other footprints are only rounded
+    assert re.fullmatch(r'<gml:coordinates decimal="\." cs="," ts=" ">'
+                        r'(-?\d+\.\d\d,-?\d+\.\d\d ?)+</gml:coordinates>', written[1])
+
+    with open(footprints, newline='') as footprints_file:
+        rows = list(csv.DictReader(footprints_file))
+    assert len(rows) == 40
+    bbox = [float(rows[0][column]) for column in ('MIN_X', 'MIN_Y', 'MAX_X', 'MAX_Y')]
+    assert bbox == [11.0, -1.0, 19.0, 2.0]
+    assert float(rows[0]['AREA']) == pytest.approx(24.0)
@@ -0,0 +1,48 @@
+import traceback
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+import citiengov_export_gml
+
+
+def test_broken_mapping_traceback(citiengov_gml, tmp_path):
+    # a condition missing from the codelist of INSPIRE
+    source = str(tmp_path / 'bad_condition.gml')
+    with open(citiengov_gml, encoding='utf-8') as input_file:
+        document = input_file.read()
+    with open(source, 'w', encoding='utf-8') as input_file:
+        input_file.write(document.replace('>Functional<', '>Bogus<'))
+    bu = next(iter(citiengov_export_gml.CitiEnGov(source)))
+    inspire = citiengov_export_gml.Inspire()
+    with pytest.raises(KeyError) as error:
+        inspire.translate_building(bu)
+    frame = traceback.extract_tb(error.value.__traceback__)[-1]
+    assert frame.filename == '<mapping INSPIRE.building>'
+    assert 'condition_of_construction_dict[' in frame.line
+
+    # the mappings profiled one by one are compiled under their own names
+    name = inspire.failed_mapping(bu)
+    with pytest.raises(KeyError) as error:
+        dict(inspire.mappings)[name](bu, ElementTree.Element('building'))
+    frame = traceback.extract_tb(error.value.__traceback__)[-1]
+    assert frame.filename == '<mapping INSPIRE.{name}>'.format(name=name)
+    assert 'condition_of_construction_dict[' in frame.line
+
+
+@pytest.mark.parametrize('name', sorted(citiengov_export_gml.STANDARDS))
+def test_vocabulary(citiengov_gml, name):
+    standard = citiengov_export_gml.STANDARDS[name]()
+    # the tags of the mapping table are resolved in advance with the vocabulary
+    assert standard.table_tags <= set(standard.vocabulary)
+    standard.build_building
+    assert set(standard.vocabulary) <= set(standard.nss.tags)
+
+    # every namespace of the translated members (the methods of the translator included) is declared on the root
+    # of a streamed document
+    declared = {standard.nss.dict[prefix] for prefix in standard.document_prefixes}
+    used = set()
+    for bu in citiengov_export_gml.CitiEnGov(citiengov_gml):
+        for element in standard.translate_building(bu).iter():
+            used.update(tag[1:].partition('}')[0] for tag in [element.tag] + list(element.attrib) if '}' in tag)
+    assert used <= declared
@@ -0,0 +1,43 @@
+import os
+import re
+
+from conftest import run_export
+
+GMD_DECLARATION = ' xmlns:gmd="http://www.isotc211.org/2005/gmd"'
+
+
+def without_time_stamp(document):
+    return re.sub(r' timeStamp="[^"]*"', '', document)
+
+
+def test_stream_output_declares_the_unused_namespaces(citiengov_gml, tmp_path):
+    # without external references INSPIRE uses no gmd element
+    source = str(tmp_path / 'no_references.gml')
+    with open(citiengov_gml, encoding='utf-8') as input_file:
+        document = input_file.read()
+    with open(source, 'w', encoding='utf-8') as input_file:
+        input_file.write(re.sub(r'<CitiEnGov_01_1:EXT_REF_REFERENCE>[^<]*</CitiEnGov_01_1:EXT_REF_REFERENCE>', '',
+                                document))
+    tree, stream = str(tmp_path / 'tree.gml'), str(tmp_path / 'stream.gml')
+    assert run_export('-f', source, tree, 'INSPIRE').returncode == 0
+    assert run_export('-f', source, stream, 'INSPIRE', '--stream-output').returncode == 0
+    with open(tree, encoding='utf-8') as tree_file, open(stream, encoding='utf-8') as stream_file:
+        tree_document, stream_document = without_time_stamp(tree_file.read()), without_time_stamp(stream_file.read())
+    assert 'gmd:' not in tree_document and GMD_DECLARATION in stream_document
+    assert stream_document.replace(GMD_DECLARATION, '', 1) == tree_document
+
+
+def test_failed_stream_export_leaves_no_output(citiengov_gml, tmp_path):
+    # the first feature is moved to the end, the features of its building are no longer consecutive
+    source = str(tmp_path / 'unsorted.gml')
+    with open(citiengov_gml, encoding='utf-8') as input_file:
+        head, first, *rest = input_file.read().split('<gml:featureMember>')
+    last, end = rest[-1].rsplit('</gml:featureMember>', 1)
+    rest[-1] = last + '</gml:featureMember>'
+    with open(source, 'w', encoding='utf-8') as input_file:
+        input_file.write('<gml:featureMember>'.join([head] + rest + [first.rsplit('</gml:featureMember>', 1)[0]])
+                         + '</gml:featureMember>' + end)
+    target = str(tmp_path / 'inspire.gml')
+    process = run_export('-f', source, target, 'INSPIRE', '--stream', '--stream-output')
+    assert process.returncode != 0 and 'are not consecutive' in process.stderr
+    assert os.listdir(str(tmp_path)) == ['unsorted.gml']
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+import citiengov_export_gml
+from conftest import read_document, run_export
+
+
+@pytest.mark.parametrize('arguments', [[], ['-s'], ['--workers', '2'], ['-s', '--workers', '2']],
+                         ids=['tree', 'stream', 'workers', 'stream-workers'])
+def test_pipeline_output_identical(citiengov_gml, tmp_path, arguments):
+    outputs = {}
+    for name, mode in (('stream_output', ['--stream-output']), ('pipeline', ['--pipeline', '--queue-size', '2'])):
+        inspire, citygml = str(tmp_path / (name + '_inspire.gml')), str(tmp_path / (name + '_citygml.gml'))
+        process = run_export('-f', citiengov_gml, inspire, 'INSPIRE', '-t', 'CityGML', citygml, *mode, *arguments)
+        assert process.returncode == 0, process.stderr
+        outputs[name] = [read_document(inspire), read_document(citygml)]
+    assert outputs['pipeline'] == outputs['stream_output']
+
+
+def finishes(function, timeout=30):
+    # run the function in a thread, a hanging pipeline fails the test instead of blocking it
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = function()
+        except Exception as exception:
+            outcome['exception'] = exception
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'the pipeline hangs'
+    return outcome
+
+
+def test_stage_exception_propagates(citiengov_gml, tmp_path):
+    def failing(buildings):
+        for number, bu in enumerate(buildings):
+            if number == 5:
+                raise RuntimeError('input lost')
+            yield bu
+
+    pipeline = citiengov_export_gml.Pipeline(queue_size=2)
+    buildings = citiengov_export_gml.CitiEnGov(citiengov_gml, stream=True, pipeline=pipeline)
+    target = tmp_path / 'inspire.gml'
+    outcome = finishes(lambda: citiengov_export_gml.export(
+        pipeline.stage('failing', failing(buildings)), [('INSPIRE', str(target))], pipeline=pipeline))
+    assert isinstance(outcome.get('exception'), RuntimeError)
+    # the output of the failed export is dropped
+    assert not target.exists()
+
+
+def test_consumer_exception_stops_stages():
+    pipeline = citiengov_export_gml.Pipeline(queue_size=2)
+    produced = pipeline.stage('produce', iter(range(1000)))
+    doubled = pipeline.stage('double', (number * 2 for number in produced))
+
+    def consume():
+        for number in pipeline.drain('consume', doubled):
+            if number == 10:
+                raise RuntimeError('output lost')
+
+    assert isinstance(finishes(consume).get('exception'), RuntimeError)
+    # the stages waiting on their full queues give up
+    for thread in threading.enumerate():
+        if thread.name in ('produce', 'double'):
+            thread.join(5)
+            assert not thread.is_alive()
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import citiengov_export_gml
+from conftest import corrupt_footprint, run_export
+
+
+def read_records(path):
+    with open(path) as records:
+        return [json.loads(line) for line in records]
+
+
+@pytest.mark.parametrize('arguments', [['--shard-count', '5'], ['--precision', '2', '--workers', '2']],
+                         ids=['shards', 'workers'])
+def test_geometry_stage_failure_is_quarantined(citiengov_gml, tmp_path, arguments):
+    pytest.importorskip('numpy')
+    source = str(tmp_path / 'garbage.gml')
+    corrupt_footprint(citiengov_gml, source)
+    quarantine = str(tmp_path / 'quarantine.jsonl')
+    target = str(tmp_path / 'citygml.gml')
+
+    failed = run_export('-f', source, target, 'CityGML', *arguments)
+    assert failed.returncode != 0 and 'could not convert string to float' in failed.stderr
+
+    process = run_export('-f', source, target, 'CityGML', '-t', 'INSPIRE', str(tmp_path / 'inspire.gml'),
+                         '--quarantine', quarantine, *arguments)
+    assert process.returncode == 0, process.stderr
+    records = read_records(quarantine)
+    assert [(record['standard'], record['mapping'], record['exception']) for record in records] == [
+        ('CityGML', 'geometry stage', 'ValueError'), ('INSPIRE', 'geometry stage', 'ValueError')]
+    assert 'Buildings quarantined: 1' in process.stdout
+
+
+def test_quarantine_closed_when_export_fails(citiengov_gml, tmp_path):
+    source = str(tmp_path / 'bad_condition.gml')
+    with open(citiengov_gml, encoding='utf-8') as input_file:
+        document = input_file.read()
+    with open(source, 'w', encoding='utf-8') as input_file:
+        input_file.write(document.replace('>Functional<', '>Bogus<', 2))
+
+    def failing(buildings):
+        for number, bu in enumerate(buildings):
+            if number == 3:
+                raise RuntimeError('input lost')
+            yield bu
+
+    quarantine = citiengov_export_gml.Quarantine(str(tmp_path / 'quarantine.jsonl'))
+    with pytest.raises(RuntimeError):
+        citiengov_export_gml.export(failing(citiengov_export_gml.CitiEnGov(source)),
+                                    [('INSPIRE', str(tmp_path / 'inspire.gml'))], stream_output=True,
+                                    quarantine=quarantine)
+    assert quarantine.file.closed
+    assert [record['mapping'] for record in read_records(str(tmp_path / 'quarantine.jsonl'))] == [
+        'CONDITION_OF_CONSTRUCTION']
@@ -0,0 +1,82 @@
+import os
+import re
+import shutil
+import threading
+from urllib import error, parse, request
+
+import pytest
+
+import citiengov_export_gml
+from conftest import read_document, run_export
+
+MEMBER = '<core:cityObjectMember>'
+
+
+@pytest.fixture
+def service(citiengov_gml, tmp_path):
+    source = str(tmp_path / 'citiengov.gml')
+    shutil.copy(citiengov_gml, source)
+    export_service = citiengov_export_gml.ExportService(source)
+    server = citiengov_export_gml.export_server(export_service, 0)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    export_service.url = 'http://127.0.0.1:{port}/'.format(port=server.server_port)
+    yield export_service
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def get(service, path, **query):
+    url = service.url + path + ('?' + parse.urlencode(query, doseq=True) if query else '')
+    with request.urlopen(url, timeout=30) as response:
+        return response.read().decode('utf-8')
+
+
+def exported(service, tmp_path, *arguments):
+    target = str(tmp_path / 'citygml.gml')
+    process = run_export('-f', service.source_path, target, 'CityGML', '--stream-output', *arguments)
+    assert process.returncode == 0, process.stderr
+    return read_document(target)
+
+
+def test_queries(service, tmp_path):
+    with open(service.source_path, encoding='utf-8') as source:
+        uuids = re.findall(r'<CitiEnGov_01_1:UUID>([^<]*)<', source.read())
+    selected = sorted(set(uuids))[3:6]
+    with open(str(tmp_path / 'uuids.txt'), 'w') as uuids_file:
+        uuids_file.write('\n'.join(selected))
+    bbox = ['1700700', '4961380', '1700800', '4961450']
+
+    full = get(service, 'CityGML')
+    assert full.count(MEMBER) == 40
+    for document, arguments in (
+            (full, []),
+            (get(service, 'CityGML', uuid=[selected[0], ','.join(selected[1:])]),
+             ['--uuids', str(tmp_path / 'uuids.txt')]),
+            (get(service, 'CityGML', bbox=','.join(bbox)), ['--bbox'] + bbox),
+            (get(service, 'CityGML', where=['USE_S=residenziale']), ['--where', 'USE_S=residenziale'])):
+        assert re.sub(r' timeStamp="[^"]*"', '', document) == exported(service, tmp_path, *arguments)
+        assert 0 < document.count(MEMBER) <= 40
+
+    assert '"buildings": 40' in get(service, 'status')
+
+
+@pytest.mark.parametrize('query', [{'bbox': '1,2,3'}, {'bbox': '1,2,x,4'}, {'where': 'USE_S'},
+                                   {'where': 'NAME=EDIFICIO 0'}])
+def test_malformed_query(service, query):
+    with pytest.raises(error.HTTPError) as response:
+        get(service, 'CityGML', **query)
+    assert response.value.code == 400
+
+
+def test_reload(service):
+    assert '>EDIFICIO ZERO<' not in get(service, 'CityGML')
+    with open(service.source_path, encoding='utf-8') as source:
+        document = source.read()
+    with open(service.source_path, 'w', encoding='utf-8') as source:
+        source.write(document.replace('>EDIFICIO 0<', '>EDIFICIO ZERO<'))
+    # the modification time changes even if the file system has a coarse clock
+    mtime = os.stat(service.source_path).st_mtime_ns
+    os.utime(service.source_path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert '>EDIFICIO ZERO<' in get(service, 'CityGML')
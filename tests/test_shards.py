@@ -0,0 +1,30 @@
+import json
+import os
+
+import pytest
+
+import citiengov_export_gml
+
+
+def shard_export(source, target, shards, geometry=False):
+    buildings = citiengov_export_gml.CitiEnGov(source)
+    if geometry:
+        buildings = citiengov_export_gml.GeometryStage().apply(buildings)
+    citiengov_export_gml.export(buildings, [('CityGML', target)], shards=shards)
+    with open(os.path.splitext(target)[0] + '.shards.json') as manifest_file:
+        return json.load(manifest_file)['shards']
+
+
+@pytest.mark.parametrize('shards', [('count', 15), ('bytes', 20000), ('tile', 2000.0)])
+def test_shards_bounded_without_geometry_stage(citiengov_gml, tmp_path, shards):
+    # the bounding boxes come from the footprints when the GeometryStage (numpy) does not run
+    manifest = shard_export(citiengov_gml, str(tmp_path / 'citygml.gml'), shards)
+    assert len(manifest) > 1
+    for shard in manifest:
+        assert shard['bbox'] is not None and shard['path'] != 'citygml_untiled.gml'
+        with open(str(tmp_path / shard['path']), encoding='utf-8') as shard_file:
+            assert '<gml:boundedBy><gml:Envelope' in shard_file.read()
+
+    pytest.importorskip('numpy')
+    (tmp_path / 'geometry').mkdir()
+    assert shard_export(citiengov_gml, str(tmp_path / 'geometry' / 'citygml.gml'), shards, geometry=True) == manifest
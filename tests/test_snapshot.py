@@ -0,0 +1,37 @@
+import shutil
+
+import pytest
+
+from conftest import read_document, run_export
+
+
+def export(source, target, *arguments):
+    process = run_export('-f', source, target, 'CityGML', '-t', 'INSPIRE', target + '.inspire', *arguments)
+    assert process.returncode == 0, process.stderr
+    return process.stdout, [read_document(target), read_document(target + '.inspire')]
+
+
+@pytest.mark.parametrize('mode', [[], ['-s']], ids=['tree', 'stream'])
+def test_snapshot(citiengov_gml, tmp_path, mode):
+    source = str(tmp_path / 'citiengov.gml')
+    shutil.copy(citiengov_gml, source)
+    snapshot = str(tmp_path / 'citiengov.snapshot')
+    target = str(tmp_path / 'citygml.gml')
+    stdout, parsed = export(source, target, *mode)
+
+    stdout, written = export(source, target, '--snapshot', snapshot, *mode)
+    assert 'Snapshot missing or out of date, writing it' in stdout and written == parsed
+    stdout, loaded = export(source, target, '--snapshot', snapshot, *mode)
+    assert 'Loading snapshot of' in stdout and loaded == parsed
+
+    # the input changes: the snapshot is written again from it
+    with open(source, encoding='utf-8') as source_file:
+        document = source_file.read()
+    with open(source, 'w', encoding='utf-8') as source_file:
+        source_file.write(document.replace('>EDIFICIO 0<', '>EDIFICIO ZERO<'))
+    stdout, parsed = export(source, target, *mode)
+    assert 'EDIFICIO ZERO' in parsed[0]
+    stdout, rewritten = export(source, target, '--snapshot', snapshot, *mode)
+    assert 'Snapshot missing or out of date, writing it' in stdout and rewritten == parsed
+    stdout, loaded = export(source, target, '--snapshot', snapshot, *mode)
+    assert 'Loading snapshot of' in stdout and loaded == parsed
@@ -0,0 +1,36 @@
+from conftest import read_document, run_export
+
+FEATURE_MEMBER = '<gml:featureMember>'
+
+
+def export(source, tmp_path, *arguments):
+    inspire, citygml = str(tmp_path / 'inspire.gml'), str(tmp_path / 'citygml.gml')
+    process = run_export('-f', source, inspire, 'INSPIRE', '-t', 'CityGML', citygml, *arguments)
+    return process, (read_document(inspire), read_document(citygml)) if process.returncode == 0 else None
+
+
+def test_stream_output_identical(large_citiengov_gml, tmp_path):
+    tree_process, tree = export(large_citiengov_gml, tmp_path)
+    assert tree_process.returncode == 0, tree_process.stderr
+    stream_process, stream = export(large_citiengov_gml, tmp_path, '-s')
+    assert stream_process.returncode == 0, stream_process.stderr
+    assert stream == tree
+
+
+def test_stream_features_not_consecutive(citiengov_gml, tmp_path):
+    # the first feature of the first building goes to the end, after the features of the other buildings
+    with open(citiengov_gml, encoding='utf-8') as source_file:
+        head, first, *members = source_file.read().split(FEATURE_MEMBER)
+    members[-1], end = members[-1].rsplit('</gml:featureMember>', 1)
+    members[-1] += '</gml:featureMember>'
+    source = str(tmp_path / 'shuffled.gml')
+    with open(source, 'w', encoding='utf-8') as source_file:
+        source_file.write(FEATURE_MEMBER.join([head] + members + [first]) + end)
+
+    process, outputs = export(source, tmp_path, '-s')
+    assert process.returncode != 0
+    assert 'Features of building {00000000-' in process.stderr and 'are not consecutive' in process.stderr
+    # the tree mode groups the features wherever they are
+    process, outputs = export(source, tmp_path)
+    assert process.returncode == 0, process.stderr
+    assert outputs == export(citiengov_gml, tmp_path)[1]
@@ -0,0 +1,83 @@
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+import pytest
+
+import citiengov_export_gml
+
+FEATURE_MEMBER = '<gml:featureMember>'
+
+
+class WFSServer(ThreadingHTTPServer):
+    def __init__(self, source_path, compress):
+        """
+        stand-in of a WFS answering GetFeature requests with the feature members of a CitiEnGov gml from startIndex,
+        count at a time
+
+        :param source_path: path of the CitiEnGov gml
+        :param compress: gzip the responses of the clients asking for it
+        """
+        super().__init__(('127.0.0.1', 0), WFSHandler)
+        with open(source_path, encoding='utf-8') as source:
+            head, *members = source.read().split(FEATURE_MEMBER)
+        members[-1], self.end = members[-1].rsplit('</gml:featureMember>', 1)
+        members[-1] += '</gml:featureMember>'
+        self.head = head
+        self.members = [FEATURE_MEMBER + member for member in members]
+        self.compress = compress
+        # (startIndex, count) of the requests
+        self.requests = []
+
+
+class WFSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body go out in one write, a kept alive connection does not wait on a delayed ack
+    wbufsize = 1 << 16
+
+    def do_GET(self):
+        query = dict(parse.parse_qsl(parse.urlsplit(self.path).query))
+        start, count = int(query['startIndex']), int(query['count'])
+        self.server.requests.append((start, count))
+        body = (self.server.head + ''.join(self.server.members[start:start + count]) + self.server.end).encode('utf-8')
+        self.send_response(200)
+        if self.server.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(params=[False, True], ids=['identity', 'gzip'])
+def wfs(request, citiengov_gml):
+    server = WFSServer(citiengov_gml, compress=request.param)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('page_size', [1, 7, 8, 80])
+@pytest.mark.parametrize('stream', [False, True], ids=['tree', 'stream'])
+def test_pages(wfs, citiengov_gml, page_size, stream):
+    # 80 features: pages of 1 and 8 end with an empty page, the last page of 7 is partial
+    url = 'http://127.0.0.1:{port}/wfs?service=WFS&request=GetFeature&count=1000'.format(port=wfs.server_port)
+    buildings = citiengov_export_gml.CitiEnGov(url, input_mode='url', stream=stream, page_size=page_size,
+                                               page_workers=3)
+    expected = citiengov_export_gml.CitiEnGov(citiengov_gml, stream=stream)
+    assert ([(bu.UUID, bu.to_bytes()) for bu in buildings]
+            == [(bu.UUID, bu.to_bytes()) for bu in expected])
+
+    pages = -(-len(wfs.members) // page_size)
+    if len(wfs.members) % page_size == 0:
+        # the paging stops at the first page that is not full
+        pages += 1
+    assert sorted(wfs.requests)[:pages] == [(page * page_size, page_size) for page in range(pages)]
+    # at most the pages already in flight are fetched beyond the last one
+    assert len(wfs.requests) < pages + 3
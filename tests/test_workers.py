@@ -0,0 +1,17 @@
+import re
+
+from conftest import read_document, run_export
+
+
+def test_workers_output_identical(large_citiengov_gml, tmp_path):
+    outputs = {}
+    for name, arguments in (('serial', ['--stream-output']), ('workers', ['--workers', '2'])):
+        inspire, citygml = str(tmp_path / (name + '_inspire.gml')), str(tmp_path / (name + '_citygml.gml'))
+        process = run_export('-f', large_citiengov_gml, inspire, 'INSPIRE', '-t', 'CityGML', citygml, *arguments)
+        assert process.returncode == 0, process.stderr
+        outputs[name] = [read_document(inspire), read_document(citygml)]
+    assert outputs['workers'] == outputs['serial']
+
+    # the members come in the order of the input (the chunks of the workers are put back in order)
+    local_ids = re.findall(r'<base:localId>([^<]*)</base:localId>', outputs['workers'][0])
+    assert len(local_ids) == 300 and local_ids == sorted(local_ids, key=int)
@@ -0,0 +1,16 @@
+import pytest
+
+from conftest import read_document, run_export
+
+
+@pytest.mark.parametrize('mode', [[], ['-s']], ids=['tree', 'stream'])
+def test_backends_output_identical(citiengov_gml, tmp_path, mode):
+    pytest.importorskip('lxml')
+    outputs = {}
+    for backend in ('lxml', 'etree'):
+        inspire, citygml = str(tmp_path / (backend + '_inspire.gml')), str(tmp_path / (backend + '_citygml.gml'))
+        process = run_export('-f', citiengov_gml, inspire, 'INSPIRE', '-t', 'CityGML', citygml,
+                             '--xml-backend', backend, *mode)
+        assert process.returncode == 0, process.stderr
+        outputs[backend] = [read_document(inspire), read_document(citygml)]
+    assert outputs['lxml'] == outputs['etree']